@@ -0,0 +1,327 @@
+"""
+Колоночный кэш истории действий на NumPy для отчётов за длинные периоды
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Строк за одно чтение из SQLite при дозагрузке
+LOAD_CHUNK = 200000
+
+# Больше новых действий к отчёту из кэша не дочитывается: при таком отставании отчёт идёт по БД
+TAIL_LIMIT = LOAD_CHUNK
+
+# Колонки кэша: имя -> тип. Время - секунды от эпохи по московским часам без пояса,
+# измерения - id из dimension_values (0 - None), пользователь - код из словаря users.
+COLUMNS = {
+    'ts': np.int64,
+    'user': np.int32,
+    'number': np.int32,
+    'question': np.int32,
+}
+
+# user_id NULL при чтении из SQLite; в колонке user ему соответствует код 0
+NO_USER = -1
+
+# meta.json пустого кэша; last_row - время и пользователь строки last_id для сверки с БД
+EMPTY_META = {'rows': 0, 'last_id': 0, 'sorted': True, 'users': 0, 'last_row': None}
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def epoch_seconds(moment: datetime) -> int:
+    """Секунды от эпохи для наивного времени по МСК, как strftime('%s') в SQLite"""
+    return (moment.toordinal() - EPOCH_ORDINAL) * 86400 + moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def day_counts(ts: np.ndarray) -> Dict[str, int]:
+    """Число действий по дням для колонки ts"""
+    counts: Dict[str, int] = {}
+    if len(ts):
+        days = ts // 86400
+        first_day = int(days.min())
+        for offset in np.flatnonzero(histogram := np.bincount(days - first_day)):
+            day = date.fromordinal(EPOCH_ORDINAL + first_day + int(offset)).strftime('%Y-%m-%d')
+            counts[day] = int(histogram[offset])
+    return counts
+
+
+def add_counts(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Сумма счётчиков bincount разной длины"""
+    if len(left) < len(right):
+        left, right = right, left
+    result = left.copy()
+    result[:len(right)] += right
+    return result
+
+
+def top_indices(counts: np.ndarray, limit: Optional[int]) -> np.ndarray:
+    """Индексы ненулевых счётчиков по убыванию (индекс 0 - None - пропускается); top-K через argpartition"""
+    present = np.flatnonzero(counts[1:]) + 1
+    if limit is not None and limit < len(present):
+        present = present[np.argpartition(-counts[present], limit - 1)[:limit]]
+    return present[np.argsort(-counts[present], kind='stable')]
+
+
+class ColumnarReport:
+    """Агрегаты периода с тем же интерфейсом, что у ReportAggregator"""
+
+    def __init__(self, total_actions: int, daily_actions: Dict[str, int], numbers: np.ndarray,
+                 questions: np.ndarray, users: np.ndarray, user_ids: np.ndarray):
+        self.total_actions = total_actions
+        self.daily_actions = daily_actions
+        self.weekly_actions: Dict[str, int] = {}
+        for day, count in daily_actions.items():
+            # %W совпадает с strftime('%Y-%W') в SQLite: недели начинаются с понедельника
+            week = datetime.strptime(day, '%Y-%m-%d').strftime('%Y-%W')
+            self.weekly_actions[week] = self.weekly_actions.get(week, 0) + count
+        self._numbers = numbers
+        self._questions = questions
+        self._users = users
+        self._user_ids = user_ids
+
+    @property
+    def unique_users(self) -> int:
+        return int(np.count_nonzero(self._users[1:]))
+
+    def top_numbers(self, limit: Optional[int] = None) -> Dict[int, int]:
+        return {int(i): int(self._numbers[i]) for i in top_indices(self._numbers, limit)}
+
+    def top_questions(self, limit: Optional[int] = None) -> Dict[int, int]:
+        return {int(i): int(self._questions[i]) for i in top_indices(self._questions, limit)}
+
+    def top_users(self, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Самые активные пользователи: [(user_id, count), ...]"""
+        return [(int(self._user_ids[code]), int(self._users[code])) for code in top_indices(self._users, limit)]
+
+
+class AnalyticsCache:
+    """История user_actions в файлах-колонках рядом с БД, открытых через np.memmap.
+
+    Новые действия дописываются в конец колонок по id (граница хранится в
+    meta.json), поэтому после первой загрузки обновление читает из SQLite
+    только свежие строки. meta.json - точка фиксации: пачка пишется за
+    зафиксированной границей всех колонок и словаря пользователей и
+    считается загруженной только после его записи, так что сбой посреди
+    пачки оставляет кэш в прежнем состоянии. Если строки last_id в БД
+    больше нет или она другая (база заменена или восстановлена из копии),
+    кэш строится заново. Пока строки идут по возрастанию времени, период
+    выбирается двоичным поиском по колонке ts, иначе - маской. Действия
+    после последней дозагрузки отчёт дочитывает из БД (read_tail), поэтому
+    дозагрузку можно делать в фоне. Удаление
+    старых действий в cleanup_old_data на кэш не влияет: длинные отчёты
+    смотрят не дальше 30 дней.
+    """
+
+    def __init__(self, db_path: str, cache_dir: Optional[str] = None):
+        self.db_path = db_path
+        self.cache_dir = cache_dir or f"{db_path}.analytics"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.meta = dict(EMPTY_META)
+        meta_path = os.path.join(self.cache_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                self.meta = json.load(file)
+        self._discard_unfinished()
+        self._user_ids = self._read('user_ids', np.int64, self.meta['users'] + 1)
+        self._user_codes = {int(user_id): code for code, user_id in enumerate(self._user_ids) if code}
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}.bin")
+
+    def _discard_unfinished(self) -> None:
+        """Обрезка хвостов, дописанных до сбоя, но не отмеченных в meta.json"""
+        sizes = {name: self.meta['rows'] * np.dtype(dtype).itemsize for name, dtype in COLUMNS.items()}
+        # Код 0 в словаре пользователей зарезервирован под None
+        sizes['user_ids'] = (self.meta['users'] + 1) * np.dtype(np.int64).itemsize
+        for name, size in sizes.items():
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _read(self, name: str, dtype, rows: int) -> np.ndarray:
+        if name == 'user_ids' and not os.path.exists(self._path(name)):
+            np.zeros(1, dtype=np.int64).tofile(self._path(name))
+        if rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode='r', shape=(rows,))
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = self._read(name, COLUMNS[name], self.meta['rows'])
+        return self._columns[name]
+
+    def refresh(self) -> int:
+        """Дозагрузка действий после последнего загруженного id; блокирующий вызов. Возвращает число новых строк"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        if self.meta['last_id'] and not self._same_database(cursor):
+            logger.warning("База статистики заменена, колоночный кэш строится заново")
+            self._reset()
+        self._select_after(cursor, self.meta['last_id'])
+
+        added = 0
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK)
+            if not rows:
+                break
+            self._append(np.array(rows, dtype=np.int64))
+            added += len(rows)
+        conn.close()
+        return added
+
+    def read_tail(self, cursor, limit: int = TAIL_LIMIT) -> Optional[np.ndarray]:
+        """Ещё не загруженные действия для report: строки (ts, user_id, number_id, question_id).
+
+        None, если база заменена или новых действий больше limit - тогда кэш
+        нужно дозагрузить или перестроить, а отчёт посчитать по БД.
+        """
+        if self.meta['last_id'] and not self._same_database(cursor):
+            return None
+        cursor.execute('SELECT MAX(id) FROM user_actions')
+        if (cursor.fetchone()[0] or 0) - self.meta['last_id'] > limit:
+            return None
+        self._select_after(cursor, self.meta['last_id'])
+        return np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 5)[:, 1:]
+
+    def _select_after(self, cursor, last_id: int) -> None:
+        cursor.execute('''
+            SELECT id, CAST(strftime('%s', timestamp) AS INTEGER), IFNULL(user_id, ?),
+                   IFNULL(number_id, 0), IFNULL(question_id, 0)
+            FROM user_actions
+            WHERE id > ?
+            ORDER BY id
+        ''', (NO_USER, last_id))
+
+    def _same_database(self, cursor) -> bool:
+        """Строка last_id в БД та же, что загружена последней"""
+        cursor.execute('''
+            SELECT CAST(strftime('%s', timestamp) AS INTEGER), IFNULL(user_id, ?)
+            FROM user_actions WHERE id = ?
+        ''', (NO_USER, self.meta['last_id']))
+        row = cursor.fetchone()
+        return row is not None and list(row) == self.meta.get('last_row')
+
+    def _reset(self) -> None:
+        self.meta = dict(EMPTY_META)
+        self._save_meta(self.meta)
+        # Файлы удаляются, а не обрезаются: уже открытые memmap отчётов остаются валидными
+        for name in [*COLUMNS, 'user_ids']:
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self._user_ids = self._read('user_ids', np.int64, 1)
+        self._user_codes = {}
+        self._columns.clear()
+
+    def _append(self, chunk: np.ndarray) -> None:
+        """Запись пачки строк (id, ts, user_id, number_id, question_id) и фиксация в meta.json"""
+        meta = dict(self.meta)
+        ts = chunk[:, 1]
+        if meta['sorted']:
+            last_ts = int(self.column('ts')[-1]) if meta['rows'] else None
+            meta['sorted'] = bool(np.all(ts[1:] >= ts[:-1]) and (last_ts is None or ts[0] >= last_ts))
+        codes, new_ids = self._encode_users(chunk[:, 2])
+
+        values = {
+            'ts': ts,
+            'user': codes,
+            'number': chunk[:, 3],
+            'question': chunk[:, 4],
+        }
+        for name, dtype in COLUMNS.items():
+            self._write_at(name, meta['rows'], values[name].astype(dtype))
+        # Код 0 в словаре пользователей зарезервирован под None
+        self._write_at('user_ids', meta['users'] + 1, np.array(new_ids, dtype=np.int64))
+
+        meta['rows'] += len(chunk)
+        meta['users'] += len(new_ids)
+        meta['last_id'] = int(chunk[-1, 0])
+        meta['last_row'] = [int(ts[-1]), int(chunk[-1, 2])]
+        self._save_meta(meta)
+
+        self._user_codes.update((user_id, self.meta['users'] + 1 + i) for i, user_id in enumerate(new_ids))
+        self.meta = meta
+        self._user_ids = self._read('user_ids', np.int64, meta['users'] + 1)
+        self._columns.clear()
+
+    def _write_at(self, name: str, offset: int, values: np.ndarray) -> None:
+        """Запись values с элемента offset; хвост незафиксированной пачки после сбоя перезаписывается"""
+        path = self._path(name)
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+            file.seek(offset * values.itemsize)
+            file.write(values.tobytes())
+            file.truncate()
+
+    def _encode_users(self, user_ids: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+        """Словарное кодирование user_id: Telegram id слишком велики для bincount.
+
+        Возвращает коды и новые user_id; новым выдаются следующие коды, но
+        словарь пополняется только при фиксации пачки.
+        """
+        unique, inverse = np.unique(user_ids, return_inverse=True)
+        new_ids = [int(user_id) for user_id in unique if user_id != NO_USER and int(user_id) not in self._user_codes]
+        new_codes = {user_id: self.meta['users'] + 1 + i for i, user_id in enumerate(new_ids)}
+        codes = np.array(
+            [self._user_codes.get(int(user_id)) or new_codes.get(int(user_id), 0) for user_id in unique],
+            dtype=np.int32,
+        )
+        return codes[inverse], new_ids
+
+    def _save_meta(self, meta: dict) -> None:
+        meta_path = os.path.join(self.cache_dir, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def report(self, start: datetime, end: Optional[datetime] = None,
+               tail: Optional[np.ndarray] = None) -> ColumnarReport:
+        """Агрегаты за [start, end): дни, номера, вопросы и пользователи векторными операциями.
+
+        tail - ещё не загруженные действия из read_tail; их пользователи
+        получают временные коды, словарь кэша не меняется.
+        """
+        ts = self.column('ts')
+        low = epoch_seconds(start)
+        high = epoch_seconds(end) if end is not None else None
+        if self.meta['sorted']:
+            first = int(np.searchsorted(ts, low, side='left'))
+            last = int(np.searchsorted(ts, high, side='left')) if high is not None else len(ts)
+            selection = slice(first, last)
+        else:
+            selection = ts >= low
+            if high is not None:
+                selection &= ts < high
+
+        selected_ts = ts[selection]
+        total = len(selected_ts)
+        daily = day_counts(selected_ts)
+        numbers = np.bincount(self.column('number')[selection])
+        questions = np.bincount(self.column('question')[selection])
+        users = np.bincount(self.column('user')[selection], minlength=len(self._user_ids))
+        user_ids = self._user_ids
+
+        if tail is not None:
+            in_period = tail[:, 0] >= low
+            if high is not None:
+                in_period &= tail[:, 0] < high
+            tail = tail[in_period]
+        if tail is not None and len(tail):
+            total += len(tail)
+            for day, count in day_counts(tail[:, 0]).items():
+                daily[day] = daily.get(day, 0) + count
+            numbers = add_counts(numbers, np.bincount(tail[:, 2]))
+            questions = add_counts(questions, np.bincount(tail[:, 3]))
+            codes, new_ids = self._encode_users(tail[:, 1])
+            user_ids = np.concatenate([user_ids, np.array(new_ids, dtype=np.int64)])
+            users = add_counts(users, np.bincount(codes, minlength=len(user_ids)))
+
+        return ColumnarReport(total, daily, numbers, questions, users, user_ids)
@@ -0,0 +1,151 @@
+"""
+Потоковое обнаружение всплесков обращений по номерам устройств и вопросам
+"""
+
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Ширина корзины счётчика, секунды
+ANOMALY_BUCKET = 60
+
+# Короткое окно, которое сравнивается с нормой, секунды
+ANOMALY_WINDOW = float(os.getenv("ANOMALY_WINDOW", 900))
+
+# Горизонт скользящей нормы (экспоненциальное среднее по корзинам), часы
+ANOMALY_BASELINE_HOURS = float(os.getenv("ANOMALY_BASELINE_HOURS", 24))
+
+# Всплеск: не меньше ANOMALY_MIN_COUNT действий за окно и в ANOMALY_RATIO раз больше нормы
+ANOMALY_MIN_COUNT = int(os.getenv("ANOMALY_MIN_COUNT", 10))
+ANOMALY_RATIO = float(os.getenv("ANOMALY_RATIO", 5))
+
+# Норма не считается ниже этого числа действий за окно: редкие ключи не срабатывают от пары нажатий
+ANOMALY_MIN_EXPECTED = 1.0
+
+# Повторное предупреждение по тому же ключу не чаще раза в этот период, секунды
+ANOMALY_COOLDOWN = float(os.getenv("ANOMALY_COOLDOWN", 3600))
+
+# Предел числа отслеживаемых ключей; дольше всех не встречавшиеся вытесняются
+ANOMALY_MAX_KEYS = int(os.getenv("ANOMALY_MAX_KEYS", 5000))
+
+# За сколько дней hourly_stats берётся начальная норма при запуске
+ANOMALY_SEED_DAYS = 7
+
+# Как часто накопленные предупреждения отправляются в админский чат, секунды
+ANOMALY_CHECK_INTERVAL = float(os.getenv("ANOMALY_CHECK_INTERVAL", 60))
+
+# Ключ счётчика: (номер, вопрос); вопрос None - все действия по номеру
+SpikeKey = Tuple[str, Optional[str]]
+
+
+class _KeyState:
+    """Кольцо корзин короткого окна и норма для одного ключа"""
+
+    __slots__ = ('ring', 'bucket', 'window_count', 'baseline', 'last_alert')
+
+    def __init__(self, size: int, bucket: int, baseline: float):
+        self.ring = [0] * size
+        self.bucket = bucket
+        self.window_count = 0
+        # Среднее число действий в корзине
+        self.baseline = baseline
+        self.last_alert: Optional[float] = None
+
+
+class SpikeDetector:
+    """Скользящие счётчики по (номер, вопрос) и сравнение окна со скользящей нормой.
+
+    На каждое действие - O(1): закрытые корзины вливаются в экспоненциальное
+    среднее, простой ключа учитывается одним возведением в степень. Память
+    ограничена ANOMALY_MAX_KEYS ключами с кольцом из окна/корзина счётчиков,
+    независимо от размера каталога.
+    """
+
+    def __init__(self, window: float = ANOMALY_WINDOW, baseline_hours: float = ANOMALY_BASELINE_HOURS,
+                 min_count: int = ANOMALY_MIN_COUNT, ratio: float = ANOMALY_RATIO,
+                 cooldown: float = ANOMALY_COOLDOWN, max_keys: int = ANOMALY_MAX_KEYS):
+        self.size = max(1, int(window // ANOMALY_BUCKET))
+        self.alpha = ANOMALY_BUCKET / (baseline_hours * 3600)
+        self.min_count = min_count
+        self.ratio = ratio
+        self.cooldown = cooldown
+        self.max_keys = max_keys
+        self._states: 'OrderedDict[SpikeKey, _KeyState]' = OrderedDict()
+        self.pending: Deque[str] = deque(maxlen=50)
+        self.evicted = 0
+
+    def seed(self, counts: Dict[SpikeKey, int], hours: float) -> None:
+        """Начальная норма из накопленной статистики, чтобы после перезапуска не было ложных всплесков"""
+        buckets = hours * 3600 / ANOMALY_BUCKET
+        now_bucket = int(time.monotonic() // ANOMALY_BUCKET)
+        busiest = sorted(counts.items(), key=lambda item: item[1], reverse=True)[:self.max_keys]
+        # Самые активные ключи последними - их вытеснят позже всех
+        for key, count in reversed(busiest):
+            self._states[key] = _KeyState(self.size, now_bucket, count / buckets)
+
+    def observe(self, number: Optional[str], question: Optional[str]) -> None:
+        """Учёт действия пользователя; найденный всплеск попадает в pending"""
+        if number is None:
+            return
+        now = time.monotonic()
+        self._count((number, None), now)
+        if question is not None:
+            self._count((number, question), now)
+
+    def _count(self, key: SpikeKey, now: float) -> None:
+        bucket = int(now // ANOMALY_BUCKET)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _KeyState(self.size, bucket, 0.0)
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._states.move_to_end(key)
+            self._advance(state, bucket)
+
+        state.ring[bucket % self.size] += 1
+        state.window_count += 1
+
+        expected = max(state.baseline * self.size, ANOMALY_MIN_EXPECTED)
+        if state.window_count < self.min_count or state.window_count < self.ratio * expected:
+            return
+        if state.last_alert is not None and now - state.last_alert < self.cooldown:
+            return
+        state.last_alert = now
+        self.pending.append(self._describe(key, state.window_count, state.baseline * self.size))
+
+    def _advance(self, state: _KeyState, bucket: int) -> None:
+        """Закрытие корзин до bucket: их счётчики вливаются в норму и покидают окно"""
+        gap = bucket - state.bucket
+        if gap <= 0:
+            return
+        closed = state.ring[state.bucket % self.size]
+        state.baseline += self.alpha * (closed - state.baseline)
+        # Пустые корзины простоя ключа
+        state.baseline *= (1 - self.alpha) ** (gap - 1)
+        if gap >= self.size:
+            state.ring = [0] * self.size
+            state.window_count = 0
+        else:
+            for skipped in range(state.bucket + 1, bucket + 1):
+                index = skipped % self.size
+                state.window_count -= state.ring[index]
+                state.ring[index] = 0
+        state.bucket = bucket
+
+    def _describe(self, key: SpikeKey, count: int, expected: float) -> str:
+        number, question = key
+        subject = f"номер {number}, вопрос «{question}»" if question else f"номер {number}, все действия"
+        minutes = self.size * ANOMALY_BUCKET // 60
+        growth = f"×{count / expected:.0f}" if expected >= 0.1 else "раньше почти не было"
+        return f"• {subject}: {count} за {minutes} мин при норме ~{expected:.1f} ({growth})"
+
+    def drain(self) -> List[str]:
+        alerts = list(self.pending)
+        self.pending.clear()
+        return alerts
+
+    def tracked(self) -> int:
+        return len(self._states)
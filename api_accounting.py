@@ -0,0 +1,99 @@
+"""
+Учёт вызовов Bot API по действиям пользователей
+"""
+
+import logging
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from telegram.request import HTTPXRequest
+
+from tracing import SPAN_KIND_CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+# Бюджет вызовов Bot API на одно действие пользователя
+API_CALL_BUDGET = {
+    'start': 2,        # меню + клавиатура /start (только первый раз за сессию)
+    'navigation': 2,   # answer + редактирование меню
+    'question': 3,     # answer + файл по file_id + заголовок, либо answer + заглушка
+    'upload': 2,       # фоновая загрузка файла или альбома + заголовок вместо заглушки
+    'search': 1,       # ответ с найденными решениями
+    'suppressed': 1,   # answer на повторное нажатие
+}
+
+# Действие, в рамках которого сейчас выполняются вызовы: (имя, список методов)
+current_action: ContextVar[Optional[Tuple[str, List[str]]]] = ContextVar('current_action', default=None)
+
+
+class ApiCallCounter:
+    """Счётчик вызовов Bot API с разбивкой по действиям и контролем бюджета"""
+
+    def __init__(self, budget: Dict[str, int] = API_CALL_BUDGET):
+        self.budget = budget
+        self.actions = Counter()
+        self.calls: Dict[str, Counter] = defaultdict(Counter)
+        self.over_budget = Counter()
+
+    @contextmanager
+    def action(self, name: str):
+        """Все вызовы Bot API внутри блока относятся к действию name"""
+        methods: List[str] = []
+        token = current_action.set((name, methods))
+        try:
+            yield methods
+        finally:
+            current_action.reset(token)
+            self.actions[name] += 1
+            limit = self.budget.get(name)
+            if limit is not None and len(methods) > limit:
+                self.over_budget[name] += 1
+                logger.warning(
+                    "Действие %s: %d вызовов Bot API при бюджете %d: %s", name, len(methods), limit, methods,
+                    extra={'action': name, 'api_calls': len(methods), 'budget': limit}
+                )
+
+    def record(self, method: str):
+        state = current_action.get()
+        if state is None:
+            self.calls['background'][method] += 1
+            return
+        name, methods = state
+        methods.append(method)
+        self.calls[name][method] += 1
+
+    def stats(self) -> Dict[str, Dict]:
+        """Среднее число вызовов на действие и превышения бюджета"""
+        result = {}
+        for name, methods in self.calls.items():
+            total = sum(methods.values())
+            count = self.actions.get(name, 0)
+            result[name] = {
+                'actions': count,
+                'calls': total,
+                'per_action': total / count if count else None,
+                'budget': self.budget.get(name),
+                'over_budget': self.over_budget.get(name, 0),
+                'methods': dict(methods.most_common()),
+            }
+        return result
+
+
+class CountingRequest(HTTPXRequest):
+    """HTTPXRequest, который отмечает каждый вызов Bot API в ApiCallCounter"""
+
+    def __init__(self, counter: ApiCallCounter, **kwargs):
+        super().__init__(**kwargs)
+        self.counter = counter
+
+    async def do_request(self, url: str, method: str, request_data=None, **kwargs):
+        endpoint = url.rsplit('/', 1)[-1]
+        self.counter.record(endpoint)
+        with tracer.span(f"bot_api {endpoint}", SPAN_KIND_CLIENT) as span:
+            code, payload = await super().do_request(url, method, request_data, **kwargs)
+            if span is not None:
+                span.set_attribute('http.status_code', code)
+                span.set_attribute('upload', bool(request_data and request_data.contains_files))
+            return code, payload
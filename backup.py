@@ -0,0 +1,197 @@
+"""
+Резервные копии базы статистики без остановки бота
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Каталог снимков
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+
+# Интервал между снимками, часы
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", 24))
+
+# Сколько последних снимков хранить
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 14))
+
+# Страниц за шаг backup API и пауза между шагами: запись в БД ждёт не дольше одного шага
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", 256))
+BACKUP_STEP_PAUSE = float(os.getenv("BACKUP_STEP_PAUSE", 0.01))
+
+# После стольких перезапусков из-за записи в источник копия снимается за один шаг
+BACKUP_MAX_RESTARTS = 5
+
+SNAPSHOT_SUFFIX = ".db.gz"
+CHECKSUM_SUFFIX = ".sha256"
+
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BackupManager:
+    """Онлайн-копии SQLite через backup API: сжатые снимки с контрольной суммой и ротацией.
+
+    Копирование идёт шагами по BACKUP_STEP_PAGES страниц; блокировка чтения
+    держится только на время шага, и log_action успевает записать между
+    шагами. Если источник изменился посреди копии, SQLite начинает её заново;
+    при постоянной записи копия после BACKUP_MAX_RESTARTS попыток снимается
+    одним шагом - запись при этом ждёт, но не дольше одного копирования.
+    """
+
+    def __init__(self, db_path: str, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+                 step_pages: int = BACKUP_STEP_PAGES, step_pause: float = BACKUP_STEP_PAUSE):
+        self.db_path = db_path
+        self.backup_dir = Path(backup_dir)
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_pause = step_pause
+        self.prefix = Path(db_path).stem
+
+    def snapshots(self) -> List[Path]:
+        """Снимки от старых к новым; имя содержит время, поэтому сортировка по имени"""
+        if not self.backup_dir.exists():
+            return []
+        return sorted(self.backup_dir.glob(f"{self.prefix}_*{SNAPSHOT_SUFFIX}"))
+
+    def seconds_since_last(self) -> Optional[float]:
+        snapshots = self.snapshots()
+        if not snapshots:
+            return None
+        return time.time() - snapshots[-1].stat().st_mtime
+
+    def create(self) -> Dict:
+        """Снимок базы; блокирующий вызов, из event loop - через asyncio.to_thread"""
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(MOSCOW_TZ).strftime('%Y%m%d_%H%M%S')
+        target = self.backup_dir / f"{self.prefix}_{stamp}{SNAPSHOT_SUFFIX}"
+        started = time.monotonic()
+
+        fd, raw_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(fd)
+        try:
+            steps, restarts = self._copy(raw_path)
+            self._check_integrity(raw_path)
+            raw_size = os.path.getsize(raw_path)
+
+            partial = target.with_name(target.name + '.part')
+            with open(raw_path, 'rb') as source, gzip.open(partial, 'wb', compresslevel=6) as compressed:
+                shutil.copyfileobj(source, compressed, 1024 * 1024)
+            checksum = file_sha256(partial)
+            # Формат sha256sum, чтобы снимок можно было проверить и без бота
+            target.with_name(target.name + CHECKSUM_SUFFIX).write_text(f"{checksum}  {target.name}\n")
+            os.replace(partial, target)
+        finally:
+            os.unlink(raw_path)
+
+        removed = self._prune()
+        result = {
+            'file': target.name,
+            'raw_bytes': raw_size,
+            'compressed_bytes': target.stat().st_size,
+            'sha256': checksum,
+            'steps': steps,
+            'restarts': restarts,
+            'seconds': round(time.monotonic() - started, 2),
+            'removed': removed,
+        }
+        logger.info(f"Резервная копия {target.name} создана: {result}")
+        return result
+
+    def _copy(self, raw_path: str):
+        """Копия через backup API: (число шагов, число перезапусков)"""
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(raw_path)
+        progress = {'steps': 0, 'restarts': 0, 'remaining': None}
+
+        def on_step(status, remaining, total):
+            progress['steps'] += 1
+            # Остаток вырос - SQLite начал копию заново после записи в источник
+            if progress['remaining'] is not None and remaining > progress['remaining']:
+                progress['restarts'] += 1
+                if progress['restarts'] > BACKUP_MAX_RESTARTS:
+                    raise _BackupRestarted()
+            progress['remaining'] = remaining
+            time.sleep(self.step_pause)
+
+        try:
+            try:
+                source.backup(target, pages=self.step_pages, progress=on_step)
+            except _BackupRestarted:
+                logger.warning(f"Копия {self.db_path} перезапускалась {BACKUP_MAX_RESTARTS} раз, копируем за один шаг")
+                source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return progress['steps'], progress['restarts']
+
+    @staticmethod
+    def _check_integrity(raw_path: str) -> Dict[str, int]:
+        """integrity_check и число строк основных таблиц; исключение, если база повреждена"""
+        conn = sqlite3.connect(f"file:{raw_path}?mode=ro", uri=True)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                raise RuntimeError(f"integrity_check: {result}")
+            tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+        finally:
+            conn.close()
+
+    def _prune(self) -> List[str]:
+        removed = []
+        if self.keep <= 0:
+            return removed
+        for snapshot in self.snapshots()[:-self.keep]:
+            snapshot.unlink()
+            checksum = snapshot.with_name(snapshot.name + CHECKSUM_SUFFIX)
+            if checksum.exists():
+                checksum.unlink()
+            removed.append(snapshot.name)
+        return removed
+
+    def verify(self, name: Optional[str] = None) -> Dict:
+        """Проверка восстановления: контрольная сумма, распаковка и integrity_check копии"""
+        snapshots = self.snapshots()
+        if name:
+            snapshots = [snapshot for snapshot in snapshots if snapshot.name == name]
+        if not snapshots:
+            raise FileNotFoundError(name or "нет резервных копий")
+        snapshot = snapshots[-1]
+
+        checksum_file = snapshot.with_name(snapshot.name + CHECKSUM_SUFFIX)
+        expected = checksum_file.read_text().split()[0] if checksum_file.exists() else None
+        actual = file_sha256(snapshot)
+        if expected != actual:
+            raise RuntimeError(f"контрольная сумма не совпадает: ожидалась {expected}, получена {actual}")
+
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as restore_dir:
+            restored = os.path.join(restore_dir, 'restored.db')
+            with gzip.open(snapshot, 'rb') as compressed, open(restored, 'wb') as target:
+                shutil.copyfileobj(compressed, target, 1024 * 1024)
+            rows = self._check_integrity(restored)
+
+        return {'file': snapshot.name, 'sha256': actual, 'rows': rows}
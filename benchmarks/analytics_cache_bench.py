@@ -0,0 +1,94 @@
+"""
+Отчёты за неделю и месяц: один проход ReportAggregator по БД против колоночного кэша
+
+    python benchmarks/analytics_cache_bench.py [строк] [дней]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from synthetic import build_database
+
+from analytics_cache import AnalyticsCache
+from statistics import MOSCOW_TZ
+
+# Действий, дописываемых перед замером дозагрузки
+REFRESH_ROWS = 1000
+
+PERIODS = (7, 30, 45)
+DIMENSIONS = ('daily', 'weekly', 'numbers', 'questions', 'users')
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def cache_size(cache: AnalyticsCache) -> int:
+    return sum(os.path.getsize(os.path.join(cache.cache_dir, name)) for name in os.listdir(cache.cache_dir))
+
+
+def compare(report, expected) -> None:
+    """Совпадение агрегатов кэша и прохода по БД"""
+    assert report.total_actions == expected.total_actions
+    assert report.daily_actions == expected.daily_actions
+    assert report.weekly_actions == expected.weekly_actions
+    assert report.top_numbers() == expected.top_numbers()
+    assert report.top_questions(10) == expected.top_questions(10)
+    assert report.unique_users == expected.unique_users
+    assert [count for _, count in report.top_users(10)] == [count for _, count in expected.top_users(10)]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        stats_manager, user_ids = build_database(os.path.join(workdir, 'bench.db'), rows, days)
+        conn = sqlite3.connect(stats_manager.db_path)
+        cursor = conn.cursor()
+
+        cache = AnalyticsCache(stats_manager.db_path)
+        _, load_time = timed(cache.refresh)
+
+        print(f"Действий в базе: {rows} за {days} дней")
+        print(f"Первая загрузка кэша: {load_time:.2f} с, на диске {cache_size(cache) / 2 ** 20:.0f} МБ")
+        print(f"{'период':10}{'БД, мс':>12}{'кэш, мс':>12}")
+        now = datetime.now(MOSCOW_TZ).replace(tzinfo=None)
+        for period in PERIODS:
+            start = now - timedelta(days=period)
+
+            def from_db():
+                report = stats_manager._run_report(cursor, start.strftime('%Y-%m-%d %H:%M:%S'), None, DIMENSIONS)
+                stats_manager._resolve_top_users(cursor, report, 10)
+                return report
+
+            def from_cache():
+                report = cache.report(start)
+                stats_manager._resolve_top_users(cursor, report, 10)
+                return report
+
+            expected, db_time = timed(from_db)
+            report, cache_time = timed(from_cache)
+            compare(report, expected)
+            print(f"{period:>3} дней  {db_time * 1000:>12.1f}{cache_time * 1000:>12.1f}")
+
+        timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+        cursor.executemany(
+            'INSERT INTO user_actions (user_id, action_type_id, timestamp) VALUES (?, 1, ?)',
+            [(user_ids[i % len(user_ids)], timestamp) for i in range(REFRESH_ROWS)]
+        )
+        conn.commit()
+        added, refresh_time = timed(cache.refresh)
+        assert added == REFRESH_ROWS
+        print(f"Дозагрузка {REFRESH_ROWS} новых действий: {refresh_time * 1000:.1f} мс")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Задержка answer во время загрузок: общий пул соединений против отдельного пула загрузок
+
+Локальный фейковый Bot API отвечает на sendDocument с задержкой UPLOAD_DELAY;
+пока UPLOADS загрузок в полёте, каждые ANSWER_INTERVAL отправляется answer.
+
+    python benchmarks/bot_pools_bench.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot
+from telegram.error import TimedOut
+
+from api_accounting import ApiCallCounter
+from bot_requests import PooledRequest, SplitRequest
+
+UPLOAD_DELAY = 2.0
+UPLOADS = 8
+UPLOAD_BYTES = 2 * 1024 * 1024
+ANSWERS = 20
+ANSWER_INTERVAL = 0.1
+
+
+class FakeBotApi(BaseHTTPRequestHandler):
+    """Минимальный Bot API: getMe, answerCallbackQuery и медленный sendDocument"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        method = self.path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'bench_bot'}
+        elif method == 'sendDocument':
+            time.sleep(UPLOAD_DELAY)
+            result = {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+                      'document': {'file_id': 'doc', 'file_unique_id': 'doc'}}
+        else:
+            result = True
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def pooled(pool_size: int, pool_timeout: float = 30.0) -> PooledRequest:
+    return PooledRequest(
+        ApiCallCounter(), keepalive_expiry=60, connection_pool_size=pool_size,
+        read_timeout=30, write_timeout=30, pool_timeout=pool_timeout,
+    )
+
+
+async def run(base_url: str, request) -> dict:
+    bot = Bot("1:BENCH", base_url=base_url, request=request, get_updates_request=pooled(1))
+    await bot.initialize()
+    document = b'0' * UPLOAD_BYTES
+
+    async def answer() -> float:
+        started = time.perf_counter()
+        try:
+            await bot.answer_callback_query('1')
+        except TimedOut:
+            return float('inf')
+        return time.perf_counter() - started
+
+    uploads = [asyncio.create_task(bot.send_document(1, document=document, filename='a.pdf')) for _ in range(UPLOADS)]
+    await asyncio.sleep(0.05)
+    answers = []
+    for _ in range(ANSWERS):
+        answers.append(asyncio.create_task(answer()))
+        await asyncio.sleep(ANSWER_INTERVAL)
+    latencies = sorted(await asyncio.gather(*answers))
+    await asyncio.gather(*uploads, return_exceptions=True)
+    await bot.shutdown()
+
+    finished = [latency for latency in latencies if latency != float('inf')]
+    return {
+        'p50': finished[len(finished) // 2] * 1000 if finished else None,
+        'max': finished[-1] * 1000 if finished else None,
+        'timed_out': len(latencies) - len(finished),
+    }
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/bot"
+
+    configs = [
+        ("общий пул 4", lambda: pooled(4)),
+        ("общий пул 4, pool_timeout 1", lambda: pooled(4, pool_timeout=1)),
+        ("раздельные 4 + загрузки 4", lambda: SplitRequest(pooled(4), pooled(4))),
+        ("общий пул 256", lambda: pooled(256)),
+    ]
+    print(f"{UPLOADS} загрузок по {UPLOAD_BYTES // 1024} КБ с задержкой {UPLOAD_DELAY} с, "
+          f"{ANSWERS} answer через {ANSWER_INTERVAL * 1000:.0f} мс")
+    for name, factory in configs:
+        result = asyncio.run(run(base_url, factory()))
+        print(f"{name:32} p50 {result['p50']:8.1f} мс  max {result['max']:8.1f} мс  TimedOut {result['timed_out']}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
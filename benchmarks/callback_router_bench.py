@@ -0,0 +1,101 @@
+"""
+Разбор callback_data: цепочка startswith/split до CallbackRouter против поиска в таблице
+
+    python benchmarks/callback_router_bench.py [итераций]
+"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_parse(data: str, question_map: dict):
+    """Разбор из route_callback и handle_back до табличного роутера (без обработчиков экранов)"""
+    if data == "other":
+        return ('other',)
+    if data.startswith("back_to_"):
+        back_type = data.split("_")[2]
+        if back_type == "start":
+            return ('start',)
+        if back_type == "models":
+            return ('device', data.split("_")[3])
+        if back_type == "numbers":
+            _, _, _, device_type, model = data.split("_")
+            return ('model', device_type, model)
+        if back_type == "questions":
+            _, _, _, device_type, model, number = data.split("_")
+            return ('number', device_type, model, number)
+    elif data.startswith("device_"):
+        return ('device', data.split("_")[1])
+    elif data.startswith("model_"):
+        _, device_type, model = data.split("_")
+        return ('model', device_type, model)
+    elif data.startswith("number_"):
+        _, device_type, model, number = data.split("_")
+        return ('number', device_type, model, number)
+    elif data.startswith("question_"):
+        _, q_id = data.split("_", 1)
+        return ('question', *question_map[q_id])
+    return None
+
+
+def legacy_data(paths):
+    """callback_data кнопок в старом формате и таблица question_<id>"""
+    question_map = {}
+    data = ['other', 'back_to_start']
+    for path in paths:
+        if len(path) == 4:
+            q_id = hashlib.md5("_".join(path).encode()).hexdigest()[:8]
+            question_map[q_id] = path
+            data.append(f"question_{q_id}")
+            continue
+        screen = {1: 'device', 2: 'model', 3: 'number'}[len(path)]
+        back = {1: 'models', 2: 'numbers', 3: 'questions'}[len(path)]
+        data.append(f"{screen}_{'_'.join(path)}")
+        data.append(f"back_to_{back}_{'_'.join(path)}")
+    # Старая цепочка не разбирает ключи и номера с "_" и "/" в них - такие кнопки в замер не входят
+    parsable = []
+    for item in data:
+        try:
+            legacy_parse(item, question_map)
+        except ValueError:
+            continue
+        parsable.append(item)
+    return parsable, question_map
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        import main as bot
+
+        bot_handler = bot.BotHandler()
+        router = bot_handler.callback_router
+        paths = list(bot_handler.deep_links.nodes.values())
+        old_data, question_map = legacy_data(paths)
+        new_data = [router.callback_data(path) for path in paths] + [router.back_data(path) for path in paths]
+
+        def run_legacy():
+            for data in old_data:
+                legacy_parse(data, question_map)
+
+        def run_router():
+            for data in new_data:
+                router.parse(data)
+
+        rounds = max(1, iterations // len(new_data))
+        legacy_time = min(timeit.repeat(run_legacy, number=rounds, repeat=5)) / (rounds * len(old_data))
+        router_time = min(timeit.repeat(run_router, number=rounds, repeat=5)) / (rounds * len(new_data))
+
+        print(f"Маршрутов в таблице: {len(router.routes)}, узлов каталога: {len(paths)}")
+        print(f"startswith/split ({len(old_data)} кнопок): {legacy_time * 1e9:.0f} нс на разбор")
+        print(f"CallbackRouter   ({len(new_data)} кнопок): {router_time * 1e9:.0f} нс на разбор")
+
+
+if __name__ == '__main__':
+    main()
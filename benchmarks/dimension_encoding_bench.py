@@ -0,0 +1,140 @@
+"""
+Словарь измерений: текстовые колонки user_actions против id из dimension_values
+
+Размер базы, GROUP BY по вопросам, месячный отчёт и однократная миграция.
+Значения в synthetic.py короче реальных названий вопросов, так что
+выигрыш по размеру здесь - нижняя оценка.
+
+    python benchmarks/dimension_encoding_bench.py [строк] [дней]
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from synthetic import build_database
+
+from report_engine import ReportAggregator
+from statistics import MOSCOW_TZ, StatisticsManager
+
+# user_actions до словаря измерений
+LEGACY_SCHEMA = [
+    '''CREATE TABLE users (
+           user_id INTEGER PRIMARY KEY,
+           username TEXT,
+           first_name TEXT,
+           last_name TEXT,
+           first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+           last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+       )''',
+    '''CREATE TABLE user_actions (
+           id INTEGER PRIMARY KEY AUTOINCREMENT,
+           user_id INTEGER,
+           action_type TEXT NOT NULL,
+           device_type TEXT,
+           model TEXT,
+           number TEXT,
+           question TEXT,
+           timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+           FOREIGN KEY (user_id) REFERENCES users (user_id)
+       )''',
+    'CREATE INDEX idx_user_actions_timestamp ON user_actions (timestamp)',
+]
+
+
+def build_legacy(path: str, encoded_path: str) -> None:
+    """Те же действия и пользователи, что в encoded_path, в текстовой схеме"""
+    conn = sqlite3.connect(path)
+    for statement in LEGACY_SCHEMA:
+        conn.execute(statement)
+    conn.execute('ATTACH DATABASE ? AS encoded', (encoded_path,))
+    conn.execute('INSERT INTO users SELECT user_id, username, first_name, last_name, first_seen, last_seen FROM encoded.users')
+    value = "(SELECT value FROM encoded.dimension_values WHERE id = a.{})".format
+    conn.execute(f'''
+        INSERT INTO user_actions (id, user_id, action_type, device_type, model, number, question, timestamp)
+        SELECT a.id, a.user_id, {value('action_type_id')}, {value('device_type_id')}, {value('model_id')},
+               {value('number_id')}, {value('question_id')}, a.timestamp
+        FROM encoded.user_actions a
+    ''')
+    conn.commit()
+    conn.execute('DETACH DATABASE encoded')
+    conn.execute('VACUUM')
+    conn.close()
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        encoded_path = os.path.join(workdir, 'encoded.db')
+        legacy_path = os.path.join(workdir, 'legacy.db')
+        stats_manager, _ = build_database(encoded_path, rows, days)
+        sqlite3.connect(encoded_path).execute('VACUUM')
+        build_legacy(legacy_path, encoded_path)
+
+        legacy = sqlite3.connect(legacy_path).cursor()
+        encoded = sqlite3.connect(encoded_path).cursor()
+        start = (datetime.now(MOSCOW_TZ) - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+
+        def legacy_group_by():
+            legacy.execute('SELECT question, COUNT(*) FROM user_actions WHERE question IS NOT NULL GROUP BY question')
+            return dict(legacy.fetchall())
+
+        def encoded_group_by():
+            encoded.execute('SELECT question_id, COUNT(*) FROM user_actions WHERE question_id IS NOT NULL GROUP BY question_id')
+            return stats_manager._decode_counts(encoded, dict(encoded.fetchall()))
+
+        def legacy_monthly():
+            report = ReportAggregator()
+            legacy.execute('''
+                SELECT user_id, number, question, timestamp FROM user_actions
+                WHERE timestamp >= ? ORDER BY timestamp
+            ''', (start,))
+            report.feed(legacy)
+            stats_manager._fetch_user_names(legacy, report.top_users(10))
+            return report, report.top_numbers(), report.top_questions(10)
+
+        def encoded_monthly():
+            report = stats_manager._run_report(encoded, start, None, ReportAggregator().aggregates)
+            stats_manager._resolve_top_users(encoded, report, 10)
+            numbers = stats_manager._decode_counts(encoded, report.top_numbers())
+            questions = stats_manager._decode_counts(encoded, report.top_questions(10))
+            return report, numbers, questions
+
+        legacy_questions, legacy_group_time = timed(legacy_group_by)
+        encoded_questions, encoded_group_time = timed(encoded_group_by)
+        assert legacy_questions == encoded_questions
+
+        (legacy_report, *legacy_tops), legacy_month_time = timed(legacy_monthly)
+        (encoded_report, *encoded_tops), encoded_month_time = timed(encoded_monthly)
+        assert legacy_report.total_actions == encoded_report.total_actions
+        assert legacy_report.daily_actions == encoded_report.daily_actions
+        assert legacy_tops[0] == encoded_tops[0]
+        assert sorted(legacy_tops[1].values()) == sorted(encoded_tops[1].values())
+
+        migrate_path = os.path.join(workdir, 'migrate.db')
+        shutil.copy(legacy_path, migrate_path)
+        _, migration_time = timed(lambda: StatisticsManager(migrate_path))
+
+        mb = 2 ** 20
+        print(f"Действий: {rows} за {days} дней")
+        print(f"{'':28}{'текст':>12}{'словарь':>12}")
+        print(f"{'размер базы, МБ':28}{os.path.getsize(legacy_path) / mb:>12.1f}{os.path.getsize(encoded_path) / mb:>12.1f}")
+        print(f"{'GROUP BY question, с':28}{legacy_group_time:>12.3f}{encoded_group_time:>12.3f}")
+        print(f"{'месячный отчёт, с':28}{legacy_month_time:>12.3f}{encoded_month_time:>12.3f}")
+        print(f"Миграция текстовой базы: {migration_time:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
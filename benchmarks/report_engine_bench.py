@@ -0,0 +1,89 @@
+"""
+Месячный отчёт: запросы по каждому агрегату против одного прохода ReportAggregator
+
+    python benchmarks/report_engine_bench.py [строк] [дней]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from synthetic import build_database
+
+# Шаг обработчика прогресса SQLite: счётчик шагов VM с такой точностью
+PROGRESS_STEP = 1000
+
+# Запросы месячного отчёта до ReportAggregator, по одному на агрегат
+LEGACY_QUERIES = [
+    '''SELECT DATE(timestamp), COUNT(*) FROM user_actions
+       WHERE timestamp >= ? GROUP BY DATE(timestamp)''',
+    '''SELECT COUNT(DISTINCT user_id), COUNT(*) FROM user_actions
+       WHERE timestamp >= ?''',
+    '''SELECT number_id, COUNT(*) AS count FROM user_actions
+       WHERE timestamp >= ? AND number_id IS NOT NULL GROUP BY number_id ORDER BY count DESC''',
+    '''SELECT question_id, COUNT(*) AS count FROM user_actions
+       WHERE timestamp >= ? AND question_id IS NOT NULL GROUP BY question_id ORDER BY count DESC''',
+    '''SELECT u.user_id, u.username, u.first_name, COUNT(*) AS action_count
+       FROM user_actions ua JOIN users u ON ua.user_id = u.user_id
+       WHERE ua.timestamp >= ? GROUP BY ua.user_id ORDER BY action_count DESC LIMIT 10''',
+    '''SELECT strftime('%Y-%W', timestamp), COUNT(*) FROM user_actions
+       WHERE timestamp >= ? GROUP BY strftime('%Y-%W', timestamp)''',
+]
+
+
+def measure(conn, func):
+    """Время и число шагов VM SQLite для func()"""
+    steps = [0]
+
+    def on_progress():
+        steps[0] += PROGRESS_STEP
+        return 0
+
+    conn.set_progress_handler(on_progress, PROGRESS_STEP)
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    conn.set_progress_handler(None, 0)
+    return result, elapsed, steps[0]
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        stats_manager, _ = build_database(os.path.join(workdir, 'bench.db'), rows, days)
+        start = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+
+        conn = sqlite3.connect(stats_manager.db_path)
+        cursor = conn.cursor()
+        window = cursor.execute('SELECT COUNT(*) FROM user_actions WHERE timestamp >= ?', (start,)).fetchone()[0]
+
+        def legacy():
+            return [cursor.execute(query, (start,)).fetchall() for query in LEGACY_QUERIES]
+
+        def single_pass():
+            report = stats_manager._run_report(cursor, start, None, ('daily', 'weekly', 'numbers', 'questions', 'users'))
+            stats_manager._resolve_top_users(cursor, report, 10)
+            return report
+
+        legacy_result, legacy_time, legacy_steps = measure(conn, legacy)
+        report, single_time, single_steps = measure(conn, single_pass)
+        conn.close()
+
+        assert report.total_actions == legacy_result[1][0][1] == window
+        assert report.daily_actions == dict(legacy_result[0])
+        assert report.weekly_actions == dict(legacy_result[5])
+        assert report.top_numbers() == dict(legacy_result[2])
+
+        print(f"Действий в базе: {rows}, в окне 30 дней: {window}")
+        print(f"{'':24}{'строк прочитано':>18}{'шагов VM':>14}{'время, с':>12}")
+        print(f"{'запрос на агрегат':24}{window * len(LEGACY_QUERIES):>18}{legacy_steps:>14}{legacy_time:>12.3f}")
+        print(f"{'ReportAggregator':24}{report.rows_read:>18}{single_steps:>14}{single_time:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
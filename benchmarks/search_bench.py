@@ -0,0 +1,92 @@
+"""
+Время запроса CatalogSearch и PrefixTrie на синтетическом каталоге из нескольких тысяч номеров
+
+    python benchmarks/search_bench.py [номеров] [решений]
+
+Обычный каталог: общие вопросы на тип устройства и решения для части
+номеров. Худший случай: отдельное решение у каждого номера.
+"""
+
+import os
+import random
+import statistics as stats
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search import CatalogSearch, PrefixTrie
+
+DEVICES = {
+    'scanner': 'Сканер штрихкодов',
+    'printer': 'Принтер этикеток',
+    'terminal': 'Терминал сбора данных',
+    'scales': 'Весы с печатью этикеток',
+}
+BRANDS = ['Netum', 'Honeywell', 'Zebra', 'Datalogic', 'Atol', 'Mertech', 'Urovo', 'Godex', 'Xprinter', 'Kefar']
+PROBLEMS = [
+    'Не включается', 'Не заряжается', 'Не сканирует', 'Не печатает', 'Не подключается по Bluetooth',
+    'Пищит и не читает код', 'Сброс настроек', 'Инструкция', 'Печатает пустые этикетки',
+    'Не видит компьютер', 'Не читает QR-коды', 'Зависает при загрузке', 'Смещается печать',
+]
+WORDS = ['после', 'обновления', 'прошивки', 'кабель', 'драйвер', 'зарядку', 'режим', 'кнопку', 'USB', 'батарею']
+
+QUERIES = [
+    'сканер не включается',
+    'сканер не вкючается',
+    'netum c750 не вкл',
+    'принтер печатает пустые этикетки',
+    'zebra не пдключается блютуз',
+    'инструкция',
+    'терминал зависает',
+    'что-то совсем другое',
+]
+PREFIXES = ['c', 'c7', 'c75', 'x12', '9']
+
+
+def build_catalog(numbers: int, solutions: int, per_number: bool, seed: int = 1):
+    """Индекс поиска и дерево номеров для синтетического каталога"""
+    rnd = random.Random(seed)
+    search_index = CatalogSearch()
+    trie = PrefixTrie(items_limit=50)
+    device_nodes = {device_type: [] for device_type in DEVICES}
+    for i in range(numbers):
+        device_type = rnd.choice(list(DEVICES))
+        brand = rnd.choice(BRANDS)
+        number = f"{rnd.choice('CXHMZ')}{rnd.randrange(10, 9999)}"
+        node = (device_type, brand.lower(), f"{number}-{i}")
+        device_nodes[device_type].append(node)
+        search_index.add_node(node, f"{DEVICES[device_type]} {brand} {number}")
+        trie.insert(number, node)
+        if per_number or i < solutions:
+            problem = rnd.choice(PROBLEMS)
+            text = f"{problem} {' '.join(rnd.sample(WORDS, 4))}"
+            search_index.add_solution((node, problem), text, [node])
+    for device_type, nodes in device_nodes.items():
+        for problem in PROBLEMS:
+            search_index.add_solution((device_type, problem), f"{problem} {' '.join(rnd.sample(WORDS, 4))}", nodes)
+    search_index.build()
+    return search_index, trie
+
+
+def per_call_ms(func, arg, rounds: int) -> float:
+    return min(timeit.repeat(lambda: func(arg), number=rounds, repeat=5)) / rounds * 1000
+
+
+def main():
+    numbers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    solutions = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    for name, per_number in [("обычный каталог", False), ("решение у каждого номера", True)]:
+        search_index, trie = build_catalog(numbers, solutions, per_number)
+        times = {query: per_call_ms(search_index.search, query, 200) for query in QUERIES}
+        print(f"{name}: {numbers} номеров, {len(search_index.solution_index.keys)} решений")
+        for query, elapsed in times.items():
+            print(f"  {query:36} {elapsed:.3f} мс")
+        print(f"  медиана {stats.median(times.values()):.3f} мс, максимум {max(times.values()):.3f} мс")
+
+    prefix_times = [per_call_ms(trie.find, prefix, 10000) for prefix in PREFIXES]
+    print(f"PrefixTrie.find: максимум {max(prefix_times) * 1000:.1f} мкс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Синтетическая база статистики для бенчмарков отчётов
+"""
+
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from statistics import MOSCOW_TZ, StatisticsManager
+
+USERS = 50000
+NUMBERS = 500
+QUESTIONS = 2000
+
+# Доля пользователей без записи в users (действия есть, /start не было)
+UNKNOWN_USERS = 0.02
+
+
+def build_database(path: str, rows: int, days: int = 60, seed: int = 1) -> Tuple[StatisticsManager, List[int]]:
+    """База с rows действиями за последние days дней до текущего момента по МСК.
+
+    Пользователи распределены по Парето, номера - равномерно, вопросы -
+    экспоненциально; у части действий нет номера, вопроса или пользователя.
+    Возвращает менеджер статистики и список user_id.
+    """
+    stats_manager = StatisticsManager(path)
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+
+    cursor.execute("INSERT INTO dimension_values (kind, value) VALUES ('action_type', 'number_selected')")
+    action_id = cursor.lastrowid
+    numbers = []
+    for i in range(NUMBERS):
+        cursor.execute("INSERT INTO dimension_values (kind, value) VALUES ('number', ?)", (f"N{i}",))
+        numbers.append(cursor.lastrowid)
+    questions = []
+    for i in range(QUESTIONS):
+        cursor.execute("INSERT INTO dimension_values (kind, value) VALUES ('question', ?)", (f"Q{i}",))
+        questions.append(cursor.lastrowid)
+
+    user_ids = [rnd.randrange(10 ** 8, 7 * 10 ** 9) for _ in range(USERS)]
+    known = user_ids[:int(USERS * (1 - UNKNOWN_USERS))]
+    cursor.executemany(
+        "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+        [(user_id, f"u{user_id}", "Test") for user_id in known]
+    )
+
+    now = datetime.now(MOSCOW_TZ).replace(tzinfo=None)
+    start = now - timedelta(days=days)
+    span = days * 86400
+
+    def actions():
+        for i in range(rows):
+            moment = start + timedelta(seconds=span * i // rows)
+            user_id = user_ids[min(int(rnd.paretovariate(1.2)) - 1, USERS - 1)] if rnd.random() > 0.01 else None
+            number_id = rnd.choice(numbers) if rnd.random() > 0.2 else None
+            question_id = questions[min(int(rnd.expovariate(0.01)), QUESTIONS - 1)] if rnd.random() > 0.5 else None
+            yield user_id, action_id, number_id, question_id, moment.strftime('%Y-%m-%d %H:%M:%S')
+
+    cursor.executemany('''
+        INSERT INTO user_actions (user_id, action_type_id, number_id, question_id, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    ''', actions())
+    conn.commit()
+    conn.close()
+    return stats_manager, user_ids
@@ -0,0 +1,99 @@
+"""
+HTTP-пулы для вызовов Bot API: отдельный пул для загрузки файлов
+"""
+
+import os
+
+import httpx
+from telegram.request import BaseRequest, HTTPXRequest, RequestData
+
+from api_accounting import ApiCallCounter, CountingRequest
+
+
+class PooledRequest(CountingRequest):
+    """CountingRequest с настраиваемым временем жизни keep-alive соединений.
+
+    HTTPXRequest не принимает keepalive_expiry, поэтому клиент httpx
+    собирается здесь целиком из своих параметров, без правки внутренних
+    аргументов PTB. Прокси и socket_options не поддерживаются.
+    """
+
+    def __init__(self, counter: ApiCallCounter, keepalive_expiry: float, connection_pool_size: int = 1,
+                 read_timeout: float = 5.0, write_timeout: float = 5.0, connect_timeout: float = 5.0,
+                 pool_timeout: float = 1.0, http_version: str = "1.1", **kwargs):
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout)
+        self.limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=connection_pool_size,
+            keepalive_expiry=keepalive_expiry,
+        )
+        super().__init__(
+            counter, connection_pool_size=connection_pool_size, read_timeout=read_timeout,
+            write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+            http_version=http_version, **kwargs,
+        )
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http1 = self.http_version == "1.1"
+        return httpx.AsyncClient(timeout=self.timeout, limits=self.limits, http1=http1, http2=not http1)
+
+
+# HTTPXRequest собирает клиент через _build_client (python-telegram-bot 21.0):
+# если хук пропадёт после обновления, пулы молча получат настройки PTB по умолчанию
+if not callable(getattr(HTTPXRequest, '_build_client', None)):
+    raise RuntimeError("HTTPXRequest._build_client не найден: проверьте версию python-telegram-bot")
+
+
+class SplitRequest(BaseRequest):
+    """Запросы с файлами идут через пул загрузок, остальные - через интерактивный пул.
+
+    Медленная загрузка инструкции не занимает соединения, нужные для
+    answer и edit_message_text. Отправка по file_id файлов не содержит
+    и идёт через интерактивный пул.
+    """
+
+    def __init__(self, interactive: BaseRequest, media: BaseRequest):
+        self.interactive = interactive
+        self.media = media
+
+    @property
+    def read_timeout(self):
+        return self.interactive.read_timeout
+
+    async def initialize(self) -> None:
+        await self.interactive.initialize()
+        await self.media.initialize()
+
+    async def shutdown(self) -> None:
+        await self.interactive.shutdown()
+        await self.media.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, **kwargs):
+        target = self.media if request_data is not None and request_data.contains_files else self.interactive
+        return await target.do_request(url, method, request_data, **kwargs)
+
+
+def build_bot_request(counter: ApiCallCounter) -> SplitRequest:
+    """Пулы и таймауты из переменных окружения; по умолчанию как в ApplicationBuilder"""
+    keepalive_expiry = float(os.getenv("BOT_KEEPALIVE", 60))
+    interactive = PooledRequest(
+        counter,
+        keepalive_expiry=keepalive_expiry,
+        connection_pool_size=int(os.getenv("BOT_POOL_SIZE", 256)),
+        connect_timeout=float(os.getenv("BOT_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.getenv("BOT_READ_TIMEOUT", 5)),
+        write_timeout=float(os.getenv("BOT_WRITE_TIMEOUT", 5)),
+        pool_timeout=float(os.getenv("BOT_POOL_TIMEOUT", 1)),
+    )
+    # Загрузок одновременно немного, и они ждут свободное соединение дольше
+    media = PooledRequest(
+        counter,
+        keepalive_expiry=keepalive_expiry,
+        connection_pool_size=int(os.getenv("BOT_MEDIA_POOL_SIZE", 4)),
+        connect_timeout=float(os.getenv("BOT_CONNECT_TIMEOUT", 5)),
+        read_timeout=float(os.getenv("BOT_MEDIA_READ_TIMEOUT", 30)),
+        write_timeout=float(os.getenv("BOT_MEDIA_WRITE_TIMEOUT", 60)),
+        media_write_timeout=float(os.getenv("BOT_MEDIA_WRITE_TIMEOUT", 60)),
+        pool_timeout=float(os.getenv("BOT_MEDIA_POOL_TIMEOUT", 30)),
+    )
+    return SplitRequest(interactive, media)
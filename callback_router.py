@@ -0,0 +1,79 @@
+"""
+Табличная маршрутизация callback_data кнопок меню
+"""
+
+import hashlib
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from deep_links import NODE_KINDS, node_code
+
+# Экран по глубине пути узла каталога
+NODE_SCREENS = {1: 'device', 2: 'model', 3: 'number', 4: 'question'}
+
+# Префикс кнопки «Назад»: тот же узел, но без записи выбора в статистику
+BACK_PREFIX = 'b'
+
+# «Назад» к выбору устройства: у корня каталога нет кода узла
+START_BACK_DATA = BACK_PREFIX + 's'
+
+
+class Route(NamedTuple):
+    screen: str
+    path: Tuple[str, ...] = ()
+    back: bool = False
+
+
+class CallbackRouter:
+    """Заранее собранная таблица callback_data -> Route по узлам каталога.
+
+    Кнопка узла кодируется как параметр deep link (m289e8a8d4d), кнопка
+    «Назад» - с префиксом "b". Разбор - один поиск в словаре, поэтому
+    подчёркивания в ключах моделей и номерах ничего не ломают, а данные,
+    которых нет в каталоге, просто не находятся. Старые форматы
+    (model_scanner_netum, question_<id>) регистрируются там же, чтобы
+    кнопки в уже отправленных сообщениях продолжали работать.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Route] = {
+            'other': Route('other'),
+            START_BACK_DATA: Route('start', back=True),
+            # Кнопки в сообщениях, отправленных до табличного роутера
+            'back_to_start': Route('start', back=True),
+        }
+
+    def add_node(self, *path: str) -> None:
+        route = Route(NODE_SCREENS[len(path)], path)
+        self._register(self.callback_data(path), route)
+        self._register(self.back_data(path), route._replace(back=True))
+
+        # Форматы callback_data до табличного роутера
+        device_type, *rest = path
+        if len(path) == 4:
+            model, number, question = rest
+            q_hash = hashlib.md5(question.encode()).hexdigest()[:8]
+            self._register(f"question_{device_type}_{model}_{number}_{q_hash}", route)
+            return
+        self._register(f"{route.screen}_{'_'.join(path)}", route)
+        back_screen = {'device': 'models', 'model': 'numbers', 'number': 'questions'}[route.screen]
+        self._register(f"back_to_{back_screen}_{'_'.join(path)}", route._replace(back=True))
+
+    def _register(self, data: str, route: Route) -> None:
+        known = self.routes.get(data)
+        if known is not None and known != route:
+            raise ValueError(f"Коллизия callback_data {data}: {known} и {route}")
+        self.routes[data] = route
+
+    @staticmethod
+    def callback_data(path: Tuple[str, ...]) -> str:
+        return NODE_KINDS[len(path)] + node_code(path)
+
+    @classmethod
+    def back_data(cls, path: Tuple[str, ...]) -> str:
+        if not path:
+            return START_BACK_DATA
+        return BACK_PREFIX + cls.callback_data(path)
+
+    def parse(self, data: str) -> Optional[Route]:
+        """Маршрут кнопки или None, если таких данных нет в каталоге"""
+        return self.routes.get(data)
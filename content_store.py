@@ -0,0 +1,141 @@
+"""
+Кэш содержимого отправляемых файлов (изображения и инструкции) в памяти
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """Время изменения и размер файла; None, если файла нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ContentStore:
+    """LRU-кэш байтов файлов с ограничением по объёму.
+
+    Небольшие файлы хранятся в памяти целиком, крупные (от mmap_threshold)
+    отображаются через mmap и не занимают кучу процесса. Промахи читаются
+    с диска в отдельном потоке, чтобы не блокировать event loop; там же
+    копируются в bytes страницы mmap при отправке. Для каждого прочитанного
+    файла запоминаются время изменения и размер: заменённый на диске файл
+    перечитывается, а подписчики invalidation_listeners узнают о замене.
+    """
+
+    def __init__(self, max_bytes: int, mmap_threshold: int):
+        self.max_bytes = max_bytes
+        self.mmap_threshold = mmap_threshold
+        self._entries: "OrderedDict[str, Union[bytes, mmap.mmap]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Версия файла при последнем чтении: (mtime_ns, размер); остаётся и после вытеснения
+        self._signatures: Dict[str, Tuple[int, int]] = {}
+        # Подписчики на замену файла на диске: callback(path)
+        self.invalidation_listeners: List[Callable[[str], None]] = []
+        self.cached_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_served = 0
+
+    async def get(self, path: str) -> bytes:
+        """Содержимое файла; FileNotFoundError, если файла нет"""
+        with tracer.span("content.get", path=path) as span:
+            data = await self._get(path)
+            if span is not None:
+                span.set_attribute('bytes', len(data))
+            return data
+
+    async def _get(self, path: str) -> bytes:
+        self.check(path)
+        entry = self._entries.get(path)
+        if entry is not None:
+            self._entries.move_to_end(path)
+            self.hits += 1
+        else:
+            self.misses += 1
+            loading = self._loading.get(path)
+            if loading is None:
+                # Одновременные промахи по одному файлу читают диск один раз
+                loading = asyncio.ensure_future(asyncio.to_thread(self._load, path))
+                self._loading[path] = loading
+                try:
+                    entry = await loading
+                finally:
+                    del self._loading[path]
+                self._put(path, entry)
+            else:
+                entry = await asyncio.shield(loading)
+
+        if isinstance(entry, bytes):
+            data = entry
+        else:
+            # Bot API принимает только bytes; копия страниц mmap и чтение с диска - не в event loop
+            data = await asyncio.to_thread(entry.__getitem__, slice(None))
+        self.bytes_served += len(data)
+        return data
+
+    def _load(self, path: str) -> Union[bytes, mmap.mmap]:
+        with tracer.span("file.open", path=path), open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self._signatures[path] = (stat.st_mtime_ns, stat.st_size)
+            if stat.st_size >= self.mmap_threshold:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return file.read()
+
+    def _put(self, path: str, entry: Union[bytes, mmap.mmap]) -> None:
+        size = len(entry)
+        if size > self.max_bytes:
+            # Файл больше всего бюджета не кэшируем, но отдаём
+            logger.warning(f"Файл {path} ({size} байт) больше бюджета кэша {self.max_bytes} байт")
+            return
+
+        while self._entries and self.cached_bytes + size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.cached_bytes -= len(evicted)
+            self.evictions += 1
+            # mmap закроется сборщиком мусора, когда на него не останется ссылок
+
+        self._entries[path] = entry
+        self.cached_bytes += size
+
+    def check(self, path: str) -> bool:
+        """False и сброс кэша, если файл изменился на диске после последнего чтения"""
+        known = self._signatures.get(path)
+        if known is None or file_signature(path) == known:
+            return True
+        logger.info(f"Файл {path} изменился на диске, кэш сброшен")
+        self.invalidate(path)
+        return False
+
+    def invalidate(self, path: str) -> None:
+        """Удаление файла из кэша (например, после замены на диске)"""
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.cached_bytes -= len(entry)
+        self._signatures.pop(path, None)
+        for listener in self.invalidation_listeners:
+            listener(path)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes_served': self.bytes_served,
+            'cached_bytes': self.cached_bytes,
+            'cached_files': len(self._entries),
+            'max_bytes': self.max_bytes,
+        }
@@ -0,0 +1,85 @@
+"""
+Подавление повторных нажатий и частых /start от одного пользователя
+"""
+
+import time
+from collections import Counter, deque
+from typing import Deque, Dict, Hashable, Set, Tuple
+
+# Повтор той же кнопки в течение этого времени после обработки отбрасывается
+DEBOUNCE_WINDOW = 1.0
+
+# Не больше START_LIMIT команд /start за START_PERIOD секунд от одного пользователя
+START_LIMIT = 3
+START_PERIOD = 30.0
+
+# При таком числе записей устаревшие удаляются, чтобы память не росла
+PRUNE_THRESHOLD = 10000
+
+
+class TapDebouncer:
+    """Учёт нажатий в обработке и недавно обработанных нажатий по пользователям"""
+
+    def __init__(self, window: float = DEBOUNCE_WINDOW,
+                 start_limit: int = START_LIMIT, start_period: float = START_PERIOD):
+        self.window = window
+        self.start_limit = start_limit
+        self.start_period = start_period
+        self._in_flight: Set[Tuple[int, Hashable]] = set()
+        self._finished: Dict[Tuple[int, Hashable], float] = {}
+        self._starts: Dict[int, Deque[float]] = {}
+        self.suppressed = Counter()
+        # Часть suppressed, уже сохранённая в статистику
+        self._saved = Counter()
+
+    def begin(self, user_id: int, key: Hashable) -> bool:
+        """False, если такое же нажатие ещё обрабатывается или только что обработано"""
+        tap = (user_id, key)
+        now = time.monotonic()
+        if tap in self._in_flight:
+            self.suppressed['in_flight'] += 1
+            return False
+        finished = self._finished.get(tap)
+        if finished is not None and now - finished < self.window:
+            self.suppressed['repeat'] += 1
+            return False
+        self._in_flight.add(tap)
+        return True
+
+    def end(self, user_id: int, key: Hashable) -> None:
+        tap = (user_id, key)
+        self._in_flight.discard(tap)
+        now = time.monotonic()
+        self._finished[tap] = now
+        if len(self._finished) > PRUNE_THRESHOLD:
+            self._finished = {
+                tap: finished for tap, finished in self._finished.items()
+                if now - finished < self.window
+            }
+
+    def take_suppressed(self) -> Counter:
+        """Подавленные события с прошлого вызова по причинам - для сохранения в статистику"""
+        fresh = self.suppressed - self._saved
+        self._saved = self.suppressed.copy()
+        return fresh
+
+    def tracked(self) -> int:
+        """Число хранимых записей о нажатиях и /start"""
+        return len(self._in_flight) + len(self._finished) + len(self._starts)
+
+    def allow_start(self, user_id: int) -> bool:
+        """Скользящее окно по командам /start пользователя"""
+        now = time.monotonic()
+        starts = self._starts.setdefault(user_id, deque())
+        while starts and now - starts[0] >= self.start_period:
+            starts.popleft()
+        if len(starts) >= self.start_limit:
+            self.suppressed['start'] += 1
+            return False
+        starts.append(now)
+        if len(self._starts) > PRUNE_THRESHOLD:
+            self._starts = {
+                user: times for user, times in self._starts.items()
+                if times and now - times[-1] < self.start_period
+            }
+        return True
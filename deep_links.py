@@ -0,0 +1,70 @@
+"""
+Компактные параметры /start (deep link) для перехода сразу к узлу каталога
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional, Tuple
+
+# Вид узла по глубине пути: устройство, модель, номер, вопрос
+NODE_KINDS = {1: 'd', 2: 'm', 3: 'n', 4: 'q'}
+
+# Длина кода узла в hex: 40 бит, коллизии проверяются при регистрации
+CODE_LENGTH = 10
+
+# Источник перехода дописывается к параметру через "_" и попадает в статистику как
+# действие deep_link_<источник>, поэтому допустимы только источники из списка;
+# остальные учитываются как other. Дополнительные - через DEEP_LINK_SOURCES="a,b"
+DEEP_LINK_SOURCES = frozenset({'box', 'inline', 'site', 'qr', 'market'} | {
+    source.strip().lower() for source in os.getenv("DEEP_LINK_SOURCES", "").split(",") if source.strip()
+})
+UNKNOWN_SOURCE = 'other'
+
+# Telegram принимает параметр /start не длиннее 64 символов из A-Za-z0-9_-
+PAYLOAD_LIMIT = 64
+
+
+def node_code(path: Tuple[str, ...]) -> str:
+    """Стабильный код узла: не меняется при добавлении других узлов в каталог"""
+    return hashlib.md5("/".join(path).encode()).hexdigest()[:CODE_LENGTH]
+
+
+class DeepLinks:
+    """Таблица параметров /start для всех узлов каталога"""
+
+    def __init__(self):
+        self.nodes: Dict[str, Tuple[str, ...]] = {}
+
+    def add(self, *path: str) -> str:
+        """Регистрация узла (device, model, number, question) и его параметр без источника"""
+        payload = NODE_KINDS[len(path)] + node_code(path)
+        known = self.nodes.get(payload)
+        if known is not None and known != path:
+            raise ValueError(f"Коллизия deep link {payload}: {known} и {path}")
+        self.nodes[payload] = path
+        return payload
+
+    def encode(self, path: Tuple[str, ...], source: Optional[str] = None) -> str:
+        payload = NODE_KINDS[len(path)] + node_code(path)
+        if source:
+            if source not in DEEP_LINK_SOURCES:
+                raise ValueError(f"Недопустимый источник deep link: {source}, "
+                                 f"допустимы: {', '.join(sorted(DEEP_LINK_SOURCES))}")
+            payload = f"{payload}_{source}"
+        return payload
+
+    def decode(self, payload: str) -> Tuple[Optional[Tuple[str, ...]], Optional[str]]:
+        """(путь узла или None, источник) по параметру /start"""
+        payload = payload[:PAYLOAD_LIMIT]
+        node, _, source = payload.partition('_')
+        path = self.nodes.get(node)
+        if path is None:
+            # Параметр без узла (например, "inline") - это только источник
+            source = payload.lower()
+        if source and source not in DEEP_LINK_SOURCES:
+            source = UNKNOWN_SOURCE
+        return path, source or None
+
+
+def link_url(bot_username: str, payload: str) -> str:
+    return f"https://t.me/{bot_username}?start={payload}"
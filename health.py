@@ -0,0 +1,191 @@
+"""
+Задержка event loop и HTTP-эндпоинт liveness/readiness для оркестратора
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Как часто event loop отмечается в мониторе, секунды
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.1))
+
+# Задержка, после которой в лог пишется стек заблокировавшего loop кода, секунды
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", 0.5))
+
+# Loop без отметок дольше этого времени считается зависшим, секунды
+LIVENESS_TIMEOUT = float(os.getenv("LIVENESS_TIMEOUT", 30))
+
+# Период проверок БД и Bot API для readiness, секунды
+READINESS_INTERVAL = float(os.getenv("READINESS_INTERVAL", 30))
+
+# Границы корзин гистограммы задержки, миллисекунды
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class LoopLagMonitor:
+    """Задержка планирования event loop: гистограмма и стек при долгой блокировке.
+
+    Корутина раз в interval отмечается в мониторе и меряет, насколько позже
+    положенного её разбудили. Сторожевой поток видит, что отметок давно не
+    было, и пишет в лог стек потока event loop - то, что его сейчас держит.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.buckets = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.max_lag_ms = 0.0
+        self.last_beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stall_logged = False
+
+    async def run(self) -> None:
+        self._loop_thread = threading.get_ident()
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - started - self.interval) * 1000)
+            self.buckets[bisect.bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            self.last_beat = time.monotonic()
+            if self._stall_logged:
+                logger.warning("Event loop освободился, задержка %.0f мс", lag_ms)
+                self._stall_logged = False
+
+    def _watchdog(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            stalled = time.monotonic() - self.last_beat
+            if stalled < self.threshold + self.interval or self._stall_logged:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._stall_logged = True
+            stack = "".join(traceback.format_stack(frame))
+            logger.warning("Event loop заблокирован %.0f мс, стек:\n%s", stalled * 1000, stack)
+
+    def beat_age(self) -> float:
+        return time.monotonic() - self.last_beat
+
+    def histogram(self) -> Dict[str, int]:
+        labels = [f"<={bound}ms" for bound in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}ms"]
+        return dict(zip(labels, self.buckets))
+
+
+def check_db_writable(db_path: str) -> None:
+    """Захват блокировки записи SQLite без изменения данных"""
+    conn = sqlite3.connect(db_path, timeout=5)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+
+
+class HealthChecks:
+    """Периодические проверки зависимостей для readiness; результат кэшируется"""
+
+    def __init__(self, checks: Dict[str, Callable[[], Awaitable[None]]], interval: float = READINESS_INTERVAL):
+        self.checks = checks
+        self.interval = interval
+        self.results: Dict[str, Dict] = {}
+        self.checked_at: Optional[float] = None
+
+    async def run(self) -> None:
+        while True:
+            results = {}
+            for name, check in self.checks.items():
+                started = time.monotonic()
+                try:
+                    await asyncio.wait_for(check(), timeout=self.interval / 2)
+                    results[name] = {'ok': True}
+                except Exception as e:
+                    results[name] = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                    logger.warning(f"Проверка готовности {name} не прошла: {e}")
+                results[name]['ms'] = round((time.monotonic() - started) * 1000, 1)
+            # Поток HTTP-сервера читает results, поэтому словарь заменяется целиком
+            self.results = results
+            self.checked_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def ready(self) -> bool:
+        # Устаревшие результаты значат, что проверки сами не выполняются
+        if self.checked_at is None or time.monotonic() - self.checked_at > 3 * self.interval:
+            return False
+        return all(result['ok'] for result in self.results.values())
+
+
+class HealthServer:
+    """HTTP /healthz и /readyz в отдельном потоке: отвечает и при зависшем event loop"""
+
+    def __init__(self, lag_monitor: LoopLagMonitor, checks: HealthChecks, host: str, port: int):
+        self.lag_monitor = lag_monitor
+        self.checks = checks
+        self.address = (host, port)
+
+    def start(self) -> bool:
+        """Запуск сервера; False, если порт занят - бот при этом продолжает работу без эндпоинта"""
+        try:
+            server = ThreadingHTTPServer(self.address, self._handler_class())
+        except OSError as e:
+            logger.error(f"Health-эндпоинт не запущен на {self.address[0]}:{self.address[1]}: {e}")
+            return False
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+        logger.info(f"Health-эндпоинт слушает {self.address[0]}:{self.address[1]}")
+        return True
+
+    def liveness(self) -> Dict:
+        age = self.lag_monitor.beat_age()
+        return {
+            'ok': age < LIVENESS_TIMEOUT,
+            'loop_beat_age_s': round(age, 3),
+            'max_lag_ms': round(self.lag_monitor.max_lag_ms, 1),
+            'lag_histogram': self.lag_monitor.histogram(),
+        }
+
+    def readiness(self) -> Dict:
+        live = self.liveness()['ok']
+        return {
+            'ok': live and self.checks.ready(),
+            'loop_alive': live,
+            'checks': self.checks.results,
+        }
+
+    def _handler_class(self):
+        health = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                routes = {'/healthz': health.liveness, '/readyz': health.readiness}
+                route = routes.get(self.path.split('?', 1)[0])
+                if route is None:
+                    self.send_error(404)
+                    return
+                result = route()
+                body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+                self.send_response(200 if result['ok'] else 503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Пробы оркестратора приходят каждые несколько секунд - в лог не пишем
+                pass
+
+        return Handler
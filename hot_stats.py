@@ -0,0 +1,131 @@
+"""
+Действия последних часов в памяти: отчёты за сегодня и за N часов без обращения к БД
+"""
+
+import os
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Сколько часов действий держится в памяти; 48 покрывают вчерашний день в 23:55
+HOT_STATS_HOURS = int(os.getenv("HOT_STATS_HOURS", 48))
+
+# Значения вместо None: id измерений начинаются с 1, user_id бывает любым неотрицательным
+NO_DIMENSION = 0
+NO_USER = -1
+
+def hour_index(timestamp: str) -> int:
+    """Номер часа от начала эпохи для 'YYYY-MM-DD HH...' без разбора через strptime"""
+    day = date(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]))
+    return day.toordinal() * 24 + int(timestamp[11:13])
+
+
+def datetime_hour_index(moment: datetime) -> int:
+    return moment.toordinal() * 24 + moment.hour
+
+
+def hour_start(index: int) -> datetime:
+    return datetime.fromordinal(index // 24) + timedelta(hours=index % 24)
+
+
+def second_of_hour(timestamp: str) -> int:
+    return int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+
+class _HourBucket:
+    """Действия одного часа в параллельных массивах"""
+
+    __slots__ = ('index', 'prefix', 'seconds', 'users', 'columns')
+
+    def __init__(self, index: int, prefix: str):
+        self.index = index
+        self.prefix = prefix
+        self.seconds = array('H')
+        self.users = array('q')
+        # Тип действия, устройство, модель, номер, вопрос
+        self.columns = [array('i') for _ in range(5)]
+
+
+class HotActionBuffer:
+    """Кольцо почасовых корзин за последние hours часов плюс текущий час.
+
+    Корзина часа переиспользует слот, когда кольцо проходит круг, поэтому
+    память ограничена действиями за окно: около 30 байт на действие без
+    объектов на каждое событие. Кольцо отвечает только за часы не раньше
+    loaded_from - момента, с которого оно заполнено из БД при запуске.
+    """
+
+    def __init__(self, hours: int = HOT_STATS_HOURS):
+        self.size = hours + 1
+        self._buckets: List[Optional[_HourBucket]] = [None] * self.size
+        self.loaded_from: Optional[int] = None
+        self.newest = 0
+
+    def add(self, timestamp: str, user_id: Optional[int], ids: Sequence[Optional[int]]) -> None:
+        index = hour_index(timestamp)
+        if index <= self.newest - self.size:
+            # Действие старше окна (например, из сегмента другого узла)
+            return
+        self.newest = max(self.newest, index)
+        slot = index % self.size
+        bucket = self._buckets[slot]
+        if bucket is None or bucket.index < index:
+            bucket = self._buckets[slot] = _HourBucket(index, timestamp[:13])
+        bucket.seconds.append(second_of_hour(timestamp))
+        bucket.users.append(NO_USER if user_id is None else user_id)
+        for column, dim_id in zip(bucket.columns, ids):
+            column.append(dim_id or NO_DIMENSION)
+
+    def mark_loaded(self, since: str) -> None:
+        """Кольцо заполнено из БД начиная с часа since"""
+        self.loaded_from = hour_index(since)
+
+    def covered_from(self, now: datetime) -> Optional[datetime]:
+        """Начало периода, за который кольцо содержит все действия"""
+        if self.loaded_from is None:
+            return None
+        first = max(self.loaded_from, datetime_hour_index(now) - self.size + 1)
+        return hour_start(first)
+
+    def covers(self, start: datetime, now: datetime) -> bool:
+        covered = self.covered_from(now)
+        return covered is not None and start >= covered
+
+    def counts(self, start: datetime, end: Optional[datetime],
+               columns: Iterable[int]) -> Tuple[int, Dict[int, Counter]]:
+        """Число действий за [start, end) и счётчики значений по колонкам.
+
+        Колонка 0 - user_id, 1-5 - тип действия, устройство, модель, номер,
+        вопрос. Полные часы считаются Counter прямо по массивам, граничные -
+        с фильтром по секундам. None в счётчиках - NO_USER и NO_DIMENSION.
+        """
+        start_index = datetime_hour_index(start)
+        start_second = start.minute * 60 + start.second
+        end_index = end_second = None
+        if end is not None:
+            end_index = datetime_hour_index(end)
+            end_second = end.minute * 60 + end.second
+
+        total = 0
+        counters = {column: Counter() for column in columns}
+        for bucket in self._buckets:
+            if bucket is None or bucket.index < start_index or (end_index is not None and bucket.index > end_index):
+                continue
+            arrays = [bucket.users, *bucket.columns]
+            low = start_second if bucket.index == start_index else 0
+            high = end_second if bucket.index == end_index else 3600
+            if low == 0 and high == 3600:
+                total += len(bucket.seconds)
+                for column, counter in counters.items():
+                    counter.update(arrays[column])
+                continue
+            selectors = [low <= second < high for second in bucket.seconds]
+            total += sum(selectors)
+            for column, counter in counters.items():
+                counter.update(compress(arrays[column], selectors))
+        return total, counters
+
+    def __len__(self) -> int:
+        return sum(len(bucket.seconds) for bucket in self._buckets if bucket is not None)
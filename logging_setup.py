@@ -0,0 +1,124 @@
+"""
+Неблокирующее логирование: очередь на стороне event loop, запись в отдельном потоке
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timezone
+from typing import Dict
+
+# Формат консоли прежний, в файл пишутся JSON-записи
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Из шумных логгеров пропускается 1 запись уровня INFO и ниже из N.
+# httpx пишет строку на каждый запрос к Bot API, включая getUpdates.
+LOG_SAMPLING = {
+    'httpx': 100,
+}
+
+# Логгер трасс из tracing.py
+TRACE_LOGGER = 'traces'
+
+# Атрибуты LogRecord, которые не относятся к полям из extra
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-запись на строку; поля из extra попадают в запись как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропуск каждой N-й записи уровня INFO и ниже от шумных логгеров"""
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.counters: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name.split('.', 1)[0])
+        if not rate:
+            return True
+        count = self.counters.get(record.name, 0)
+        self.counters[record.name] = count + 1
+        return count % rate == 0
+
+
+class ExcludeFilter(logging.Filter):
+    """Отбрасывает записи логгера name и его потомков"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not super().filter(record)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в потоке event loop.
+
+    Стандартный prepare() собирает сообщение и трассировку до постановки в
+    очередь; здесь запись уходит как есть, а %-аргументы подставляются уже
+    в потоке слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Настройка корневого логгера; файл и ротация задаются переменными окружения"""
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    log_file = os.getenv("LOG_FILE", "bot.log")
+    max_bytes = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    backups = int(os.getenv("LOG_BACKUPS", 5))
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    # Трассы (OTLP/JSON, одна трасса на строку) пишутся только в свой файл
+    trace_handler = logging.handlers.RotatingFileHandler(
+        os.getenv("TRACE_FILE", "traces.jsonl"), maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+    )
+    trace_handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_handler.addFilter(logging.Filter(TRACE_LOGGER))
+    for handler in (console, file_handler):
+        handler.addFilter(ExcludeFilter(TRACE_LOGGER))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+    logging.getLogger(TRACE_LOGGER).setLevel(logging.INFO)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, console, file_handler, trace_handler, respect_handler_level=True
+    )
+    listener.start()
+    # Оставшиеся в очереди записи дописываются при выходе
+    atexit.register(listener.stop)
+    return listener
@@ -2,6 +2,13 @@ from dotenv import load_dotenv
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InlineQueryResultCachedDocument,
+    InlineQueryResultCachedPhoto,
+    InlineQueryResultsButton,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputTextMessageContent,
     Update,
     ReplyKeyboardMarkup,
     KeyboardButton
@@ -11,12 +18,15 @@ from telegram.ext import (
     CommandHandler,
     CallbackQueryHandler,
     ContextTypes,
+    InlineQueryHandler,
     MessageHandler,
     filters
 )
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import os
+import io
+import csv
 import re
 import logging
 import hashlib
@@ -28,12 +38,26 @@ import time
 
 from statistics import StatisticsManager
 from stats_handler import StatsHandler
-
-# Настройка логгирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from search import CatalogSearch, PrefixTrie, TrieNode
+from content_store import ContentStore
+from media_pipeline import MediaPipeline, format_report
+from api_accounting import ApiCallCounter
+from bot_requests import build_bot_request
+from deep_links import DeepLinks, link_url
+from callback_router import NODE_SCREENS, CallbackRouter, Route
+from debounce import TapDebouncer
+from logging_setup import setup_logging
+from upload_queue import UploadQueue
+from tracing import trace_update, traced, tracer
+from profiler import MAX_DURATION, ProfilerBusy, SamplingProfiler, format_collapsed, format_summary
+from memory_monitor import MEMORY_SAMPLE_INTERVAL, MemoryMonitor
+from health import HealthChecks, HealthServer, LoopLagMonitor, check_db_writable
+from anomaly import ANOMALY_CHECK_INTERVAL, ANOMALY_SEED_DAYS, SpikeDetector
+from backup import BACKUP_INTERVAL_HOURS, BackupManager
+from stats_segments import STATS_EXPORT_INTERVAL, SegmentExporter, SegmentMerger
+
+# Настройка логгирования: запись в файл и консоль идёт в отдельном потоке
+setup_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv('token.env')
@@ -45,15 +69,35 @@ ADMIN_CHAT_ID = "-1003131568927"
 # ID администраторов бота
 ADMIN_IDS = [550680968, 332518486, 7068694127, 1118098514]
 
+# Telegram принимает не больше 50 результатов на inline-запрос
+INLINE_RESULTS_LIMIT = 50
+
+# Сколько секунд Telegram может кэшировать ответ на inline-запрос
+INLINE_CACHE_TIME = 300
+
+# Telegram принимает не больше 10 файлов в одной медиагруппе
+MEDIA_GROUP_LIMIT = 10
+
+# Действие для статистики при переходе вперёд на экран (кнопки «Назад» не логируются)
+SELECTED_ACTIONS = {
+    'other': 'other_selected',
+    'device': 'device_selected',
+    'model': 'model_selected',
+    'number': 'number_selected',
+    'question': 'question_selected',
+}
+
 @dataclass
 class Solution:
     text: str
-    content_type: str = "none"  # image/file
+    # image/file; вложения берутся с диска: <вопрос>.jpg и, если есть, <вопрос>_2.jpg, <вопрос>_3.jpg, ...
+    content_type: str = "none"
 
 @dataclass
 class DeviceModel:
     name: str
     numbers: List[str]
+    number_prefix: str = ""  # префикс, с которым номер пишут на коробке (XP365B)
 
 @dataclass
 class Device:
@@ -61,10 +105,41 @@ class Device:
     models: Dict[str, DeviceModel]
     common_questions: Dict[str, Solution]
 
+class MessageScreen:
+    """Экран меню в ответ на сообщение: вместо редактирования отправляется новое сообщение"""
+
+    def __init__(self, message):
+        self.message = message
+        self.from_user = message.from_user
+        self.sent = None
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        # Первый экран отправляется новым сообщением, следующие редактируют его
+        if self.sent is None:
+            self.sent = await self.message.reply_text(text=text, reply_markup=reply_markup, **kwargs)
+        else:
+            await self.sent.edit_text(text=text, reply_markup=reply_markup, **kwargs)
+        return self.sent
+
 class BotHandler:
     def __init__(self):
         self.content_base_path = os.getenv("CONTENT_BASE_PATH", "data")
+        self.content_store = ContentStore(
+            max_bytes=int(os.getenv("CONTENT_CACHE_BYTES", 32 * 1024 * 1024)),
+            mmap_threshold=int(os.getenv("CONTENT_MMAP_THRESHOLD", 1024 * 1024))
+        )
+        self.media_pipeline = MediaPipeline(self.content_base_path)
+        # Загрузки идут в фоне не более чем в столько потоков, сколько соединений в пуле загрузок
+        self.uploads = UploadQueue(workers=int(os.getenv("UPLOAD_WORKERS", os.getenv("BOT_MEDIA_POOL_SIZE", 4))))
         self.stats_manager = StatisticsManager()
+        # Сжатые снимки базы статистики, снимаются без остановки записи
+        self.backups = BackupManager(self.stats_manager.db_path)
+        # Несколько экземпляров бота: каждый выгружает свои действия в общий каталог STATS_SEGMENTS_DIR,
+        # а экземпляр с STATS_MERGE_DB сливает их в общую базу и отправляет ежедневный отчёт
+        segments_dir = os.getenv("STATS_SEGMENTS_DIR")
+        merge_db = os.getenv("STATS_MERGE_DB")
+        self.segments = SegmentExporter(self.stats_manager, segments_dir, os.getenv("NODE_ID")) if segments_dir else None
+        self.merger = SegmentMerger(StatisticsManager(merge_db), segments_dir) if segments_dir and merge_db else None
         self.devices = {
             'scanner': Device(
                 name="Сканер",
@@ -82,7 +157,7 @@ class BotHandler:
             'printer': Device(
                 name="Принтер",
                 models={
-                    'xprinter': DeviceModel(name="XPrinter", numbers=["365B", "420", "323", "58IIZ"]),
+                    'xprinter': DeviceModel(name="XPrinter", numbers=["365B", "420", "323", "58IIZ"], number_prefix="XP"),
                     'niimbot': DeviceModel(name="NIIMBOT", numbers=["B21", "D11", "D110"])
                 },
                 common_questions={
@@ -150,7 +225,35 @@ class BotHandler:
 
             'other': """           
 Пожалуйста, опишите вашу проблему нашему специалисту: @solard_chat_bot
-"""
+""",
+
+#################
+
+            'search': """
+Возможно, вам подойдёт одно из решений ниже.
+
+Если нужного нет, нажмите /start и выберите устройство из списка.
+""",
+
+#################
+
+            'search_empty': """
+К сожалению, по вашему запросу ничего не найдено.
+
+Нажмите /start и выберите устройство из списка или напишите нашему специалисту: @solard_chat_bot
+""",
+
+#################
+
+            'keyboard': "Кнопка /start внизу экрана в любой момент вернёт вас к выбору устройства.",
+
+#################
+
+            'sending': "⏳ Отправляем файл, это может занять несколько секунд...",
+
+#################
+
+            'upload_dropped': "⚠️ Не удалось отправить файл. Попробуйте ещё раз чуть позже."
 
 #################
         }
@@ -161,11 +264,53 @@ class BotHandler:
             one_time_keyboard=False
         )
 
-        # Хранилище ID вопросов (временное)
-        self.question_map = {}
-        
+        # Чаты, которым уже отправлена клавиатура /start в этом запуске бота
+        self.keyboard_chats = set()
+
+        # Учёт вызовов Bot API по действиям пользователей
+        self.api_calls = ApiCallCounter()
+
+        # Подавление повторных нажатий и частых /start
+        self.debouncer = TapDebouncer()
+
         # Инициализация обработчика статистики
         self.stats_handler = StatsHandler(self.stats_manager, self.devices)
+        
+        # Поисковый индекс по каталогу решений
+        self.search_index = self.build_search_index()
+        
+        # file_id уже загруженных в Telegram файлов (путь -> file_id) для inline-режима
+        self.file_ids = {}
+        self.file_ids_version = 0
+        self.content_store.invalidation_listeners.append(self.forget_file_id)
+        
+        # Префиксное дерево номеров устройств для inline-режима
+        self.number_trie = self.build_number_trie()
+        
+        # Параметры /start для перехода сразу к устройству, модели, номеру или решению
+        self.deep_links = self.build_deep_links()
+        
+        # Всплески обращений по номерам и вопросам; норма на старте берётся из накопленной статистики
+        self.spikes = SpikeDetector()
+        self.spikes.seed(
+            self.stats_manager.get_number_activity(get_moscow_time() - timedelta(days=ANOMALY_SEED_DAYS)),
+            hours=ANOMALY_SEED_DAYS * 24
+        )
+        self.stats_manager.action_listeners.append(self.on_action)
+        
+        # Замеры памяти и размеров структур, которые растут со временем работы
+        self.memory_monitor = MemoryMonitor(self.memory_probes())
+        
+        # Маршруты кнопок меню и обработчики экранов
+        self.callback_router = self.build_callback_router()
+        self.screens = {
+            'start': self.start_callback,
+            'other': self.show_other,
+            'device': self.show_models,
+            'model': self.show_numbers,
+            'number': self.show_questions,
+            'question': self.show_solution,
+        }
     
 
     def create_back_button(self, back_data: str) -> List[InlineKeyboardButton]:
@@ -176,7 +321,8 @@ class BotHandler:
         text = re.sub(r'[^a-zа-я0-9]+', '_', text)
         return text.strip('_')
 
-    def get_content_path(self, device_type: str, model: str, number: str, question: str, content_type: str) -> Optional[str]:
+    @traced("get_content_path")
+    def get_content_path(self, device_type: str, model: str, number: str, question: str, content_type: str, attachment: int = 1) -> Optional[str]:
         if content_type == "none":
             return None
             
@@ -184,6 +330,8 @@ class BotHandler:
         safe_model = self.sanitize_filename(model)
         safe_number = self.sanitize_filename(number)
         safe_question = self.sanitize_filename(question)
+        if attachment > 1:
+            safe_question = f"{safe_question}_{attachment}"
         
         path = os.path.join(
             self.content_base_path,
@@ -195,34 +343,244 @@ class BotHandler:
         )
         
         if not os.path.exists(path):
+            if attachment > 1:
+                # Дополнительных вложений может и не быть
+                return None
             logger.error(f"Файл не найден: {path}")  
+        elif content_type == "image":
+            # Оптимизированный вариант, если он собран для текущей версии файла
+            return self.media_pipeline.variant_for(path) or path
         
         return path
 
-    def make_question_id(self, device_type, model, number, question_text):
-        q_hash = hashlib.md5(question_text.encode()).hexdigest()[:8]
-        q_id = f"{device_type}_{model}_{number}_{q_hash}"
-        self.question_map[q_id] = (device_type, model, number, question_text)
-        return q_id
+    def get_content_paths(self, device_type: str, model: str, number: str, question: str, content_type: str) -> List[str]:
+        path = self.get_content_path(device_type, model, number, question, content_type)
+        if not path:
+            return []
+        
+        paths = [path]
+        for attachment in range(2, MEDIA_GROUP_LIMIT + 1):
+            extra_path = self.get_content_path(device_type, model, number, question, content_type, attachment)
+            if not extra_path:
+                break
+            paths.append(extra_path)
+        return paths
+
+    def build_search_index(self) -> CatalogSearch:
+        search_index = CatalogSearch()
+        for device_type, device in self.devices.items():
+            nodes = []
+            for model_key, device_model in device.models.items():
+                for number in device_model.numbers:
+                    node = (device_type, model_key, number)
+                    nodes.append(node)
+                    search_index.add_node(node, f"{device.name} {device_model.name} {number}")
+                    for question, solution in self.model_questions.get(f"{device_type}/{model_key}/{number}", {}).items():
+                        search_index.add_solution((node, question), f"{question} {solution.text}", [node])
+            for question, solution in device.common_questions.items():
+                search_index.add_solution((device_type, question), f"{question} {solution.text}", nodes)
+        search_index.build()
+        return search_index
+
+    def build_number_trie(self) -> PrefixTrie:
+        number_trie = PrefixTrie(items_limit=INLINE_RESULTS_LIMIT)
+        for device_type, device in self.devices.items():
+            for model_key, device_model in device.models.items():
+                for number in device_model.numbers:
+                    parts = number.split('/')
+                    variants = [number, *parts]
+                    if device_model.number_prefix:
+                        variants += [f"{device_model.number_prefix}{part}" for part in parts]
+                    for variant in variants:
+                        number_trie.insert(variant, (device_type, model_key, number))
+        return number_trie
+
+    def build_deep_links(self) -> DeepLinks:
+        deep_links = DeepLinks()
+        for device_type, device in self.devices.items():
+            deep_links.add(device_type)
+            for model_key, device_model in device.models.items():
+                deep_links.add(device_type, model_key)
+                for number in device_model.numbers:
+                    deep_links.add(device_type, model_key, number)
+                    for question in self.get_questions(device_type, model_key, number):
+                        deep_links.add(device_type, model_key, number, question)
+        return deep_links
+
+    def memory_probes(self) -> Dict[str, Callable[[], int]]:
+        return {
+            'content_store_bytes': lambda: self.content_store.cached_bytes,
+            'content_store_files': lambda: len(self.content_store._entries),
+            'file_ids': lambda: len(self.file_ids),
+            'keyboard_chats': lambda: len(self.keyboard_chats),
+            'debounce_entries': self.debouncer.tracked,
+            'upload_queue': lambda: self.uploads.stats()['queued'],
+            'dimension_cache': lambda: len(self.stats_manager._dimension_ids),
+            'spike_keys': self.spikes.tracked,
+            'hot_actions': lambda: len(self.stats_manager.hot),
+        }
 
-    async def send_content(self, query, solution: Solution, device_type: str, model: str, number: str, question: str) -> None:
+    def save_suppressed(self) -> None:
+        """Подавленные с прошлого сохранения нажатия и /start - итогом в статистику дня"""
+        self.stats_manager.add_suppressed(get_moscow_time().strftime('%Y-%m-%d'), self.debouncer.take_suppressed())
+
+    def on_action(self, action_type: str, device_type: Optional[str], model: Optional[str],
+                  number: Optional[str], question: Optional[str]) -> None:
+        self.spikes.observe(number, question)
+
+    def build_callback_router(self) -> CallbackRouter:
+        callback_router = CallbackRouter()
+        for path in self.deep_links.nodes.values():
+            callback_router.add_node(*path)
+        return callback_router
+
+    def get_questions(self, device_type: str, model: str, number: str) -> Dict[str, Solution]:
+        return {
+            **self.model_questions.get(f"{device_type}/{model}/{number}", {}),
+            **self.devices[device_type].common_questions
+        }
+
+    def find_solution(self, device_type: str, model: str, number: str, question: str) -> Optional[Solution]:
+        return (
+            self.model_questions.get(f"{device_type}/{model}/{number}", {}).get(question) or
+            self.devices[device_type].common_questions.get(question)
+        )
+
+    def forget_file_id(self, content_path: str) -> None:
+        """Файл заменён на диске - прежний file_id указывает на старую версию"""
+        if self.file_ids.pop(content_path, None) is not None:
+            self.file_ids_version += 1
+
+    def remember_file_id(self, content_path: str, file_id: str) -> None:
+        if self.file_ids.get(content_path) != file_id:
+            self.file_ids[content_path] = file_id
+            # Готовые inline-ответы со ссылкой на этот файл нужно пересобрать
+            self.file_ids_version += 1
+
+    def make_inline_result(self, device_type: str, model: str, number: str, question: str, solution: Solution, bot_username: str):
+        device = self.devices[device_type]
+        title = f"{device.models[model].name} {number}: {question}"
+        result_id = hashlib.md5(f"{device_type}/{model}/{number}/{question}".encode()).hexdigest()
         content_path = self.get_content_path(device_type, model, number, question, solution.content_type)
-        back_button = self.create_back_button(f"back_to_questions_{device_type}_{model}_{number}")
+        file_id = self.file_ids.get(content_path) if content_path else None
+
+        if file_id and solution.content_type == "file":
+            return InlineQueryResultCachedDocument(id=result_id, title=title, document_file_id=file_id, caption=solution.text)
+        if file_id and solution.content_type == "image":
+            return InlineQueryResultCachedPhoto(id=result_id, photo_file_id=file_id, title=title, caption=solution.text)
+
+        # Файл ещё ни разу не загружался - отправляем текст со ссылкой на бота
+        reply_markup = None
+        if content_path:
+            reply_markup = InlineKeyboardMarkup([[
+                InlineKeyboardButton(
+                    "Открыть в боте",
+                    url=link_url(bot_username, self.deep_links.encode((device_type, model, number, question), "inline"))
+                )
+            ]])
+        return InlineQueryResultArticle(
+            id=result_id,
+            title=title,
+            description=solution.text[:100],
+            input_message_content=InputTextMessageContent(f"{device.name} {title}\n\n{solution.text}"),
+            reply_markup=reply_markup
+        )
+
+    def get_inline_results(self, trie_node: TrieNode, bot_username: str) -> List:
+        # Ответ собирается один раз на префикс и пересобирается только при новых file_id
+        if trie_node.cache and trie_node.cache[0] == self.file_ids_version:
+            return trie_node.cache[1]
+
+        results = []
+        for device_type, model, number in trie_node.items:
+            for question, solution in self.get_questions(device_type, model, number).items():
+                results.append(self.make_inline_result(device_type, model, number, question, solution, bot_username))
+        results = results[:INLINE_RESULTS_LIMIT]
+
+        trie_node.cache = (self.file_ids_version, results)
+        return results
+
+    async def load_attachment(self, content_path: str):
+        # Уже загруженный в Telegram файл отправляется по file_id без повторной загрузки
+        return self.file_ids.get(content_path) or await self.content_store.get(content_path)
+
+    async def send_attachments(self, query, solution: Solution, content_paths: List[str]) -> None:
+        contents = await asyncio.gather(*(self.load_attachment(path) for path in content_paths))
+        is_image = solution.content_type == "image"
+
+        if len(content_paths) == 1:
+            content_path, content = content_paths[0], contents[0]
+            if is_image:
+                message = await query.message.reply_photo(
+                    photo=content, filename=os.path.basename(content_path), caption=solution.text
+                )
+                self.remember_file_id(content_path, message.photo[-1].file_id)
+            else:
+                message = await query.message.reply_document(
+                    document=content, filename=os.path.basename(content_path), caption=solution.text
+                )
+                self.remember_file_id(content_path, message.document.file_id)
+            return
+
+        # Несколько кодов или файлов - одним сообщением-альбомом с подписью к первому
+        media_class = InputMediaPhoto if is_image else InputMediaDocument
+        media = [
+            media_class(
+                media=content,
+                filename=os.path.basename(content_path),
+                caption=solution.text if index == 0 else None
+            )
+            for index, (content_path, content) in enumerate(zip(content_paths, contents))
+        ]
+        messages = await query.message.reply_media_group(media=media)
+        for content_path, message in zip(content_paths, messages):
+            file_id = message.photo[-1].file_id if is_image else message.document.file_id
+            self.remember_file_id(content_path, file_id)
+
+    async def send_content(self, query, solution: Solution, device_type: str, model: str, number: str, question: str) -> None:
+        content_paths = self.get_content_paths(device_type, model, number, question, solution.content_type)
+        back_button = self.create_back_button(self.callback_router.back_data((device_type, model, number)))
         reply_markup = InlineKeyboardMarkup([back_button])
+        # Меню вопросов остаётся заголовком с кнопкой «Назад» вместо удаления и отдельного текста
+        device = self.devices[device_type]
+        header = f"{device.name} {device.models[model].name} {number}. {question}"
+
+        # Заменённые на диске файлы теряют file_id и загружаются заново
+        for path in content_paths:
+            self.content_store.check(path)
+        if not content_paths or all(path in self.file_ids for path in content_paths):
+            await self.deliver_content(query, solution, content_paths, header, reply_markup)
+            return
+
+        # Новый файл: сразу показываем заглушку, загрузка идёт в фоне
+        await query.edit_message_text(text=self.messages['sending'], reply_markup=reply_markup)
 
+        async def upload():
+            with tracer.trace("upload", path=content_paths[0]), self.api_calls.action("upload"):
+                await self.deliver_content(query, solution, content_paths, header, reply_markup)
+
+        async def dropped():
+            # Загрузка отменена: заглушка не должна висеть бесконечно
+            await query.edit_message_text(text=self.messages['upload_dropped'], reply_markup=reply_markup)
+
+        # Небольшие файлы (коды сброса) обгоняют инструкции
         try:
-            if not content_path:
+            priority = sum(os.path.getsize(path) for path in content_paths)
+        except OSError:
+            priority = 0
+        if not self.uploads.submit(tuple(content_paths), priority, upload, dropped):
+            logger.warning("Очередь загрузок заполнена, файл отправляется в обработчике")
+            await self.deliver_content(query, solution, content_paths, header, reply_markup)
+
+    async def deliver_content(self, query, solution: Solution, content_paths: List[str], header: str, reply_markup) -> None:
+        content_path = content_paths[0] if content_paths else None
+
+        try:
+            if not content_paths:
                 await query.edit_message_text(text=solution.text, reply_markup=reply_markup)
-            elif solution.content_type == "image":
-                with open(content_path, 'rb') as photo:
-                    await query.message.reply_photo(photo=photo, reply_markup=self.reply_keyboard)
-                await query.message.reply_text(text=solution.text, reply_markup=reply_markup)
-                await query.delete_message()
-            elif solution.content_type == "file":
-                with open(content_path, 'rb') as file:
-                    await query.message.reply_document(document=file, reply_markup=self.reply_keyboard)
-                await query.message.reply_text(text=solution.text, reply_markup=reply_markup)
-                await query.delete_message()
+            else:
+                await self.send_attachments(query, solution, content_paths)
+                await query.edit_message_text(text=header, reply_markup=reply_markup)
         except FileNotFoundError:
             error_msg = (
                 f"{solution.text}\n\n"
@@ -252,6 +610,10 @@ class BotHandler:
         
         user = update.message.from_user
         
+        if not self.debouncer.allow_start(user.id):
+            # Учитывается только счётчиком в debouncer, в БД - итогом за день
+            return
+        
         # Обновляем информацию о пользователе
         self.stats_manager.update_user_info(
             user_id=user.id,
@@ -260,99 +622,139 @@ class BotHandler:
             last_name=user.last_name
         )
         
+        # Параметр deep link: узел каталога и источник перехода (коробка, inline, сайт)
+        path, source = self.deep_links.decode(context.args[0]) if context.args else (None, None)
+        
         # Логируем действие
-        self.stats_manager.log_action(user.id, "start")
-            
-        device_buttons = [
-            [
-                InlineKeyboardButton("Сканер", callback_data="device_scanner"),
-                InlineKeyboardButton("Принтер", callback_data="device_printer")
-            ],
-            [
-                InlineKeyboardButton("Пейджеры", callback_data="device_pager"),
-                InlineKeyboardButton("Другое", callback_data="other")
-            ]
-        ]
+        if path or source:
+            # Ссылка без источника - просто deep_link
+            action = f"deep_link_{source}" if source else "deep_link"
+            self.stats_manager.log_action(user.id, action, *(path or ()))
+        else:
+            self.stats_manager.log_action(user.id, "start")
         
-        await update.message.reply_text(
-            text=self.messages['start'],
-            reply_markup=InlineKeyboardMarkup(device_buttons)
+        with self.api_calls.action("start"):
+            if path:
+                await self.open_node(MessageScreen(update.message), path)
+            else:
+                await update.message.reply_text(text=self.messages['start'], reply_markup=self.start_markup())
+
+            # Клавиатура постоянная, поэтому достаточно отправить её один раз
+            chat_id = update.message.chat_id
+            if chat_id not in self.keyboard_chats:
+                await update.message.reply_text(self.messages['keyboard'], reply_markup=self.reply_keyboard)
+                self.keyboard_chats.add(chat_id)
+
+    async def open_node(self, query, path: tuple) -> None:
+        """Экран узла каталога по пути из deep link"""
+        await self.screens[NODE_SCREENS[len(path)]](query, *path)
+
+    async def handle_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not update.message or not update.message.text:
+            return
+
+        user_id = update.message.from_user.id
+        self.stats_manager.log_action(user_id, "search")
+
+        results = self.search_index.search(update.message.text)
+        if not results:
+            with self.api_calls.action("search"):
+                await update.message.reply_text(text=self.messages['search_empty'], reply_markup=self.reply_keyboard)
+            self.keyboard_chats.add(update.message.chat_id)
+            return
+
+        result_buttons = []
+        for (device_type, model, number), (_, question), _ in results:
+            label = f"{self.devices[device_type].models[model].name} {number}: {question}"
+            callback_data = self.callback_router.callback_data((device_type, model, number, question))
+            result_buttons.append([InlineKeyboardButton(label[:64], callback_data=callback_data)])
+
+        with self.api_calls.action("search"):
+            await update.message.reply_text(
+                text=self.messages['search'],
+                reply_markup=InlineKeyboardMarkup(result_buttons)
+            )
+
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        inline_query = update.inline_query
+        if not inline_query:
+            return
+
+        trie_node = self.number_trie.find(inline_query.query)
+        results = self.get_inline_results(trie_node, context.bot.username) if trie_node else []
+
+        await inline_query.answer(
+            results,
+            cache_time=INLINE_CACHE_TIME,
+            button=InlineQueryResultsButton(text="Открыть бота", start_parameter="inline")
         )
-        
-        await update.message.reply_text(" ", reply_markup=self.reply_keyboard)
 
     async def handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         query = update.callback_query
-        await query.answer()
-        data = query.data
         user_id = query.from_user.id
 
-        if data == "other":
-            self.stats_manager.log_action(user_id, "other_selected")
-            await query.edit_message_text(text=self.messages['other'], reply_markup=None)
-        elif data.startswith("back_to_"):
-            await self.handle_back(query, data)
-        elif data.startswith("device_"):
-            device_type = data.split("_")[1]
-            self.stats_manager.log_action(user_id, "device_selected", device_type=device_type)
-            await self.show_models(query, device_type)
-        elif data.startswith("model_"):
-            _, device_type, model = data.split("_")
-            self.stats_manager.log_action(user_id, "model_selected", device_type=device_type, model=model)
-            await self.show_numbers(query, device_type, model)
-        elif data.startswith("number_"):
-            _, device_type, model, number = data.split("_")
-            self.stats_manager.log_action(user_id, "number_selected", device_type=device_type, model=model, number=number)
-            await self.show_questions(query, device_type, model, number)
-        elif data.startswith("question_"):
-            await self.process_question(query, data)
-                
-        await context.bot.send_message(chat_id=query.message.chat_id, text=" ", reply_markup=self.reply_keyboard)
-
-    async def handle_back(self, query, data: str) -> None:
-        back_type = data.split("_")[2]
-        if back_type == "start":
-            await self.start_callback(query)
-        elif back_type == "models":
-            device_type = data.split("_")[3]
-            await self.show_models(query, device_type)
-        elif back_type == "numbers":
-            _, _, _, device_type, model = data.split("_")
-            await self.show_numbers(query, device_type, model)
-        elif back_type == "questions":
-            _, _, _, device_type, model, number = data.split("_")
-            await self.show_questions(query, device_type, model, number)
+        # Повторное нажатие той же кнопки: только убираем часики на кнопке
+        if not self.debouncer.begin(user_id, query.data):
+            with self.api_calls.action("suppressed"):
+                await query.answer()
+            return
 
-    async def start_callback(self, query) -> None:
-        device_buttons = [
+        route = self.callback_router.parse(query.data)
+        action = "question" if route and route.screen == "question" else "navigation"
+        try:
+            with self.api_calls.action(action):
+                await query.answer()
+                if route is None:
+                    # Кнопка узла, которого больше нет в каталоге
+                    logger.warning("Неизвестные callback_data: %s", query.data)
+                    await self.start_callback(query)
+                    return
+                await self.route_callback(query, route)
+        finally:
+            self.debouncer.end(user_id, query.data)
+
+    async def route_callback(self, query, route: Route) -> None:
+        if not route.back and route.screen in SELECTED_ACTIONS:
+            self.stats_manager.log_action(query.from_user.id, SELECTED_ACTIONS[route.screen], *route.path)
+        await self.screens[route.screen](query, *route.path)
+
+    def start_markup(self) -> InlineKeyboardMarkup:
+        device_data = self.callback_router.callback_data
+        return InlineKeyboardMarkup([
             [
-                InlineKeyboardButton("Сканер", callback_data="device_scanner"),
-                InlineKeyboardButton("Принтер", callback_data="device_printer")
+                InlineKeyboardButton("Сканер", callback_data=device_data(("scanner",))),
+                InlineKeyboardButton("Принтер", callback_data=device_data(("printer",)))
             ],
             [
-                InlineKeyboardButton("Пейджеры", callback_data="device_pager"),
+                InlineKeyboardButton("Пейджеры", callback_data=device_data(("pager",))),
                 InlineKeyboardButton("Другое", callback_data="other")
             ]
-        ]
-        await query.edit_message_text(text=self.messages['start'], reply_markup=InlineKeyboardMarkup(device_buttons))
+        ])
+
+    async def start_callback(self, query) -> None:
+        await query.edit_message_text(text=self.messages['start'], reply_markup=self.start_markup())
+
+    async def show_other(self, query) -> None:
+        await query.edit_message_text(text=self.messages['other'], reply_markup=None)
 
     async def show_models(self, query, device_type: str) -> None:
         device = self.devices[device_type]
         models = list(device.models.items())
         
+        model_data = self.callback_router.callback_data
         model_buttons = [
             [
-                InlineKeyboardButton(model1.name, callback_data=f"model_{device_type}_{model_key1}"),
-                InlineKeyboardButton(model2.name, callback_data=f"model_{device_type}_{model_key2}")
+                InlineKeyboardButton(model1.name, callback_data=model_data((device_type, model_key1))),
+                InlineKeyboardButton(model2.name, callback_data=model_data((device_type, model_key2)))
             ]
             for (model_key1, model1), (model_key2, model2) in zip(models[::2], models[1::2])
         ]
         
         if len(models) % 2 != 0:
             model_key, model = models[-1]
-            model_buttons.append([InlineKeyboardButton(model.name, callback_data=f"model_{device_type}_{model_key}")])
+            model_buttons.append([InlineKeyboardButton(model.name, callback_data=model_data((device_type, model_key)))])
         
-        model_buttons.append(self.create_back_button("back_to_start"))
+        model_buttons.append(self.create_back_button(self.callback_router.back_data(())))
         
         await query.edit_message_text(
             text=f"{device.name}. {self.messages['model']}",
@@ -362,11 +764,11 @@ class BotHandler:
     async def show_numbers(self, query, device_type: str, model: str) -> None:
         numbers = self.devices[device_type].models[model].numbers
         number_buttons = [
-            [InlineKeyboardButton(num, callback_data=f"number_{device_type}_{model}_{num}")]
+            [InlineKeyboardButton(num, callback_data=self.callback_router.callback_data((device_type, model, num)))]
             for num in numbers
         ]
         
-        number_buttons.append(self.create_back_button(f"back_to_models_{device_type}"))
+        number_buttons.append(self.create_back_button(self.callback_router.back_data((device_type,))))
         
         await query.edit_message_text(
             text=f"{self.devices[device_type].name} {self.devices[device_type].models[model].name}. {self.messages['number']}",
@@ -374,68 +776,43 @@ class BotHandler:
         )
 
     async def show_questions(self, query, device_type: str, model: str, number: str) -> None:
-        model_key = f"{device_type}/{model}/{number}"
-        questions = {
-            **self.model_questions.get(model_key, {}),
-            **self.devices[device_type].common_questions
-        }
+        questions = self.get_questions(device_type, model, number)
         
         question_list = list(questions.keys())
         question_buttons = []
 
+        question_data = self.callback_router.callback_data
+
         for q1, q2 in zip(question_list[::2], question_list[1::2]):
-            q1_id = self.make_question_id(device_type, model, number, q1)
-            q2_id = self.make_question_id(device_type, model, number, q2)
             question_buttons.append([
-                InlineKeyboardButton(q1[:64], callback_data=f"question_{q1_id}"),
-                InlineKeyboardButton(q2[:64], callback_data=f"question_{q2_id}")
+                InlineKeyboardButton(q1[:64], callback_data=question_data((device_type, model, number, q1))),
+                InlineKeyboardButton(q2[:64], callback_data=question_data((device_type, model, number, q2)))
             ])
 
         if len(question_list) % 2 != 0:
             last_question = question_list[-1]
-            last_id = self.make_question_id(device_type, model, number, last_question)
             question_buttons.append([
-                InlineKeyboardButton(last_question[:64], callback_data=f"question_{last_id}")
+                InlineKeyboardButton(last_question[:64], callback_data=question_data((device_type, model, number, last_question)))
             ])
         
-        question_buttons.append(self.create_back_button(f"back_to_numbers_{device_type}_{model}"))
+        question_buttons.append(self.create_back_button(self.callback_router.back_data((device_type, model))))
         
         await query.edit_message_text(
             text=f"{self.devices[device_type].name} {self.devices[device_type].models[model].name} {number}. {self.messages['questions']}",
             reply_markup=InlineKeyboardMarkup(question_buttons)
         )
 
-    async def process_question(self, query, callback_data: str) -> None:
-        _, q_id = callback_data.split("_", 1)
-        user_id = query.from_user.id
-
-        if q_id not in self.question_map:
-            await query.edit_message_text("Решение не найдено", reply_markup=self.reply_keyboard)
-            return
-
-        device_type, model, number, question_text = self.question_map.pop(q_id)  # pop удаляет после использования
-        model_key = f"{device_type}/{model}/{number}"
-
-        # Логируем выбор вопроса
-        self.stats_manager.log_action(
-            user_id, 
-            "question_selected", 
-            device_type=device_type, 
-            model=model, 
-            number=number, 
-            question=question_text
-        )
-
-        solution = (
-            self.model_questions.get(model_key, {}).get(question_text) or
-            self.devices[device_type].common_questions.get(question_text)
-        )
+    async def show_solution(self, query, device_type: str, model: str, number: str, question: str) -> None:
+        solution = self.find_solution(device_type, model, number, question)
 
         if not solution:
-            await query.edit_message_text("Решение не найдено", reply_markup=self.reply_keyboard)
+            await query.edit_message_text(
+                "Решение не найдено",
+                reply_markup=InlineKeyboardMarkup([self.create_back_button(self.callback_router.back_data(()))])
+            )
             return
 
-        await self.send_content(query, solution, device_type, model, number, question_text)
+        await self.send_content(query, solution, device_type, model, number, question)
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.error(f"Ошибка: {context.error}")
@@ -462,6 +839,276 @@ async def test_daily_stats_command(update: Update, context: ContextTypes.DEFAULT
         logger.error(f"Ошибка при тестировании статистики: {e}")
         await update.message.reply_text(f"❌ Ошибка при тестировании: {str(e)}")
 
+async def content_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда для просмотра статистики кэша файлов"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    bot_handler = context.bot_data['bot_handler']
+    stats = bot_handler.content_store.stats()
+    requests_total = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / requests_total * 100 if requests_total else 0
+    
+    message = "🗂 <b>Кэш файлов</b>\n\n"
+    message += f"• Попаданий: {stats['hits']} ({hit_rate:.1f}%)\n"
+    message += f"• Промахов: {stats['misses']}\n"
+    message += f"• Вытеснений: {stats['evictions']}\n"
+    message += f"• Отдано: {stats['bytes_served'] / 1024 / 1024:.1f} МБ\n"
+    message += f"• В кэше: {stats['cached_files']} файлов, {stats['cached_bytes'] / 1024 / 1024:.1f} из {stats['max_bytes'] / 1024 / 1024:.1f} МБ\n"
+    
+    uploads = bot_handler.uploads.stats()
+    message += "\n📤 <b>Фоновые загрузки</b>\n\n"
+    message += f"• В очереди: {uploads['queued']}, загружается: {uploads['in_progress']}\n"
+    message += f"• Всего: {uploads['submitted']}, объединено повторов: {uploads['deduplicated']}, ошибок: {uploads['failed']}, отменено: {uploads['dropped']}\n"
+    
+    await update.message.reply_text(message, parse_mode='HTML')
+
+async def api_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда для просмотра числа вызовов Bot API на действие"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    bot_handler = context.bot_data['bot_handler']
+    stats = bot_handler.api_calls.stats()
+    
+    message = "📡 <b>Вызовы Bot API</b>\n\n"
+    for name, data in sorted(stats.items()):
+        message += f"<b>{name}</b>: {data['calls']} вызовов"
+        if data['per_action'] is not None:
+            message += f", {data['per_action']:.2f} на действие (бюджет {data['budget']}, превышений {data['over_budget']})"
+        message += "\n"
+        methods = ", ".join(f"{method} {count}" for method, count in data['methods'].items())
+        message += f"  {methods}\n"
+    if not stats:
+        message += "Вызовов пока не было\n"
+    
+    suppressed = bot_handler.debouncer.suppressed
+    message += f"\n🚫 Подавлено: повторных нажатий {suppressed['repeat']}, во время обработки {suppressed['in_flight']}, /start {suppressed['start']}\n"
+    
+    await update.message.reply_text(message, parse_mode='HTML')
+
+async def deep_links_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда для выгрузки deep link (и содержимого QR-кодов) по всем узлам каталога"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    # Источник попадает в статистику как действие deep_link_<источник>
+    source = context.args[0].lower() if context.args else "box"
+    bot_handler = context.bot_data['bot_handler']
+    
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(["Устройство", "Модель", "Номер", "Вопрос", "Параметр", "Ссылка"])
+    try:
+        for path in bot_handler.deep_links.nodes.values():
+            payload = bot_handler.deep_links.encode(path, source)
+            writer.writerow([*path, *[""] * (4 - len(path)), payload, link_url(context.bot.username, payload)])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
+        return
+    
+    await update.message.reply_document(
+        document=output.getvalue().encode('utf-8-sig'),
+        filename=f"deep_links_{source}.csv",
+        caption=f"🔗 Ссылок: {len(bot_handler.deep_links.nodes)}, источник: {source}"
+    )
+
+# Один профилировщик на процесс: одновременно идёт не больше одного запуска
+profiler = SamplingProfiler()
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда для профилирования бота в течение N секунд"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    if profiler.running:
+        await update.message.reply_text("⏳ Профилирование уже запущено")
+        return
+    
+    try:
+        duration = float(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text(f"Использование: /profileb1 [секунд, до {MAX_DURATION}]")
+        return
+    duration = max(1, min(duration, MAX_DURATION))
+    
+    await update.message.reply_text(f"🔬 Профилирование на {duration:g} с...")
+    
+    # Выборки снимает отдельный поток, event loop в это время обслуживает обновления
+    try:
+        stacks, rounds = await asyncio.to_thread(profiler.run, duration)
+    except ProfilerBusy:
+        # Другая /profileb1 успела запустить профилировщик после проверки running
+        await update.message.reply_text("⏳ Профилирование уже запущено")
+        return
+    if not stacks:
+        await update.message.reply_text("❌ Не удалось снять ни одной выборки")
+        return
+    
+    # Оба файла одним сообщением: collapsed-стеки для flamegraph и сводка по функциям
+    stamp = get_moscow_time().strftime('%Y%m%d_%H%M%S')
+    await update.message.reply_media_group(media=[
+        InputMediaDocument(media=format_collapsed(stacks).encode('utf-8'), filename=f"profile_{stamp}.collapsed"),
+        InputMediaDocument(media=format_summary(stacks, rounds).encode('utf-8'), filename=f"profile_{stamp}_top.txt"),
+    ])
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда для просмотра памяти: /memb1, /memb1 start | diff | stop для снимков tracemalloc"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    monitor = context.bot_data['bot_handler'].memory_monitor
+    subcommand = context.args[0] if context.args else None
+    
+    if subcommand == "start":
+        await asyncio.to_thread(monitor.start_tracing)
+        await update.message.reply_text("🔬 tracemalloc включён, базовый снимок сделан. Сравнение: /memb1 diff")
+        return
+    if subcommand == "stop":
+        monitor.stop_tracing()
+        await update.message.reply_text("⏹ tracemalloc выключен")
+        return
+    if subcommand == "diff":
+        try:
+            diff = await asyncio.to_thread(monitor.snapshot_diff)
+        except RuntimeError:
+            await update.message.reply_text("❌ Сначала включите tracemalloc: /memb1 start")
+            return
+        await update.message.reply_document(
+            document=diff.encode('utf-8'),
+            filename=f"memory_diff_{get_moscow_time().strftime('%Y%m%d_%H%M%S')}.txt"
+        )
+        return
+    
+    # Внеплановый замер не попадает в окно, иначе он искажает оценку роста
+    rss, sizes = monitor.measure()
+    message = "🧠 <b>Память</b>\n\n"
+    message += f"• RSS: {rss / 1024 / 1024:.1f} МБ\n"
+    message += f"• Рост RSS: {monitor.rss_slope() / 1024 / 1024:.2f} МБ/ч за {monitor.window_seconds() / 3600:.1f} ч\n\n"
+    slopes = monitor.probe_slopes()
+    for name, size in sizes.items():
+        message += f"• {name}: {size} ({slopes.get(name, 0):+.0f}/ч)\n"
+    
+    await update.message.reply_text(message, parse_mode='HTML')
+
+async def memory_monitor_job(application) -> None:
+    """Периодические замеры памяти и предупреждение в админский чат о быстром росте"""
+    monitor = application.bot_data['bot_handler'].memory_monitor
+    while True:
+        await asyncio.sleep(MEMORY_SAMPLE_INTERVAL)
+        try:
+            monitor.sample()
+            alert = monitor.check()
+            if alert:
+                logger.warning(f"Рост памяти: {alert}")
+                await application.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"⚠️ Рост памяти\n\n{alert}")
+        except Exception as e:
+            logger.error(f"Ошибка мониторинга памяти: {e}")
+
+async def anomaly_job(application) -> None:
+    """Отправка найденных всплесков обращений в админский чат"""
+    spikes = application.bot_data['bot_handler'].spikes
+    while True:
+        await asyncio.sleep(ANOMALY_CHECK_INTERVAL)
+        alerts = spikes.drain()
+        if not alerts:
+            continue
+        text = "📈 Всплеск обращений\n\n" + "\n".join(alerts)
+        logger.warning(text)
+        try:
+            await application.bot.send_message(chat_id=ADMIN_CHAT_ID, text=text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить предупреждение о всплеске: {e}")
+
+async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Резервная копия базы статистики: /backupb1 - снять сейчас, /backupb1 verify [файл] - проверить восстановление"""
+    if not update.message:
+        return
+    
+    if update.message.from_user.id not in ADMIN_IDS:
+        await update.message.reply_text("❌ У вас нет прав для выполнения этой команды.")
+        return
+    
+    backups = context.bot_data['bot_handler'].backups
+    
+    if context.args and context.args[0] == "verify":
+        name = context.args[1] if len(context.args) > 1 else None
+        try:
+            result = await asyncio.to_thread(backups.verify, name)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Проверка не прошла: {e}")
+            return
+        message = f"✅ <b>{result['file']}</b> восстанавливается\n\n"
+        message += f"• SHA-256: <code>{result['sha256']}</code>\n"
+        for table, rows in result['rows'].items():
+            message += f"• {table}: {rows}\n"
+        await update.message.reply_text(message, parse_mode='HTML')
+        return
+    
+    await update.message.reply_text("💾 Снимаю резервную копию...")
+    try:
+        result = await asyncio.to_thread(backups.create)
+    except Exception as e:
+        logger.error(f"Ошибка резервного копирования: {e}")
+        await update.message.reply_text(f"❌ Ошибка резервного копирования: {e}")
+        return
+    
+    message = f"💾 <b>{result['file']}</b>\n\n"
+    message += f"• Размер: {result['raw_bytes'] / 1024 / 1024:.1f} МБ, сжато {result['compressed_bytes'] / 1024 / 1024:.1f} МБ\n"
+    message += f"• Шагов: {result['steps']}, перезапусков: {result['restarts']}, {result['seconds']} с\n"
+    message += f"• Удалено старых: {len(result['removed'])}, хранится: {len(backups.snapshots())}\n"
+    await update.message.reply_text(message, parse_mode='HTML')
+
+async def backup_job(application) -> None:
+    """Резервная копия раз в BACKUP_INTERVAL_HOURS; отсчёт идёт от последнего снимка, а не от запуска"""
+    backups = application.bot_data['bot_handler'].backups
+    interval = BACKUP_INTERVAL_HOURS * 3600
+    while True:
+        since_last = backups.seconds_since_last()
+        await asyncio.sleep(max(0.0, interval - since_last) if since_last is not None else 0.0)
+        try:
+            await asyncio.to_thread(backups.create)
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования: {e}")
+            try:
+                await application.bot.send_message(chat_id=ADMIN_CHAT_ID, text=f"❌ Ошибка резервного копирования: {e}")
+            except Exception as notify_err:
+                logger.error(f"Не удалось отправить сообщение об ошибке администратору: {notify_err}")
+            # Следующая попытка через час, а не сразу
+            await asyncio.sleep(3600)
+
+async def segment_export_job(application) -> None:
+    """Периодическая выгрузка действий узла в сегменты и слияние сегментов на узле слияния"""
+    bot_handler = application.bot_data['bot_handler']
+    while True:
+        await asyncio.sleep(STATS_EXPORT_INTERVAL)
+        try:
+            await asyncio.to_thread(bot_handler.segments.export)
+            if bot_handler.merger:
+                await asyncio.to_thread(bot_handler.merger.merge)
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки или слияния сегментов статистики: {e}")
+
 def get_moscow_time():
     """Получение текущего времени в МСК"""
     moscow_tz = pytz.timezone('Europe/Moscow')
@@ -475,15 +1122,33 @@ async def daily_stats_job(context: ContextTypes.DEFAULT_TYPE):
             logger.error("BotHandler не найден в bot_data")
             return
             
+        stats_manager = bot_handler.stats_manager
+        bot_handler.save_suppressed()
+        if bot_handler.segments:
+            await asyncio.to_thread(bot_handler.segments.export)
+            if not bot_handler.merger:
+                # Отчёт по всем узлам отправляет экземпляр, который их сливает
+                logger.info("Действия выгружены в сегменты, ежедневный отчёт отправит узел слияния")
+                return
+            await asyncio.to_thread(bot_handler.merger.merge)
+            stats_manager = bot_handler.merger.stats_manager
+            
         moscow_time = get_moscow_time()
         logger.info(f"Начинаем отправку ежедневной статистики... Время МСК: {moscow_time.strftime('%Y-%m-%d %H:%M:%S')}")
         
         # Получаем статистику за текущий день (по МСК)
         today = moscow_time.strftime('%Y-%m-%d')
-        stats = bot_handler.stats_manager.get_daily_stats(today)
+        stats = stats_manager.get_daily_stats(today)
         
         # Сохраняем статистику
-        bot_handler.stats_manager.save_daily_stats(today, stats)
+        stats_manager.save_daily_stats(today, stats)
+        
+        # Пересохраняем вчерашний снимок: в 23:55 он не видел последних минут дня
+        yesterday = (moscow_time - timedelta(days=1)).strftime('%Y-%m-%d')
+        stats_manager.save_daily_stats(yesterday, stats_manager.get_daily_stats(yesterday))
+        
+        # Подавленные нажатия хранятся в базе узла и в сегменты не выгружаются
+        stats['suppressed'] = bot_handler.stats_manager.get_suppressed(today)
         
         # Форматируем сообщение
         message = bot_handler.stats_handler.format_stats_message(stats)
@@ -552,24 +1217,90 @@ async def post_init(application) -> None:
     """Захватываем главный event loop и запускаем планировщик"""
     loop = asyncio.get_running_loop()
     start_scheduler(application, loop)
+    application.bot_data['bot_handler'].uploads.start()
+    application.bot_data['bot_handler'].memory_monitor.sample()
+    application.create_task(memory_monitor_job(application))
+    application.create_task(anomaly_job(application))
+    application.create_task(backup_job(application))
+    if application.bot_data['bot_handler'].segments:
+        application.create_task(segment_export_job(application))
+    application.create_task(refresh_media(application))
+    application.create_task(warm_analytics(application))
+    start_health(application)
+
+def start_health(application) -> None:
+    """Замер задержки event loop, проверки готовности и HTTP /healthz, /readyz"""
+    bot_handler = application.bot_data['bot_handler']
+    lag_monitor = LoopLagMonitor()
+    application.create_task(lag_monitor.run())
+    
+    checks = HealthChecks({
+        'database': lambda: asyncio.to_thread(check_db_writable, bot_handler.stats_manager.db_path),
+        'bot_api': application.bot.get_me,
+    })
+    application.create_task(checks.run())
+    
+    # HEALTH_PORT=0 отключает HTTP-эндпоинт, замеры при этом продолжаются
+    port = int(os.getenv("HEALTH_PORT", 8080))
+    if port:
+        HealthServer(lag_monitor, checks, os.getenv("HEALTH_HOST", "127.0.0.1"), port).start()
+
+async def post_stop(application) -> None:
+    """Остановка воркеров фоновой загрузки, пока бот ещё может исправить заглушки"""
+    await application.bot_data['bot_handler'].uploads.stop()
+
+async def post_shutdown(application) -> None:
+    """Сохранение счётчиков подавленных нажатий"""
+    application.bot_data['bot_handler'].save_suppressed()
+
+async def refresh_media(application) -> None:
+    """Пересборка оптимизированных изображений для новых и изменённых файлов"""
+    bot_handler = application.bot_data['bot_handler']
+    try:
+        report = await asyncio.to_thread(bot_handler.media_pipeline.refresh)
+        if report:
+            logger.info(f"Оптимизированы изображения:\n{format_report(report)}")
+    except ImportError:
+        logger.warning("Pillow не установлен, изображения отправляются без оптимизации")
+    except Exception as e:
+        logger.error(f"Ошибка при оптимизации изображений: {e}")
+
+async def warm_analytics(application) -> None:
+    """Загрузка истории действий в колоночный кэш до первого отчёта за неделю или месяц"""
+    stats_manager = application.bot_data['bot_handler'].stats_manager
+    added = await asyncio.to_thread(stats_manager.refresh_analytics)
+    if added:
+        logger.info(f"Колоночный кэш статистики: загружено {added} действий")
 
 
 def main() -> None:
     bot_handler = BotHandler()
-    application = Application.builder().token(TOKEN).post_init(post_init).job_queue(None).build()
+    # Загрузки файлов идут через отдельный пул и не задерживают answer и edit_message_text
+    request = build_bot_request(bot_handler.api_calls)
+    application = Application.builder().token(TOKEN).request(request).post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown).job_queue(None).build()
     
     # Сохраняем экземпляр бота в bot_data для доступа из задач
     application.bot_data['bot_handler'] = bot_handler
     
     application.add_error_handler(error_handler)
-    application.add_handler(CommandHandler("start", bot_handler.start))
-    application.add_handler(CommandHandler("statsb1", bot_handler.stats_handler.stats_command))
-    application.add_handler(CommandHandler("mystatsb1", bot_handler.stats_handler.user_stats_command))
-    application.add_handler(CommandHandler("weekstatsb1", bot_handler.stats_handler.weekly_stats_command))
-    application.add_handler(CommandHandler("monthstatsb1", bot_handler.stats_handler.monthly_stats_command))
-    application.add_handler(CommandHandler("teststatsb1", test_daily_stats_command))
-    application.add_handler(CallbackQueryHandler(bot_handler.handle_callback))
-    application.add_handler(MessageHandler(filters.Text(["/start"]), bot_handler.start))
+    # Каждое обновление обрабатывается в своей трассе (см. tracing.py)
+    application.add_handler(CommandHandler("start", trace_update(bot_handler.start)))
+    application.add_handler(CommandHandler("statsb1", trace_update(bot_handler.stats_handler.stats_command)))
+    application.add_handler(CommandHandler("mystatsb1", trace_update(bot_handler.stats_handler.user_stats_command)))
+    application.add_handler(CommandHandler("weekstatsb1", trace_update(bot_handler.stats_handler.weekly_stats_command)))
+    application.add_handler(CommandHandler("monthstatsb1", trace_update(bot_handler.stats_handler.monthly_stats_command)))
+    application.add_handler(CommandHandler("statsrangeb1", trace_update(bot_handler.stats_handler.range_stats_command)))
+    application.add_handler(CommandHandler("teststatsb1", trace_update(test_daily_stats_command)))
+    application.add_handler(CommandHandler("cachestatsb1", trace_update(content_stats_command)))
+    application.add_handler(CommandHandler("apistatsb1", trace_update(api_stats_command)))
+    application.add_handler(CommandHandler("deeplinksb1", trace_update(deep_links_command)))
+    application.add_handler(CommandHandler("profileb1", trace_update(profile_command)))
+    application.add_handler(CommandHandler("memb1", trace_update(memory_command)))
+    application.add_handler(CommandHandler("backupb1", trace_update(backup_command)))
+    application.add_handler(CallbackQueryHandler(trace_update(bot_handler.handle_callback)))
+    application.add_handler(InlineQueryHandler(trace_update(bot_handler.handle_inline_query)))
+    application.add_handler(MessageHandler(filters.Text(["/start"]), trace_update(bot_handler.start)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, trace_update(bot_handler.handle_text)))
     
     logger.info("Бот запущен с интегрированным планировщиком ежедневной статистики...")
     application.run_polling()
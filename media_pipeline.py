@@ -0,0 +1,253 @@
+"""
+Подготовка оптимизированных вариантов изображений для отправки в Telegram
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Telegram всё равно пережимает фото до 1280 пикселей по длинной стороне
+MAX_SIDE = 1280
+
+# Высокое качество и 4:4:4 сохраняют резкие края штрихкодов
+JPEG_QUALITY = 90
+
+# Допустимое расхождение каналов, при котором изображение считается серым
+GRAYSCALE_TOLERANCE = 8
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def optimize_image(data: bytes, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> bytes:
+    """Пережатие изображения: поворот по EXIF, уменьшение, JPEG без метаданных"""
+    from PIL import Image, ImageChops, ImageOps
+
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        if image.mode == 'RGB':
+            # Коды для сброса обычно чёрно-белые: один канал вместо трёх
+            red, green, blue = image.split()
+            max_diff = max(
+                ImageChops.difference(red, green).getextrema()[1],
+                ImageChops.difference(green, blue).getextrema()[1]
+            )
+            if max_diff <= GRAYSCALE_TOLERANCE:
+                image = image.convert('L')
+
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        output = io.BytesIO()
+        # exif и icc_profile не передаём - метаданные в вариант не попадают
+        image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True, subsampling=0)
+        return output.getvalue()
+
+
+class MediaPipeline:
+    """Оптимизированные варианты изображений в контентно-адресуемом кэше.
+
+    Вариант называется по sha256 исходного файла и параметрам сжатия, поэтому
+    одинаковые исходники сжимаются один раз. manifest.json связывает исходный
+    путь с вариантом и запоминает размер и mtime исходника: новый или
+    изменённый файл отдаётся как есть, пока его вариант собирается в фоновом
+    потоке, запущенном из variant_for.
+    """
+
+    def __init__(self, base_path: str, cache_dir: Optional[str] = None,
+                 max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY):
+        self.base_path = base_path
+        self.images_path = os.path.join(base_path, "images")
+        self.cache_dir = cache_dir or os.path.join(base_path, "cache", "images")
+        self.manifest_path = os.path.join(self.cache_dir, "manifest.json")
+        self.max_side = max_side
+        self.quality = quality
+        self.manifest: Dict[str, Dict] = self._load_manifest()
+        # Сборка и запись манифеста из фонового потока и из refresh() не пересекаются
+        self._lock = threading.Lock()
+        # Файлы, ожидающие фоновой сборки; отдельная блокировка, чтобы variant_for не ждал сборку
+        self._pending: Set[str] = set()
+        self._pending_lock = threading.Lock()
+        # False - Pillow не установлен, фоновая сборка не запускается
+        self._available = True
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать манифест медиа {self.manifest_path}: {e}")
+            return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def variant_for(self, source_path: str) -> Optional[str]:
+        """Путь к актуальному оптимизированному варианту или None.
+
+        Для нового или изменённого изображения запускает сборку варианта в
+        фоне; до её окончания отдаётся исходный файл.
+        """
+        rel_path = os.path.relpath(source_path, self.base_path)
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None
+        entry = self.manifest.get(rel_path)
+        if not entry or stat.st_size != entry['source_size'] or stat.st_mtime_ns != entry['source_mtime_ns']:
+            self._schedule(source_path)
+            return None
+        if not entry.get('variant'):
+            return None
+        variant_path = os.path.join(self.cache_dir, entry['variant'])
+        return variant_path if os.path.exists(variant_path) else None
+
+    def _schedule(self, source_path: str):
+        images_path = os.path.join(os.path.abspath(self.images_path), '')
+        if not self._available or not os.path.abspath(source_path).startswith(images_path):
+            return
+        with self._pending_lock:
+            if source_path in self._pending:
+                return
+            self._pending.add(source_path)
+        threading.Thread(target=self.refresh_file, args=(source_path,), name="media-refresh", daemon=True).start()
+
+    def refresh_file(self, source_path: str) -> Optional[Tuple[str, int, int]]:
+        """Сборка варианта одного изображения, если он устарел; блокирующий вызов"""
+        rel_path = os.path.relpath(source_path, self.base_path)
+        try:
+            with self._lock:
+                stat = os.stat(source_path)
+                entry = self.manifest.get(rel_path)
+                if entry and entry['source_size'] == stat.st_size and entry['source_mtime_ns'] == stat.st_mtime_ns:
+                    return None
+                try:
+                    result = self._process(source_path, rel_path, stat)
+                except ImportError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Не удалось оптимизировать {source_path}: {e}")
+                    # Без варианта до следующего изменения файла, чтобы не пересобирать на каждой отправке
+                    self.manifest[rel_path] = {
+                        'source_size': stat.st_size,
+                        'source_mtime_ns': stat.st_mtime_ns,
+                        'source_sha256': None,
+                        'variant': None,
+                        'variant_size': stat.st_size,
+                    }
+                    result = None
+                self._save_manifest()
+            if result:
+                logger.info(f"Оптимизировано изменённое изображение {rel_path}: {result[1]} -> {result[2]} байт")
+            return result
+        except ImportError:
+            self._available = False
+            logger.warning("Pillow не установлен, изображения отправляются без оптимизации")
+        except OSError as e:
+            logger.error(f"Не удалось оптимизировать {source_path}: {e}")
+        finally:
+            with self._pending_lock:
+                self._pending.discard(source_path)
+        return None
+
+    def refresh(self) -> List[Tuple[str, int, int]]:
+        """Пересборка вариантов для новых и изменённых изображений.
+
+        Возвращает отчёт [(исходный путь, байт было, байт стало), ...] по
+        обработанным файлам; если вариант не меньше исходника, он не используется.
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> List[Tuple[str, int, int]]:
+        report = []
+        seen = set()
+
+        for root, _, files in os.walk(self.images_path):
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                source_path = os.path.join(root, name)
+                rel_path = os.path.relpath(source_path, self.base_path)
+                seen.add(rel_path)
+
+                stat = os.stat(source_path)
+                entry = self.manifest.get(rel_path)
+                if entry and entry['source_size'] == stat.st_size and entry['source_mtime_ns'] == stat.st_mtime_ns:
+                    continue
+
+                try:
+                    report.append(self._process(source_path, rel_path, stat))
+                except ImportError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Не удалось оптимизировать {source_path}: {e}")
+
+        for rel_path in set(self.manifest) - seen:
+            del self.manifest[rel_path]
+
+        self._save_manifest()
+        return report
+
+    def _process(self, source_path: str, rel_path: str, stat: os.stat_result) -> Tuple[str, int, int]:
+        with open(source_path, 'rb') as file:
+            data = file.read()
+
+        digest = hashlib.sha256(data).hexdigest()
+        variant = os.path.join(digest[:2], f"{digest}-{self.max_side}q{self.quality}.jpg")
+        variant_path = os.path.join(self.cache_dir, variant)
+
+        if os.path.exists(variant_path):
+            variant_size = os.path.getsize(variant_path)
+        else:
+            optimized = optimize_image(data, self.max_side, self.quality)
+            variant_size = len(optimized)
+            if variant_size < len(data):
+                os.makedirs(os.path.dirname(variant_path), exist_ok=True)
+                tmp_path = f"{variant_path}.tmp"
+                with open(tmp_path, 'wb') as file:
+                    file.write(optimized)
+                os.replace(tmp_path, variant_path)
+
+        use_variant = variant_size < len(data)
+        self.manifest[rel_path] = {
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_sha256': digest,
+            'variant': variant if use_variant else None,
+            'variant_size': variant_size if use_variant else stat.st_size,
+        }
+        return rel_path, len(data), variant_size if use_variant else len(data)
+
+
+def format_report(report: List[Tuple[str, int, int]]) -> str:
+    lines = []
+    for rel_path, before, after in report:
+        saved = before - after
+        # Пустой исходник: доли сэкономленного нет
+        share = f"{saved / before * 100:.0f}%" if before else "—"
+        lines.append(f"{rel_path}: {before} -> {after} байт (−{saved}, {share})")
+    total_before = sum(before for _, before, _ in report)
+    total_after = sum(after for _, _, after in report)
+    lines.append(f"Итого: {total_before} -> {total_after} байт, файлов: {len(report)}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    base_path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("CONTENT_BASE_PATH", "data")
+    print(format_report(MediaPipeline(base_path).refresh()))
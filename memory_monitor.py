@@ -0,0 +1,144 @@
+"""
+Мониторинг роста памяти: RSS, размеры ключевых структур и снимки tracemalloc
+"""
+
+import os
+import resource
+import time
+import tracemalloc
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# Интервал между замерами, секунды
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("MEMORY_SAMPLE_INTERVAL", 300))
+
+# Рост RSS быстрее этого наклона (МБ в час) считается утечкой
+MEMORY_SLOPE_LIMIT_MB = float(os.getenv("MEMORY_SLOPE_LIMIT_MB", 10))
+
+# Окно замеров для оценки наклона: сутки при интервале 5 минут
+MEMORY_WINDOW = 288
+
+# Наклон оценивается не раньше, чем наберётся час замеров
+MIN_WINDOW_SECONDS = 3600
+
+# Повторное предупреждение не чаще раза в этот период, секунды
+ALERT_COOLDOWN = 6 * 3600
+
+# Глубина стеков, которую запоминает tracemalloc
+TRACEMALLOC_FRAMES = 10
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса; без /proc - пиковый RSS из getrusage"""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss в Linux в килобайтах
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def slope_per_hour(points: List[Tuple[float, float]]) -> float:
+    """Наклон линейной регрессии значения по времени, единиц в час"""
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if not var_t:
+        return 0.0
+    cov = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return cov / var_t * 3600
+
+
+class MemoryMonitor:
+    """Периодические замеры RSS и размеров структур с оценкой скорости роста"""
+
+    def __init__(self, probes: Dict[str, Callable[[], int]],
+                 slope_limit_mb: float = MEMORY_SLOPE_LIMIT_MB, window: int = MEMORY_WINDOW):
+        self.probes = probes
+        self.slope_limit = slope_limit_mb * 1024 * 1024
+        self.samples: Deque[Tuple[float, int, Dict[str, int]]] = deque(maxlen=window)
+        self._last_alert: Optional[float] = None
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def measure(self) -> Tuple[int, Dict[str, int]]:
+        """Текущие RSS и размеры структур без записи в окно оценки роста"""
+        sizes = {}
+        for name, probe in self.probes.items():
+            try:
+                sizes[name] = probe()
+            except Exception:
+                sizes[name] = -1
+        return rss_bytes(), sizes
+
+    def sample(self) -> Tuple[int, Dict[str, int]]:
+        """Замер по расписанию: попадает в окно, по которому считается скорость роста"""
+        rss, sizes = self.measure()
+        self.samples.append((time.monotonic(), rss, sizes))
+        return rss, sizes
+
+    def window_seconds(self) -> float:
+        return self.samples[-1][0] - self.samples[0][0] if len(self.samples) > 1 else 0.0
+
+    def rss_slope(self) -> float:
+        """Скорость роста RSS, байт в час"""
+        if len(self.samples) < 2:
+            return 0.0
+        return slope_per_hour([(t, rss) for t, rss, _ in self.samples])
+
+    def probe_slopes(self) -> Dict[str, float]:
+        """Скорость роста каждой структуры, единиц в час"""
+        if len(self.samples) < 2:
+            return {}
+        return {
+            name: slope_per_hour([(t, sizes.get(name, 0)) for t, _, sizes in self.samples])
+            for name in self.probes
+        }
+
+    def check(self) -> Optional[str]:
+        """Текст предупреждения, если RSS растёт быстрее лимита"""
+        if self.window_seconds() < MIN_WINDOW_SECONDS:
+            return None
+        slope = self.rss_slope()
+        if slope <= self.slope_limit:
+            return None
+        now = time.monotonic()
+        if self._last_alert is not None and now - self._last_alert < ALERT_COOLDOWN:
+            return None
+        self._last_alert = now
+
+        growing = sorted(
+            ((name, value) for name, value in self.probe_slopes().items() if value > 0),
+            key=lambda item: item[1], reverse=True
+        )
+        lines = [
+            f"RSS растёт на {slope / 1024 / 1024:.1f} МБ/ч (лимит {self.slope_limit / 1024 / 1024:.0f} МБ/ч) "
+            f"за последние {self.window_seconds() / 3600:.1f} ч, сейчас {self.samples[-1][1] / 1024 / 1024:.0f} МБ"
+        ]
+        lines += [f"• {name}: +{value:.0f}/ч" for name, value in growing[:5]]
+        return "\n".join(lines)
+
+    def start_tracing(self) -> None:
+        """Включение tracemalloc и базовый снимок; до этого накладных расходов нет"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop_tracing(self) -> None:
+        self._baseline = None
+        tracemalloc.stop()
+
+    def snapshot_diff(self, limit: int = 20) -> str:
+        """Рост выделений памяти по строкам кода с момента базового снимка"""
+        if self._baseline is None or not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc не запущен")
+        snapshot = tracemalloc.take_snapshot()
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ]
+        stats = snapshot.filter_traces(filters).compare_to(self._baseline.filter_traces(filters), 'lineno')
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Отслеживается: {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ", ""]
+        lines += [str(stat) for stat in stats[:limit]]
+        return "\n".join(lines)
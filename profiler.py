@@ -0,0 +1,104 @@
+"""
+Статистический профилировщик по запросу: выборки стеков всех потоков
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# Интервал между выборками стеков, секунды
+SAMPLE_INTERVAL = 0.005
+
+# Ограничение на длительность одного запуска, секунды
+MAX_DURATION = 120
+
+
+def frame_label(code) -> str:
+    # ";" разделяет кадры в collapsed-формате, поэтому в подписи его быть не должно
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class ProfilerBusy(RuntimeError):
+    """Профилировщик уже снимает выборки в другом потоке"""
+
+
+class SamplingProfiler:
+    """Снимает стеки всех потоков через sys._current_frames.
+
+    Пока профилировщик не запущен, он ничего не стоит: нет ни потока,
+    ни хуков трассировки, а код бота не инструментирован.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, duration: float) -> Tuple[Counter, int]:
+        """Блокирующий сбор выборок: (collapsed-стек -> число выборок, число проходов)"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("Профилирование уже запущено")
+        try:
+            return self._sample(min(duration, MAX_DURATION))
+        finally:
+            self._lock.release()
+
+    def _sample(self, duration: float) -> Tuple[Counter, int]:
+        stacks = Counter()
+        own_ident = threading.get_ident()
+        labels: Dict[object, str] = {}
+        rounds = 0
+        deadline = time.monotonic() + duration
+
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                parts: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(names.get(ident, f"thread-{ident}"))
+                stacks[';'.join(reversed(parts))] += 1
+            rounds += 1
+            time.sleep(self.interval)
+
+        return stacks, rounds
+
+
+def format_collapsed(stacks: Counter) -> str:
+    """Формат flamegraph.pl / speedscope: "поток;кадр;кадр число" в строке"""
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def top_functions(stacks: Counter, limit: int = 15) -> List[Tuple[str, int, int]]:
+    """Функции с наибольшим собственным временем: [(функция, собственное, суммарное), ...]"""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')[1:]
+        if not frames:
+            continue
+        own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+
+def format_summary(stacks: Counter, rounds: int, limit: int = 15) -> str:
+    samples = sum(stacks.values())
+    lines = [f"Проходов: {rounds}, выборок стеков: {samples}", "", "собств.%  всего%  функция"]
+    for frame, own, total in top_functions(stacks, limit):
+        lines.append(f"{own / samples * 100:7.1f}  {total / samples * 100:6.1f}  {frame}")
+    return "\n".join(lines)
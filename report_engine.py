@@ -0,0 +1,103 @@
+"""
+Однопроходный движок агрегатов для отчётов статистики
+"""
+
+import heapq
+from collections import Counter
+from datetime import datetime
+from operator import itemgetter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Агрегаты, которые умеет считать движок
+REPORT_AGGREGATES = ('daily', 'weekly', 'numbers', 'questions', 'users')
+
+
+class ReportAggregator:
+    """Подсчёт всех агрегатов отчёта за один упорядоченный проход по действиям"""
+
+    def __init__(self, aggregates: Iterable[str] = REPORT_AGGREGATES):
+        self.aggregates = set(aggregates)
+        unknown = self.aggregates - set(REPORT_AGGREGATES)
+        if unknown:
+            raise ValueError(f"Неизвестные агрегаты: {', '.join(sorted(unknown))}")
+
+        self.rows_read = 0
+        self.total_actions = 0
+        self.daily_actions: Dict[str, int] = {}
+        self.weekly_actions: Dict[str, int] = {}
+        self.number_counts = Counter()
+        self.question_counts = Counter()
+        self.user_counts = Counter()
+
+    def feed(self, rows: Iterable[Tuple[Optional[int], Optional[str], Optional[str], str]]):
+        """Обработка строк (user_id, number, question, timestamp), упорядоченных по времени"""
+        count_numbers = 'numbers' in self.aggregates
+        count_questions = 'questions' in self.aggregates
+        count_days = 'daily' in self.aggregates or 'weekly' in self.aggregates
+        number_counts = self.number_counts
+        question_counts = self.question_counts
+        user_counts = self.user_counts
+
+        # Строки идут по возрастанию времени, поэтому дни считаем сериями без словаря
+        current_day = None
+        day_count = 0
+        rows_read = 0
+
+        for user_id, number, question, timestamp in rows:
+            rows_read += 1
+            user_counts[user_id] += 1
+            if count_numbers and number is not None:
+                number_counts[number] += 1
+            if count_questions and question is not None:
+                question_counts[question] += 1
+            if count_days:
+                day = timestamp[:10]
+                if day != current_day:
+                    if current_day is not None:
+                        self._add_day(current_day, day_count)
+                    current_day = day
+                    day_count = 0
+                day_count += 1
+
+        if current_day is not None:
+            self._add_day(current_day, day_count)
+
+        self.rows_read += rows_read
+        self.total_actions += rows_read
+
+    def add_counts(self, total: int, numbers: Counter, questions: Counter, users: Counter):
+        """Учёт уже подсчитанных действий без построчного прохода (дни так не считаются)"""
+        if self.aggregates & {'daily', 'weekly'}:
+            raise ValueError("Дневные и недельные агрегаты считаются только через feed")
+        self.total_actions += total
+        self.user_counts.update(users)
+        if 'numbers' in self.aggregates:
+            self.number_counts.update(numbers)
+        if 'questions' in self.aggregates:
+            self.question_counts.update(questions)
+
+    def _add_day(self, day: str, count: int):
+        """Учёт серии действий одного дня в дневных и недельных счётчиках"""
+        if 'daily' in self.aggregates:
+            self.daily_actions[day] = self.daily_actions.get(day, 0) + count
+        if 'weekly' in self.aggregates:
+            # %W совпадает с strftime('%Y-%W') в SQLite: недели начинаются с понедельника
+            week = datetime.strptime(day, '%Y-%m-%d').strftime('%Y-%W')
+            self.weekly_actions[week] = self.weekly_actions.get(week, 0) + count
+
+    @property
+    def unique_users(self) -> int:
+        return sum(1 for user_id in self.user_counts if user_id is not None)
+
+    def top_numbers(self, limit: Optional[int] = None) -> Dict[str, int]:
+        return dict(self.number_counts.most_common(limit))
+
+    def top_questions(self, limit: Optional[int] = None) -> Dict[str, int]:
+        return dict(self.question_counts.most_common(limit))
+
+    def top_users(self, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Самые активные пользователи: [(user_id, count), ...]"""
+        users = ((user_id, count) for user_id, count in self.user_counts.items() if user_id is not None)
+        if limit is None:
+            return sorted(users, key=itemgetter(1), reverse=True)
+        return heapq.nlargest(limit, users, key=itemgetter(1))
@@ -0,0 +1,235 @@
+"""
+Полнотекстовый поиск решений по каталогу устройств
+"""
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+# Триграммы, встречающиеся чаще этой доли документов, не порождают кандидатов,
+# а только учитываются в их итоговой оценке
+COMMON_GRAM_SHARE = 0.25
+
+# Минимальная доля веса запроса, которую должен покрыть результат
+MIN_SCORE = 0.5
+
+# Сколько лучших кандидатов брать из каждого индекса перед составлением пар
+CANDIDATES_LIMIT = 20
+
+# Сколько вхождений из списков триграмм подсчитывать при отборе кандидатов:
+# списки берутся от самых редких триграмм, остальные идут только в оценку
+CANDIDATE_POSTINGS = 2000
+
+
+def normalize_words(text: str) -> List[str]:
+    """Разбиение текста на слова в нижнем регистре"""
+    text = text.lower().replace('ё', 'е')
+    return re.findall(r'[a-zа-я0-9]+', text)
+
+
+def trigrams(text: str) -> Set[str]:
+    """Триграммы слов текста с границами слов"""
+    grams = set()
+    for word in normalize_words(text):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """Триграммный инвертированный индекс"""
+
+    def __init__(self):
+        self.keys: List[Hashable] = []
+        self.doc_ids: Dict[Hashable, int] = {}
+        self.doc_grams: List[Set[str]] = []
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+        self.weights: Dict[str, float] = {}
+
+    def add(self, key: Hashable, text: str):
+        """Добавление документа; после всех добавлений нужно вызвать build()"""
+        doc_id = len(self.keys)
+        self.keys.append(key)
+        self.doc_ids[key] = doc_id
+        grams = trigrams(text)
+        self.doc_grams.append(grams)
+        for gram in grams:
+            self.postings[gram].append(doc_id)
+
+    def build(self):
+        """Подсчёт весов триграмм (idf) после наполнения индекса"""
+        total = len(self.keys)
+        self.postings = dict(self.postings)
+        self.weights = {
+            gram: math.log(1 + total / len(docs))
+            for gram, docs in self.postings.items()
+        }
+
+    def unknown_weight(self) -> float:
+        """Вес триграммы, которой нет в индексе"""
+        return math.log(1 + len(self.keys))
+
+    def score(self, key: Hashable, grams: Set[str]) -> float:
+        """Сумма весов триграмм запроса, которые есть в документе"""
+        doc_id = self.doc_ids.get(key)
+        if doc_id is None:
+            return 0.0
+        return sum(map(self.weights.__getitem__, grams & self.doc_grams[doc_id]))
+
+    def match(self, grams: Set[str], limit: int) -> Dict[Hashable, float]:
+        """Лучшие документы для набора триграмм: {ключ: вес}"""
+        common_limit = max(1, int(len(self.keys) * COMMON_GRAM_SHARE))
+
+        # Кандидаты по числу совпавших редких триграмм (подсчёт Counter идёт на уровне C);
+        # самые редкие триграммы точнее всего, поэтому их списки подсчитываются первыми
+        postings = sorted(
+            (docs for docs in map(self.postings.get, grams) if docs and len(docs) <= common_limit),
+            key=len
+        )
+        counts = Counter()
+        counted = 0
+        for docs in postings:
+            if counts and counted + len(docs) > CANDIDATE_POSTINGS:
+                break
+            counts.update(docs)
+            counted += len(docs)
+
+        # Точная взвешенная оценка только для небольшого числа лучших кандидатов
+        scored = (
+            (self.keys[doc_id], self.score(self.keys[doc_id], grams))
+            for doc_id, _ in counts.most_common(limit * 4)
+        )
+        return dict(heapq.nlargest(limit, scored, key=itemgetter(1)))
+
+
+class CatalogSearch:
+    """Поиск решений: пары (номер устройства, вопрос) по двум индексам.
+
+    Номера и решения индексируются отдельно, чтобы общий вопрос устройства не
+    размножался на все его номера и не раздувал списки кандидатов.
+    """
+
+    def __init__(self):
+        self.node_index = SearchIndex()
+        self.solution_index = SearchIndex()
+        # Номер -> ключи применимых к нему решений
+        self.node_solutions: Dict[Hashable, List[Hashable]] = defaultdict(list)
+        # Решение -> номера, к которым оно применимо
+        self.solution_nodes: Dict[Hashable, List[Hashable]] = defaultdict(list)
+        # То же множеством: общее решение устройства применимо к тысячам номеров
+        self.solution_node_sets: Dict[Hashable, Set[Hashable]] = {}
+
+    def add_node(self, node_key: Hashable, text: str):
+        self.node_index.add(node_key, text)
+
+    def add_solution(self, solution_key: Hashable, text: str, node_keys: Iterable[Hashable]):
+        self.solution_index.add(solution_key, text)
+        for node_key in node_keys:
+            self.node_solutions[node_key].append(solution_key)
+            self.solution_nodes[solution_key].append(node_key)
+
+    def build(self):
+        self.node_index.build()
+        self.solution_index.build()
+        self.solution_node_sets = {key: set(nodes) for key, nodes in self.solution_nodes.items()}
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[Hashable, Hashable, float]]:
+        """Лучшие пары для запроса: [(номер, решение, оценка), ...]"""
+        grams = trigrams(query)
+        if not grams:
+            return []
+
+        node_scores = self.node_index.match(grams, CANDIDATES_LIMIT)
+        solution_scores = self.solution_index.match(grams, CANDIDATES_LIMIT)
+
+        pairs = set()
+        for node_key in node_scores:
+            pairs.update((node_key, solution_key) for solution_key in self.node_solutions[node_key])
+        for solution_key in solution_scores:
+            nodes = self.solution_nodes[solution_key]
+            if len(nodes) == 1:
+                pairs.add((nodes[0], solution_key))
+            else:
+                # Общее решение предлагаем только для найденных номеров
+                node_set = self.solution_node_sets[solution_key]
+                pairs.update((node_key, solution_key) for node_key in node_scores if node_key in node_set)
+
+        # Оценки считаем точно для каждой пары: кандидат мог не попасть в топ своего индекса
+        for node_key, solution_key in pairs:
+            if node_key not in node_scores:
+                node_scores[node_key] = self.node_index.score(node_key, grams)
+            if solution_key not in solution_scores:
+                solution_scores[solution_key] = self.solution_index.score(solution_key, grams)
+
+        query_weight = sum(
+            max(
+                self.node_index.weights.get(gram, 0.0),
+                self.solution_index.weights.get(gram, 0.0)
+            ) or self.node_index.unknown_weight()
+            for gram in grams
+        )
+        threshold = MIN_SCORE * query_weight
+
+        ranked = heapq.nlargest(
+            limit,
+            (
+                (node_scores[node_key] + solution_scores[solution_key], node_key, solution_key)
+                for node_key, solution_key in pairs
+            ),
+            key=itemgetter(0)
+        )
+        return [
+            (node_key, solution_key, score / query_weight)
+            for score, node_key, solution_key in ranked
+            if score >= threshold
+        ]
+
+
+def normalize_prefix(text: str) -> str:
+    """Ключ для префиксного поиска: буквы и цифры без разделителей"""
+    return ''.join(normalize_words(text))
+
+
+class TrieNode:
+    __slots__ = ('children', 'items', 'cache')
+
+    def __init__(self):
+        self.children: Dict[str, 'TrieNode'] = {}
+        # Первые элементы под этим префиксом, не больше лимита дерева
+        self.items: List[Hashable] = []
+        # Готовый ответ для этого префикса, заполняется вызывающим кодом
+        self.cache = None
+
+
+class PrefixTrie:
+    """Префиксное дерево с заранее собранными списками элементов в каждом узле"""
+
+    def __init__(self, items_limit: int = 50):
+        self.root = TrieNode()
+        self.items_limit = items_limit
+
+    def insert(self, word: str, item: Hashable):
+        key = normalize_prefix(word)
+        if not key:
+            return
+        node = self.root
+        self._add_item(node, item)
+        for char in key:
+            node = node.children.setdefault(char, TrieNode())
+            self._add_item(node, item)
+
+    def _add_item(self, node: TrieNode, item: Hashable):
+        if len(node.items) < self.items_limit and item not in node.items:
+            node.items.append(item)
+
+    def find(self, prefix: str) -> Optional[TrieNode]:
+        """Узел для префикса запроса или None, если совпадений нет"""
+        node = self.root
+        for char in normalize_prefix(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
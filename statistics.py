@@ -5,17 +5,82 @@
 import sqlite3
 import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+
+from hot_stats import HOT_STATS_HOURS, NO_DIMENSION, NO_USER, HotActionBuffer
+from report_engine import ReportAggregator
+from tracing import tracer, traced
 
 logger = logging.getLogger(__name__)
 
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
+# Измерения, которые хранятся в user_actions как ссылки на dimension_values: вид -> колонка
+DIMENSION_COLUMNS = {
+    'action_type': 'action_type_id',
+    'device_type': 'device_type_id',
+    'model': 'model_id',
+    'number': 'number_id',
+    'question': 'question_id',
+}
+
+# Измерения для отчётов за произвольный период: имя -> колонка user_actions
+STATS_DIMENSIONS = {
+    'action': 'action_type_id',
+    'device': 'device_type_id',
+    'model': 'model_id',
+    'number': 'number_id',
+    'question': 'question_id',
+    'user': 'user_id',
+}
+
+# Колонки кольца hot_stats для измерений отчётов: имя -> номер колонки
+HOT_COLUMNS = {
+    'user': 0,
+    'action': 1,
+    'device': 2,
+    'model': 3,
+    'number': 4,
+    'question': 5,
+}
+
+# Колоночный кэш истории на NumPy для отчётов за неделю и месяц; 0 - считать по БД
+ANALYTICS_CACHE = os.getenv("ANALYTICS_CACHE", "1") != "0"
+
+# Сколько последних действий пользователя хранится в user_recent_actions
+RECENT_ACTIONS_LIMIT = 10
+
+# Измерения, которые есть в снимках daily_stats (question_stats там обрезан до топ-10)
+DAILY_DIMENSIONS = ('number',)
+
 
 class StatisticsManager:
     """Класс для управления статистикой бота"""
     
     def __init__(self, db_path: str = "bot_statistics.db"):
         self.db_path = db_path
+        # Кэш словаря измерений: (вид, значение) -> id и обратно
+        self._dimension_ids: Dict[Tuple[str, str], int] = {}
+        self._dimension_values: Dict[int, str] = {}
+        # Подписчики на каждое действие: callback(action_type, device_type, model, number, question)
+        self.action_listeners: List[Callable[..., None]] = []
+        # Действия последних HOT_STATS_HOURS часов и счётчики пользователей для отчётов без БД
+        self.hot = HotActionBuffer()
+        self._total_users = 0
+        self._new_users = Counter()  # DATE(first_seen) -> число пользователей
+        self._user_names: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+        # AnalyticsCache создаётся при первом длинном отчёте; False - кэш недоступен
+        self._analytics = None if ANALYTICS_CACHE else False
+        self._analytics_lock = threading.Lock()
+        # Кэш загружается и дозагружается только в фоновом потоке; отчёты берут его, когда он загружен
+        self._analytics_ready = False
+        self._analytics_thread: Optional[threading.Thread] = None
         self.init_database()
     
     def init_database(self):
@@ -35,18 +100,13 @@ class StatisticsManager:
             )
         ''')
         
-        # Таблица для отслеживания действий пользователей
+        # Словарь значений измерений (тип действия, устройство, модель, номер, вопрос)
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_actions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action_type TEXT NOT NULL,
-                device_type TEXT,
-                model TEXT,
-                number TEXT,
-                question TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            CREATE TABLE IF NOT EXISTS dimension_values (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                UNIQUE (kind, value)
             )
         ''')
         
@@ -63,9 +123,264 @@ class StatisticsManager:
             )
         ''')
         
+        # Подавленные повторные нажатия и /start по дням: только счётчики, без записей в user_actions
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS suppressed_stats (
+                date TEXT NOT NULL,
+                reason TEXT NOT NULL,  -- repeat, in_flight, start
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (date, reason)
+            ) WITHOUT ROWID
+        ''')
+        
+        migrated = False
+        cursor.execute('PRAGMA table_info(user_actions)')
+        if 'action_type' in [row[1] for row in cursor.fetchall()]:
+            self._migrate_text_dimensions(cursor)
+            migrated = True
+        
+        self._create_action_tables(cursor)
+        self._create_user_summary_tables(cursor)
+        self._create_segment_tables(cursor)
+        
+        # Заполняем почасовые агрегаты по уже накопленным действиям
+        cursor.execute('SELECT 1 FROM hourly_stats LIMIT 1')
+        if cursor.fetchone() is None:
+            cursor.execute('''
+                INSERT INTO hourly_stats (hour, action_type_id, device_type_id, model_id, number_id, question_id, count)
+                SELECT substr(timestamp, 1, 13), action_type_id, COALESCE(device_type_id, 0),
+                       COALESCE(model_id, 0), COALESCE(number_id, 0), COALESCE(question_id, 0), COUNT(*)
+                FROM user_actions
+                GROUP BY 1, 2, 3, 4, 5, 6
+            ''')
+            if cursor.rowcount > 0:
+                logger.info(f"Почасовые агрегаты заполнены по истории: {cursor.rowcount} строк")
+        
         conn.commit()
+        
+        if migrated:
+            # Возвращаем освободившиеся после миграции страницы
+            conn.execute('VACUUM')
+        
+        cursor.execute('SELECT id, kind, value FROM dimension_values')
+        for dim_id, kind, value in cursor.fetchall():
+            self._dimension_ids[(kind, value)] = dim_id
+            self._dimension_values[dim_id] = value
+        
+        self._load_hot_actions(cursor)
         conn.close()
     
+    def _load_hot_actions(self, cursor):
+        """Заполнение кольца действиями последних HOT_STATS_HOURS часов и счётчиков пользователей"""
+        since = (datetime.now(MOSCOW_TZ) - timedelta(hours=HOT_STATS_HOURS)).strftime('%Y-%m-%d %H:00:00')
+        cursor.execute('''
+            SELECT timestamp, user_id, action_type_id, device_type_id, model_id, number_id, question_id
+            FROM user_actions
+            WHERE timestamp >= ?
+            ORDER BY timestamp
+        ''', (since,))
+        users = set()
+        for timestamp, user_id, *ids in cursor:
+            self.hot.add(timestamp, user_id, ids)
+            users.add(user_id)
+        self.hot.mark_loaded(since)
+        self._load_user_counts(cursor)
+        self._user_names.update(
+            (row[0], row[1:3]) for row in self.get_users(user_id for user_id in users if user_id is not None)
+        )
+        logger.info(f"В памяти действия с {since}: {len(self.hot)}")
+    
+    def _load_user_counts(self, cursor):
+        cursor.execute('SELECT COUNT(*) FROM users')
+        self._total_users = cursor.fetchone()[0]
+        since = (datetime.now(MOSCOW_TZ) - timedelta(hours=HOT_STATS_HOURS + 24)).strftime('%Y-%m-%d')
+        cursor.execute('''
+            SELECT DATE(first_seen), COUNT(*) FROM users
+            WHERE first_seen >= ?
+            GROUP BY 1
+        ''', (since,))
+        self._new_users = Counter(dict(cursor.fetchall()))
+    
+    def _create_action_tables(self, cursor):
+        """Создание таблиц действий, в которых измерения хранятся как id из dimension_values"""
+        # Таблица для отслеживания действий пользователей
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_actions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                action_type_id INTEGER NOT NULL,
+                device_type_id INTEGER,
+                model_id INTEGER,
+                number_id INTEGER,
+                question_id INTEGER,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+        ''')
+        
+        # Почасовые агрегаты действий (0 вместо NULL, чтобы работал PRIMARY KEY)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS hourly_stats (
+                hour TEXT NOT NULL,  -- 'YYYY-MM-DD HH' по МСК
+                action_type_id INTEGER NOT NULL,
+                device_type_id INTEGER NOT NULL DEFAULT 0,
+                model_id INTEGER NOT NULL DEFAULT 0,
+                number_id INTEGER NOT NULL DEFAULT 0,
+                question_id INTEGER NOT NULL DEFAULT 0,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, action_type_id, device_type_id, model_id, number_id, question_id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp
+            ON user_actions (timestamp)
+        ''')
+    
+    def _create_user_summary_tables(self, cursor):
+        """Сводка по пользователям, которая обновляется в log_action; при первом запуске заполняется по истории"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_summary (
+                user_id INTEGER PRIMARY KEY,
+                total_actions INTEGER NOT NULL DEFAULT 0,
+                last_action TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_user_summary_total
+            ON user_summary (total_actions)
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_number_counts (
+                user_id INTEGER NOT NULL,
+                number_id INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, number_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Кольцо последних действий: действие с порядковым номером n пишется в слот n % RECENT_ACTIONS_LIMIT
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_recent_actions (
+                user_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                action_type_id INTEGER NOT NULL,
+                device_type_id INTEGER,
+                model_id INTEGER,
+                number_id INTEGER,
+                question_id INTEGER,
+                timestamp TIMESTAMP,
+                PRIMARY KEY (user_id, slot)
+            ) WITHOUT ROWID
+        ''')
+        
+        cursor.execute('SELECT 1 FROM user_summary LIMIT 1')
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute('''
+            INSERT INTO user_summary (user_id, total_actions, last_action)
+            SELECT user_id, COUNT(*), MAX(timestamp) FROM user_actions
+            WHERE user_id IS NOT NULL
+            GROUP BY user_id
+        ''')
+        if cursor.rowcount <= 0:
+            return
+        logger.info(f"Сводка по пользователям заполнена по истории: {cursor.rowcount} пользователей")
+        cursor.execute('''
+            INSERT INTO user_number_counts (user_id, number_id, count)
+            SELECT user_id, number_id, COUNT(*) FROM user_actions
+            WHERE user_id IS NOT NULL AND number_id IS NOT NULL
+            GROUP BY user_id, number_id
+        ''')
+        # Слоты считаются так же, как в log_action: последнее действие имеет номер total_actions
+        cursor.execute(f'''
+            INSERT INTO user_recent_actions
+                (user_id, slot, action_type_id, device_type_id, model_id, number_id, question_id, timestamp)
+            SELECT user_id, (total_actions - rn + 1) % {RECENT_ACTIONS_LIMIT},
+                   action_type_id, device_type_id, model_id, number_id, question_id, timestamp
+            FROM (
+                SELECT a.*, s.total_actions,
+                       ROW_NUMBER() OVER (PARTITION BY a.user_id ORDER BY a.timestamp DESC, a.id DESC) AS rn
+                FROM user_actions a JOIN user_summary s ON s.user_id = a.user_id
+            )
+            WHERE rn <= {RECENT_ACTIONS_LIMIT}
+        ''')
+    
+    def _create_segment_tables(self, cursor):
+        """Учёт выгрузки сегментов на узле и уже слитых событий в общей базе (см. stats_segments.py)"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS segment_exports (
+                node_id TEXT PRIMARY KEY,
+                last_action_id INTEGER NOT NULL,
+                exported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Постоянные параметры узла: id, под которым он выгружает сегменты
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS node_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+        
+        # Событие узла идентифицируется парой (узел, id действия в базе узла)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS merged_events (
+                node_id TEXT NOT NULL,
+                action_id INTEGER NOT NULL,
+                PRIMARY KEY (node_id, action_id)
+            ) WITHOUT ROWID
+        ''')
+    
+    def _migrate_text_dimensions(self, cursor):
+        """Перевод user_actions и hourly_stats с текстовых колонок на id из dimension_values"""
+        logger.info("Миграция user_actions на словарь измерений...")
+        cursor.execute('BEGIN')
+        
+        cursor.execute('ALTER TABLE user_actions RENAME TO user_actions_legacy')
+        cursor.execute('DROP INDEX IF EXISTS idx_user_actions_timestamp')
+        
+        cursor.execute('PRAGMA table_info(hourly_stats)')
+        legacy_hourly = 'action_type' in [row[1] for row in cursor.fetchall()]
+        if legacy_hourly:
+            cursor.execute('ALTER TABLE hourly_stats RENAME TO hourly_stats_legacy')
+        
+        for kind in DIMENSION_COLUMNS:
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO dimension_values (kind, value)
+                SELECT DISTINCT ?, {kind} FROM user_actions_legacy WHERE {kind} IS NOT NULL
+            ''', (kind,))
+            if legacy_hourly:
+                cursor.execute(f'''
+                    INSERT OR IGNORE INTO dimension_values (kind, value)
+                    SELECT DISTINCT ?, {kind} FROM hourly_stats_legacy WHERE {kind} != ''
+                ''', (kind,))
+        
+        self._create_action_tables(cursor)
+        
+        lookups = [
+            f"(SELECT id FROM dimension_values WHERE kind = '{kind}' AND value = l.{kind})"
+            for kind in DIMENSION_COLUMNS
+        ]
+        cursor.execute(f'''
+            INSERT INTO user_actions (id, user_id, {', '.join(DIMENSION_COLUMNS.values())}, timestamp)
+            SELECT l.id, l.user_id, {', '.join(lookups)}, l.timestamp
+            FROM user_actions_legacy l
+        ''')
+        logger.info(f"Перенесено действий: {cursor.rowcount}")
+        cursor.execute('DROP TABLE user_actions_legacy')
+        
+        if legacy_hourly:
+            cursor.execute(f'''
+                INSERT INTO hourly_stats (hour, {', '.join(DIMENSION_COLUMNS.values())}, count)
+                SELECT l.hour, {', '.join(f'COALESCE({lookup}, 0)' for lookup in lookups)}, l.count
+                FROM hourly_stats_legacy l
+            ''')
+            cursor.execute('DROP TABLE hourly_stats_legacy')
+    
+    @traced("stats.update_user_info")
     def update_user_info(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Обновление информации о пользователе"""
         conn = sqlite3.connect(self.db_path)
@@ -91,7 +406,14 @@ class StatisticsManager:
         
         conn.commit()
         conn.close()
+        
+        if not exists:
+            self._total_users += 1
+            # first_seen по умолчанию - CURRENT_TIMESTAMP, то есть UTC
+            self._new_users[datetime.now(timezone.utc).strftime('%Y-%m-%d')] += 1
+        self._user_names[user_id] = (username, first_name)
     
+    @traced("stats.log_action")
     def log_action(self, user_id: int, action_type: str, device_type: str = None, 
                    model: str = None, number: str = None, question: str = None):
         """Логирование действия пользователя"""
@@ -102,17 +424,147 @@ class StatisticsManager:
         moscow_tz = pytz.timezone('Europe/Moscow')
         moscow_time = datetime.now(moscow_tz)
         
+        timestamp = moscow_time.strftime('%Y-%m-%d %H:%M:%S')
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        ids = self._insert_action(cursor, user_id, action_type, device_type, model, number, question, timestamp)
+        
+        with tracer.span("sqlite.commit"):
+            conn.commit()
+        conn.close()
+        self.hot.add(timestamp, user_id, ids)
+        
+        for listener in self.action_listeners:
+            try:
+                listener(action_type, device_type, model, number, question)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика на действия: {e}")
+    
+    def _insert_action(self, cursor, user_id: int, action_type: str, device_type: Optional[str],
+                       model: Optional[str], number: Optional[str], question: Optional[str],
+                       timestamp: str) -> List[Optional[int]]:
+        """Запись действия с агрегатами и сводкой пользователя, без фиксации транзакции.
+        
+        Возвращает id измерений; в кольцо действие добавляет вызывающий после фиксации.
+        """
+        ids = [
+            self._intern(cursor, 'action_type', action_type),
+            self._intern(cursor, 'device_type', device_type),
+            self._intern(cursor, 'model', model),
+            self._intern(cursor, 'number', number),
+            self._intern(cursor, 'question', question),
+        ]
         
         cursor.execute('''
-            INSERT INTO user_actions (user_id, action_type, device_type, model, number, question, timestamp)
+            INSERT INTO user_actions (user_id, action_type_id, device_type_id, model_id, number_id, question_id, timestamp)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, action_type, device_type, model, number, question, moscow_time.strftime('%Y-%m-%d %H:%M:%S')))
+        ''', (user_id, *ids, timestamp))
         
-        conn.commit()
+        cursor.execute('''
+            INSERT INTO hourly_stats (hour, action_type_id, device_type_id, model_id, number_id, question_id, count)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+            ON CONFLICT (hour, action_type_id, device_type_id, model_id, number_id, question_id)
+            DO UPDATE SET count = count + 1
+        ''', (timestamp[:13], *[dim_id or 0 for dim_id in ids]))
+        
+        self._update_user_summary(cursor, user_id, ids, timestamp)
+        return ids
+    
+    def _update_user_summary(self, cursor, user_id: Optional[int], ids: List[Optional[int]], timestamp: str):
+        """Счётчики пользователя и его кольцо последних действий - только точечные записи по ключу"""
+        # NULL в INTEGER PRIMARY KEY превратился бы в новый rowid - несуществующего пользователя
+        if user_id is None:
+            return
+        cursor.execute('''
+            INSERT INTO user_summary (user_id, total_actions, last_action)
+            VALUES (?, 1, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_actions = total_actions + 1,
+                last_action = excluded.last_action
+            RETURNING total_actions
+        ''', (user_id, timestamp))
+        total_actions = cursor.fetchone()[0]
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO user_recent_actions
+                (user_id, slot, action_type_id, device_type_id, model_id, number_id, question_id, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, total_actions % RECENT_ACTIONS_LIMIT, *ids, timestamp))
+        
+        number_id = ids[3]
+        if number_id is not None:
+            cursor.execute('''
+                INSERT INTO user_number_counts (user_id, number_id, count)
+                VALUES (?, ?, 1)
+                ON CONFLICT (user_id, number_id) DO UPDATE SET count = count + 1
+            ''', (user_id, number_id))
+    
+    def _intern(self, cursor, kind: str, value: Optional[str]) -> Optional[int]:
+        """id значения измерения; в БД обращаемся только для ещё не встречавшихся значений"""
+        if value is None:
+            return None
+        dim_id = self._dimension_ids.get((kind, value))
+        if dim_id is not None:
+            return dim_id
+        
+        cursor.execute('INSERT OR IGNORE INTO dimension_values (kind, value) VALUES (?, ?)', (kind, value))
+        cursor.execute('SELECT id FROM dimension_values WHERE kind = ? AND value = ?', (kind, value))
+        dim_id = cursor.fetchone()[0]
+        # Фиксируем сразу, чтобы id в кэше не пропал при откате транзакции действия
+        cursor.connection.commit()
+        
+        self._dimension_ids[(kind, value)] = dim_id
+        self._dimension_values[dim_id] = value
+        return dim_id
+    
+    def _lookup(self, cursor, kind: str, value: str) -> Optional[int]:
+        """id уже известного значения измерения без записи в БД; None, если значения нет"""
+        dim_id = self._dimension_ids.get((kind, value))
+        if dim_id is None:
+            cursor.execute('SELECT id FROM dimension_values WHERE kind = ? AND value = ?', (kind, value))
+            row = cursor.fetchone()
+            if row:
+                dim_id = self._dimension_ids[(kind, value)] = row[0]
+                self._dimension_values[dim_id] = value
+        return dim_id
+    
+    def _decode(self, cursor, dim_id: Optional[int]) -> Optional[str]:
+        """Значение измерения по id"""
+        if dim_id is None:
+            return None
+        value = self._dimension_values.get(dim_id)
+        if value is None:
+            cursor.execute('SELECT value FROM dimension_values WHERE id = ?', (dim_id,))
+            row = cursor.fetchone()
+            if row:
+                value = self._dimension_values[dim_id] = row[0]
+        return value
+    
+    def _decode_counts(self, cursor, counts: Dict[int, int]) -> Dict[str, int]:
+        """Замена id на значения в уже отобранном топе {id: count}"""
+        return {self._decode(cursor, dim_id): count for dim_id, count in counts.items()}
+    
+    @traced("stats.get_number_activity")
+    def get_number_activity(self, since: datetime) -> Dict[Tuple[str, Optional[str]], int]:
+        """Действия с номером из hourly_stats с начала since: {(номер, вопрос): число}, вопрос None - все по номеру"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT number_id, question_id, SUM(count) FROM hourly_stats
+            WHERE hour >= ? AND number_id != 0
+            GROUP BY number_id, question_id
+        ''', (since.strftime('%Y-%m-%d %H'),))
+        activity = Counter()
+        for number_id, question_id, count in cursor.fetchall():
+            number = self._decode(cursor, number_id)
+            activity[(number, None)] += count
+            if question_id:
+                activity[(number, self._decode(cursor, question_id))] += count
         conn.close()
+        return dict(activity)
     
+    @traced("stats.get_daily_stats")
     def get_daily_stats(self, date: str = None) -> Dict:
         """Получение статистики за день"""
         import pytz
@@ -124,72 +576,53 @@ class StatisticsManager:
             moscow_time = datetime.now(moscow_tz)
             date = moscow_time.strftime('%Y-%m-%d')
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Общее количество пользователей
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
-        
-        # Новые пользователи за день
-        cursor.execute('''
-            SELECT COUNT(*) FROM users 
-            WHERE DATE(first_seen) = ?
-        ''', (date,))
-        new_users = cursor.fetchone()[0]
+        next_date = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
         
-        # Общее количество действий за день
-        cursor.execute('''
-            SELECT COUNT(*) FROM user_actions 
-            WHERE DATE(timestamp) = ?
-        ''', (date,))
-        total_actions = cursor.fetchone()[0]
-        
-        # Статистика по моделям и номерам устройств за день
-        cursor.execute('''
-            SELECT number, COUNT(*) as count
-            FROM user_actions
-            WHERE DATE(timestamp) = ? AND number IS NOT NULL
-            GROUP BY number
-            ORDER BY count DESC
-        ''', (date,))
-        device_stats = dict(cursor.fetchall())
-        
-        # Статистика по вопросам за день
-        cursor.execute('''
-            SELECT question, COUNT(*) as count
-            FROM user_actions 
-            WHERE DATE(timestamp) = ? AND question IS NOT NULL
-            GROUP BY question
-            ORDER BY count DESC
-            LIMIT 10
-        ''', (date,))
-        question_stats = dict(cursor.fetchall())
-        
-        # Топ пользователей за день
-        cursor.execute('''
-            SELECT u.user_id, u.username, u.first_name, COUNT(ua.id) as action_count
-            FROM users u
-            JOIN user_actions ua ON u.user_id = ua.user_id
-            WHERE DATE(ua.timestamp) = ?
-            GROUP BY u.user_id, u.username, u.first_name
-            ORDER BY action_count DESC
-            LIMIT 5
-        ''', (date,))
-        top_users = cursor.fetchall()
-        
-        conn.close()
+        day_start = datetime.strptime(date, '%Y-%m-%d')
+        if self.hot.covers(day_start, datetime.now(MOSCOW_TZ)):
+            # Весь день в кольце: отчёт из памяти
+            total_users = self._total_users
+            new_users = self._new_users.get(date, 0)
+            total, counts = self._hot_counts(day_start, day_start + timedelta(days=1), ('number', 'question', 'user'))
+            report = ReportAggregator(('numbers', 'questions', 'users'))
+            report.add_counts(total, counts['number'], counts['question'], counts['user'])
+            top_users = self._cached_top_users(report, 5)
+            device_stats = self._decode_cached(report.top_numbers())
+            question_stats = self._decode_cached(report.top_questions(10))
+        else:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            
+            # Общее количество пользователей
+            cursor.execute('SELECT COUNT(*) FROM users')
+            total_users = cursor.fetchone()[0]
+            
+            # Новые пользователи за день
+            cursor.execute('''
+                SELECT COUNT(*) FROM users 
+                WHERE DATE(first_seen) = ?
+            ''', (date,))
+            new_users = cursor.fetchone()[0]
+            
+            # Действия за день: количество, номера устройств, вопросы и пользователи за один проход
+            report = self._run_report(cursor, date, next_date, ('numbers', 'questions', 'users'))
+            top_users = self._resolve_top_users(cursor, report, 5)
+            device_stats = self._decode_counts(cursor, report.top_numbers())
+            question_stats = self._decode_counts(cursor, report.top_questions(10))
+            
+            conn.close()
         
         return {
             'date': date,
             'total_users': total_users,
             'new_users': new_users,
-            'total_actions': total_actions,
+            'total_actions': report.total_actions,
             'device_stats': device_stats,
             'question_stats': question_stats,
             'top_users': top_users
         }
     
+    @traced("stats.get_weekly_stats")
     def get_weekly_stats(self) -> Dict:
         """Получение статистики за неделю"""
         import pytz
@@ -200,70 +633,32 @@ class StatisticsManager:
         moscow_time = datetime.now(moscow_tz)
         week_ago = moscow_time - timedelta(days=7)
         
+        report = self._analytics_report(week_ago)
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Статистика по дням недели
-        cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as actions
-            FROM user_actions 
-            WHERE timestamp >= ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        ''', (week_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        daily_actions = dict(cursor.fetchall())
-        
-        # Общая статистика за неделю
-        cursor.execute('''
-            SELECT COUNT(DISTINCT user_id) as unique_users, COUNT(*) as total_actions
-            FROM user_actions 
-            WHERE timestamp >= ?
-        ''', (week_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        weekly_total = cursor.fetchone()
-        
-        # Статистика по номерам устройств за неделю
-        cursor.execute('''
-            SELECT number, COUNT(*) as count
-            FROM user_actions
-            WHERE timestamp >= ? AND number IS NOT NULL
-            GROUP BY number
-            ORDER BY count DESC
-        ''', (week_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        device_stats = dict(cursor.fetchall())
-        
-        # Статистика по вопросам за неделю
-        cursor.execute('''
-            SELECT question, COUNT(*) as count
-            FROM user_actions
-            WHERE timestamp >= ? AND question IS NOT NULL
-            GROUP BY question
-            ORDER BY count DESC
-        ''', (week_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        question_stats = dict(cursor.fetchall())
-        
-        # Топ пользователи за неделю
-        cursor.execute('''
-            SELECT u.user_id, u.username, u.first_name, COUNT(*) as action_count
-            FROM user_actions ua
-            JOIN users u ON ua.user_id = u.user_id
-            WHERE ua.timestamp >= ?
-            GROUP BY ua.user_id
-            ORDER BY action_count DESC
-            LIMIT 5
-        ''', (week_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        top_users = cursor.fetchall()
+        if report is None:
+            report = self._run_report(
+                cursor, week_ago.strftime('%Y-%m-%d %H:%M:%S'), None,
+                ('daily', 'numbers', 'questions', 'users')
+            )
+        top_users = self._resolve_top_users(cursor, report, 5)
+        device_stats = self._decode_counts(cursor, report.top_numbers())
+        question_stats = self._decode_counts(cursor, report.top_questions())
         
         conn.close()
         
         return {
-            'daily_actions': daily_actions,
-            'unique_users': weekly_total[0],
-            'total_actions': weekly_total[1],
+            'daily_actions': report.daily_actions,
+            'unique_users': report.unique_users,
+            'total_actions': report.total_actions,
             'device_stats': device_stats,
             'question_stats': question_stats,
             'top_users': top_users
         }
     
+    @traced("stats.get_monthly_stats")
     def get_monthly_stats(self) -> Dict:
         """Получение статистики за месяц"""
         import pytz
@@ -274,81 +669,365 @@ class StatisticsManager:
         moscow_time = datetime.now(moscow_tz)
         month_ago = moscow_time - timedelta(days=30)
         
+        report = self._analytics_report(month_ago)
+        
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Статистика по дням месяца
-        cursor.execute('''
-            SELECT DATE(timestamp) as date, COUNT(*) as actions
-            FROM user_actions 
-            WHERE timestamp >= ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        daily_actions = dict(cursor.fetchall())
+        if report is None:
+            report = self._run_report(
+                cursor, month_ago.strftime('%Y-%m-%d %H:%M:%S'), None,
+                ('daily', 'weekly', 'numbers', 'questions', 'users')
+            )
+        top_users = self._resolve_top_users(cursor, report, 10)
+        device_stats = self._decode_counts(cursor, report.top_numbers())
+        question_stats = self._decode_counts(cursor, report.top_questions())
         
-        # Общая статистика за месяц
-        cursor.execute('''
-            SELECT COUNT(DISTINCT user_id) as unique_users, COUNT(*) as total_actions
-            FROM user_actions 
-            WHERE timestamp >= ?
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        monthly_total = cursor.fetchone()
+        conn.close()
         
-        # Статистика по номерам устройств за месяц
-        cursor.execute('''
-            SELECT number, COUNT(*) as count
-            FROM user_actions
-            WHERE timestamp >= ? AND number IS NOT NULL
-            GROUP BY number
-            ORDER BY count DESC
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        device_stats = dict(cursor.fetchall())
+        return {
+            'daily_actions': report.daily_actions,
+            'weekly_actions': report.weekly_actions,
+            'unique_users': report.unique_users,
+            'total_actions': report.total_actions,
+            'device_stats': device_stats,
+            'question_stats': question_stats,
+            'top_users': top_users,
+            'all_time_top_users': self.get_top_users(5)
+        }
+    
+    def _run_report(self, cursor, start: str, end: Optional[str], aggregates: Iterable[str]) -> ReportAggregator:
+        """Один упорядоченный проход по действиям периода [start, end) со сбором всех агрегатов"""
+        report = ReportAggregator(aggregates)
+        if end is None:
+            cursor.execute('''
+                SELECT user_id, number_id, question_id, timestamp
+                FROM user_actions
+                WHERE timestamp >= ?
+                ORDER BY timestamp
+            ''', (start,))
+        else:
+            cursor.execute('''
+                SELECT user_id, number_id, question_id, timestamp
+                FROM user_actions
+                WHERE timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+            ''', (start, end))
+        report.feed(cursor)
+        return report
+    
+    def refresh_analytics(self) -> Optional[int]:
+        """Дозагрузка колоночного кэша; блокирующий вызов, не для цикла событий. None, если кэш выключен или недоступен"""
+        with self._analytics_lock:
+            added = self._refresh_analytics()
+            self._analytics_ready = added is not None
+            return added
+    
+    def _refresh_analytics(self) -> Optional[int]:
+        if self._analytics is None:
+            try:
+                from analytics_cache import AnalyticsCache
+            except ImportError:
+                logger.warning("NumPy не установлен, отчёты за неделю и месяц считаются по БД")
+                self._analytics = False
+            else:
+                self._analytics = AnalyticsCache(self.db_path)
+        if not self._analytics:
+            return None
+        try:
+            return self._analytics.refresh()
+        except (OSError, sqlite3.Error, ValueError) as e:
+            logger.error(f"Ошибка обновления колоночного кэша: {e}")
+            return None
+    
+    def _schedule_analytics_refresh(self):
+        """Дозагрузка кэша в фоновом потоке, если она ещё не идёт"""
+        if self._analytics is False:
+            return
+        if self._analytics_thread is not None and self._analytics_thread.is_alive():
+            return
+        self._analytics_thread = threading.Thread(target=self.refresh_analytics, name="analytics-refresh", daemon=True)
+        self._analytics_thread.start()
+    
+    def _analytics_report(self, start: datetime):
+        """Агрегаты с start по колоночному кэшу или None - тогда отчёт считается по БД.
         
-        # Статистика по вопросам за месяц
-        cursor.execute('''
-            SELECT question, COUNT(*) as count
-            FROM user_actions
-            WHERE timestamp >= ? AND question IS NOT NULL
-            GROUP BY question
-            ORDER BY count DESC
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        question_stats = dict(cursor.fetchall())
-        
-        # Топ пользователи за месяц
-        cursor.execute('''
-            SELECT u.user_id, u.username, u.first_name, COUNT(*) as action_count
-            FROM user_actions ua
-            JOIN users u ON ua.user_id = u.user_id
-            WHERE ua.timestamp >= ?
-            GROUP BY ua.user_id
-            ORDER BY action_count DESC
-            LIMIT 10
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        top_users = cursor.fetchall()
+        Отчёт никогда не загружает кэш сам: пока кэш не загружен, дозагружается,
+        перестраивается после замены базы или отстал больше чем на TAIL_LIMIT
+        действий, отчёт идёт по БД, а дозагрузка запускается в фоне. Действия
+        после последней дозагрузки дочитываются из БД по id.
+        """
+        if self._analytics is False:
+            return None
+        if not self._analytics_ready or not self._analytics_lock.acquire(blocking=False):
+            self._schedule_analytics_refresh()
+            return None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                tail = self._analytics.read_tail(conn.cursor())
+            finally:
+                conn.close()
+            if tail is None or len(tail):
+                self._schedule_analytics_refresh()
+            if tail is None:
+                return None
+            with tracer.span("stats.analytics_report", tail=len(tail), rows=self._analytics.meta['rows']):
+                return self._analytics.report(start.replace(tzinfo=None), tail=tail)
+        except (OSError, sqlite3.Error, ValueError) as e:
+            logger.error(f"Ошибка отчёта по колоночному кэшу: {e}")
+            return None
+        finally:
+            self._analytics_lock.release()
+    
+    def _resolve_top_users(self, cursor, report: ReportAggregator, limit: int) -> List[Tuple]:
+        """Имена только для топа пользователей: [(user_id, username, first_name, count), ...]"""
+        candidates = report.top_users(limit)
+        top_users = self._fetch_user_names(cursor, candidates)
+        if len(top_users) < min(limit, report.unique_users):
+            # Часть пользователей отсутствует в users - добираем из полного рейтинга
+            top_users = self._fetch_user_names(cursor, report.top_users())
+        return top_users[:limit]
+    
+    def _hot_counts(self, start: datetime, end: datetime, dimensions: Iterable[str]) -> Tuple[int, Dict[str, Counter]]:
+        """Число действий за [start, end) из кольца и счётчики id по измерениям; None не учитываются, как и в SQL"""
+        dimensions = list(dimensions)
+        total, counters = self.hot.counts(start, end, [HOT_COLUMNS[dim] for dim in dimensions])
+        counts = {}
+        for dim in dimensions:
+            counts[dim] = counters[HOT_COLUMNS[dim]]
+            counts[dim].pop(NO_USER if dim == 'user' else NO_DIMENSION, None)
+        return total, counts
+    
+    def _cached_top_users(self, report: ReportAggregator, limit: int) -> List[Tuple]:
+        """Как _resolve_top_users, но имена из памяти; в кэше не все пользователи кольца
+        (после перезапуска - только те, кто действовал до него или с тех пор прислал /start),
+        поэтому остальные добираются из users одним запросом и кэшируются"""
+        top_users = self._cached_user_names(report.top_users(limit))
+        if len(top_users) < min(limit, report.unique_users):
+            # Часть пользователей отсутствует в users - добираем из полного рейтинга
+            top_users = self._cached_user_names(report.top_users())
+        return top_users[:limit]
+    
+    def _cached_user_names(self, ranked: List[Tuple[int, int]]) -> List[Tuple]:
+        """Как _fetch_user_names, но БД читается только для id, которых нет в _user_names"""
+        missing = [user_id for user_id, _ in ranked if user_id not in self._user_names]
+        if missing:
+            self._user_names.update((row[0], row[1:3]) for row in self.get_users(missing))
+        return [
+            (user_id, *self._user_names[user_id], count)
+            for user_id, count in ranked
+            if user_id in self._user_names
+        ]
+    
+    def _decode_cached(self, counts: Dict[int, int]) -> Dict[str, int]:
+        """Замена id на значения без БД: все id из кольца прошли через _intern или загружены при запуске"""
+        return {self._dimension_values[dim_id]: count for dim_id, count in counts.items()}
+    
+    def _fetch_user_names(self, cursor, ranked: List[Tuple[int, int]]) -> List[Tuple]:
+        """Присоединение username и first_name к рейтингу, как JOIN users"""
+        names = {}
+        ids = [user_id for user_id, _ in ranked]
+        # Ограничение SQLite на число параметров запроса
+        for offset in range(0, len(ids), 500):
+            chunk = ids[offset:offset + 500]
+            cursor.execute(f'''
+                SELECT user_id, username, first_name FROM users
+                WHERE user_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk)
+            names.update((row[0], row[1:]) for row in cursor.fetchall())
+        return [
+            (user_id, *names[user_id], count)
+            for user_id, count in ranked
+            if user_id in names
+        ]
+    
+    def plan_stats_query(self, start: datetime, end: datetime,
+                         dimensions: Iterable[str] = ()) -> List[Tuple[str, datetime, datetime]]:
+        """Разбиение периода [start, end) на участки с самым дешёвым источником данных.
+        
+        Возвращает список (источник, начало, конец), где источник - 'hot',
+        'daily', 'hourly' или 'raw'. Последние часы, которые целиком есть в
+        кольце в памяти, идут участком 'hot'. Снимки daily_stats используются
+        только для завершённых дней, снятых уже после их окончания: снимок в
+        23:55 не видит последних минут.
+        """
+        # Последние часы отдаёт кольцо в памяти
+        hot_from = self.hot.covered_from(datetime.now(MOSCOW_TZ))
+        if hot_from is not None and end > hot_from:
+            if start >= hot_from:
+                return [('hot', start, end)]
+            return self.plan_stats_query(start, hot_from, dimensions) + [('hot', hot_from, end)]
+        
+        dimensions = set(dimensions)
+        if 'user' in dimensions:
+            # Пользователей нет в агрегатах, считаем по сырым действиям
+            return [('raw', start, end)]
+        
+        hour_start = start.replace(minute=0, second=0, microsecond=0)
+        if hour_start < start:
+            hour_start += timedelta(hours=1)
+        hour_end = end.replace(minute=0, second=0, microsecond=0)
+        if hour_start >= hour_end:
+            return [('raw', start, end)]
+        
+        final_days = set()
+        if dimensions <= set(DAILY_DIMENSIONS):
+            final_days = self._get_final_daily_snapshots(hour_start.date(), hour_end.date())
         
-        # Статистика по неделям месяца
+        segments = []
+        
+        def add_segment(source: str, seg_start: datetime, seg_end: datetime):
+            if seg_start >= seg_end:
+                return
+            if segments and segments[-1][0] == source and segments[-1][2] == seg_start:
+                segments[-1] = (source, segments[-1][1], seg_end)
+            else:
+                segments.append((source, seg_start, seg_end))
+        
+        add_segment('raw', start, hour_start)
+        cursor_time = hour_start
+        while cursor_time < hour_end:
+            next_day = datetime.combine(cursor_time.date() + timedelta(days=1), datetime.min.time())
+            if cursor_time.hour == 0 and next_day <= hour_end and cursor_time.date() in final_days:
+                add_segment('daily', cursor_time, next_day)
+            else:
+                add_segment('hourly', cursor_time, min(next_day, hour_end))
+            cursor_time = next_day
+        add_segment('raw', hour_end, end)
+        
+        return segments
+    
+    def _get_final_daily_snapshots(self, first_day, last_day) -> set:
+        """Дни из daily_stats, снимок которых сделан после окончания дня"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
         cursor.execute('''
-            SELECT strftime('%Y-%W', timestamp) as week, COUNT(*) as actions
-            FROM user_actions 
-            WHERE timestamp >= ?
-            GROUP BY strftime('%Y-%W', timestamp)
-            ORDER BY week
-        ''', (month_ago.strftime('%Y-%m-%d %H:%M:%S'),))
-        weekly_actions = dict(cursor.fetchall())
+            SELECT date, created_at FROM daily_stats
+            WHERE date >= ? AND date <= ?
+        ''', (first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d')))
+        rows = cursor.fetchall()
+        conn.close()
+        
+        final_days = set()
+        for date, created_at in rows:
+            if not created_at:
+                continue
+            day = datetime.strptime(date, '%Y-%m-%d').date()
+            day_end = MOSCOW_TZ.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+            # created_at заполняется SQLite по UTC
+            created = pytz.utc.localize(datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'))
+            if created >= day_end:
+                final_days.add(day)
+        return final_days
+    
+    @traced("stats.get_stats")
+    def get_stats(self, start: datetime, end: datetime, dimensions: Iterable[str] = (),
+                  top_n: int = 10) -> Dict:
+        """Получение статистики за произвольный период [start, end) по МСК"""
+        dimensions = list(dimensions)
+        unknown = [dim for dim in dimensions if dim not in STATS_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Неизвестные измерения: {', '.join(unknown)}")
+        
+        plan = self.plan_stats_query(start, end, dimensions)
+        total_actions = 0
+        counters = {dim: Counter() for dim in dimensions}
+        
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        for source, seg_start, seg_end in plan:
+            if source == 'hot':
+                total, counts = self._hot_counts(seg_start, seg_end, dimensions)
+                total_actions += total
+                for dim in dimensions:
+                    counters[dim].update(counts[dim])
+            elif source == 'raw':
+                bounds = (seg_start.strftime('%Y-%m-%d %H:%M:%S'), seg_end.strftime('%Y-%m-%d %H:%M:%S'))
+                cursor.execute('''
+                    SELECT COUNT(*) FROM user_actions
+                    WHERE timestamp >= ? AND timestamp < ?
+                ''', bounds)
+                total_actions += cursor.fetchone()[0]
+                for dim in dimensions:
+                    column = STATS_DIMENSIONS[dim]
+                    cursor.execute(f'''
+                        SELECT {column}, COUNT(*) FROM user_actions
+                        WHERE timestamp >= ? AND timestamp < ? AND {column} IS NOT NULL
+                        GROUP BY {column}
+                    ''', bounds)
+                    counters[dim].update(dict(cursor.fetchall()))
+            elif source == 'hourly':
+                bounds = (seg_start.strftime('%Y-%m-%d %H'), seg_end.strftime('%Y-%m-%d %H'))
+                cursor.execute('''
+                    SELECT COALESCE(SUM(count), 0) FROM hourly_stats
+                    WHERE hour >= ? AND hour < ?
+                ''', bounds)
+                total_actions += cursor.fetchone()[0]
+                for dim in dimensions:
+                    column = STATS_DIMENSIONS[dim]
+                    cursor.execute(f'''
+                        SELECT {column}, SUM(count) FROM hourly_stats
+                        WHERE hour >= ? AND hour < ? AND {column} != 0
+                        GROUP BY {column}
+                    ''', bounds)
+                    counters[dim].update(dict(cursor.fetchall()))
+            else:
+                cursor.execute('''
+                    SELECT total_actions, device_stats FROM daily_stats
+                    WHERE date >= ? AND date < ?
+                ''', (seg_start.strftime('%Y-%m-%d'), seg_end.strftime('%Y-%m-%d')))
+                for day_total, device_stats in cursor.fetchall():
+                    total_actions += day_total or 0
+                    if 'number' in counters and device_stats:
+                        # В снимках номера хранятся строками, приводим их к id; отчёт ничего не пишет в словарь
+                        for number, count in json.loads(device_stats).items():
+                            dim_id = self._lookup(cursor, 'number', number)
+                            if dim_id is not None:
+                                counters['number'][dim_id] += count
+        
+        top = {}
+        for dim in dimensions:
+            top[dim] = dict(counters[dim].most_common(top_n))
+            if dim != 'user':
+                top[dim] = self._decode_counts(cursor, top[dim])
         
         conn.close()
         
         return {
-            'daily_actions': daily_actions,
-            'weekly_actions': weekly_actions,
-            'unique_users': monthly_total[0],
-            'total_actions': monthly_total[1],
-            'device_stats': device_stats,
-            'question_stats': question_stats,
-            'top_users': top_users
+            'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_actions': total_actions,
+            'dimensions': top,
+            'plan': [(source, seg_start.strftime('%Y-%m-%d %H:%M:%S'), seg_end.strftime('%Y-%m-%d %H:%M:%S'))
+                     for source, seg_start, seg_end in plan]
         }
     
+    @traced("stats.add_suppressed")
+    def add_suppressed(self, date: str, counts: Dict[str, int]):
+        """Прибавление подавленных за день событий по причинам"""
+        if not counts:
+            return
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT INTO suppressed_stats (date, reason, count) VALUES (?, ?, ?)
+            ON CONFLICT (date, reason) DO UPDATE SET count = count + excluded.count
+        ''', [(date, reason, count) for reason, count in counts.items()])
+        conn.commit()
+        conn.close()
+    
+    def get_suppressed(self, date: str) -> Dict[str, int]:
+        """Подавленные за день события: {причина: число}"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT reason, count FROM suppressed_stats WHERE date = ?', (date,))
+        result = dict(cursor.fetchall())
+        conn.close()
+        return result
+    
+    @traced("stats.save_daily_stats")
     def save_daily_stats(self, date: str, stats: Dict):
         """Сохранение ежедневной статистики"""
         conn = sqlite3.connect(self.db_path)
@@ -370,6 +1049,7 @@ class StatisticsManager:
         conn.commit()
         conn.close()
     
+    @traced("stats.get_user_stats")
     def get_user_stats(self, user_id: int) -> Dict:
         """Получение статистики конкретного пользователя"""
         conn = sqlite3.connect(self.db_path)
@@ -386,31 +1066,30 @@ class StatisticsManager:
             conn.close()
             return None
         
-        # Количество действий пользователя
-        cursor.execute('''
-            SELECT COUNT(*) FROM user_actions WHERE user_id = ?
-        ''', (user_id,))
-        total_actions = cursor.fetchone()[0]
+        # Счётчики и последние действия берутся из сводки, которую ведёт log_action
+        cursor.execute('SELECT total_actions FROM user_summary WHERE user_id = ?', (user_id,))
+        row = cursor.fetchone()
+        total_actions = row[0] if row else 0
         
-        # Статистика по моделям и номерам устройств
+        # Статистика по номерам устройств
         cursor.execute('''
-            SELECT number, COUNT(*) as count
-            FROM user_actions
-            WHERE user_id = ? AND number IS NOT NULL
-            GROUP BY number
+            SELECT number_id, count FROM user_number_counts
+            WHERE user_id = ?
             ORDER BY count DESC
         ''', (user_id,))
-        device_stats = dict(cursor.fetchall())
+        device_stats = self._decode_counts(cursor, dict(cursor.fetchall()))
         
-        # Последние действия
+        # Последние действия: слот самого нового действия - total_actions % RECENT_ACTIONS_LIMIT
         cursor.execute('''
-            SELECT action_type, device_type, model, number, question, timestamp
-            FROM user_actions 
+            SELECT slot, action_type_id, device_type_id, model_id, number_id, question_id, timestamp
+            FROM user_recent_actions
             WHERE user_id = ?
-            ORDER BY timestamp DESC
-            LIMIT 10
         ''', (user_id,))
-        recent_actions = cursor.fetchall()
+        rows = sorted(cursor.fetchall(), key=lambda row: (total_actions - row[0]) % RECENT_ACTIONS_LIMIT)
+        recent_actions = [
+            (*(self._decode(cursor, dim_id) for dim_id in row[1:6]), row[6])
+            for row in rows
+        ]
         
         conn.close()
         
@@ -427,6 +1106,154 @@ class StatisticsManager:
             'recent_actions': recent_actions
         }
     
+    @traced("stats.get_top_users")
+    def get_top_users(self, limit: int = 10) -> List[Tuple]:
+        """Топ пользователей за всё время по индексу сводки: [(user_id, username, first_name, count), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.user_id, u.username, u.first_name, s.total_actions
+            FROM user_summary s JOIN users u ON u.user_id = s.user_id
+            ORDER BY s.total_actions DESC
+            LIMIT ?
+        ''', (limit,))
+        top_users = cursor.fetchall()
+        conn.close()
+        return top_users
+    
+    @traced("stats.get_actions_after")
+    def get_actions_after(self, after_id: int, limit: int) -> List[Tuple]:
+        """Действия с id больше after_id по возрастанию id: [(id, user_id, тип, устройство, модель, номер, вопрос, время), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, user_id, action_type_id, device_type_id, model_id, number_id, question_id, timestamp
+            FROM user_actions
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (after_id, limit))
+        actions = [
+            (row[0], row[1], *(self._decode(cursor, dim_id) for dim_id in row[2:7]), row[7])
+            for row in cursor.fetchall()
+        ]
+        conn.close()
+        return actions
+    
+    def get_users(self, user_ids: Iterable[int]) -> List[Tuple]:
+        """Записи users: [(user_id, username, first_name, last_name, first_seen, last_seen), ...]"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        ids = list(user_ids)
+        users = []
+        # Ограничение SQLite на число параметров запроса
+        for offset in range(0, len(ids), 500):
+            chunk = ids[offset:offset + 500]
+            cursor.execute(f'''
+                SELECT user_id, username, first_name, last_name, first_seen, last_seen FROM users
+                WHERE user_id IN ({', '.join('?' * len(chunk))})
+            ''', chunk)
+            users.extend(cursor.fetchall())
+        conn.close()
+        return users
+    
+    def get_node_id(self, new_id: str) -> str:
+        """Постоянный id узла из его базы; создаётся один раз и не зависит от имени хоста.
+        
+        Если узел уже выгружал сегменты под прежним id, сохраняется он, иначе
+        выгрузка началась бы заново и слияние посчитало бы действия дважды.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT value FROM node_meta WHERE key = 'node_id'")
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('SELECT node_id FROM segment_exports ORDER BY exported_at DESC LIMIT 1')
+            previous = cursor.fetchone()
+            # OR IGNORE: при одновременном первом запуске остаётся id, записанный первым
+            cursor.execute("INSERT OR IGNORE INTO node_meta (key, value) VALUES ('node_id', ?)",
+                           (previous[0] if previous else new_id,))
+            conn.commit()
+            cursor.execute("SELECT value FROM node_meta WHERE key = 'node_id'")
+            row = cursor.fetchone()
+        conn.close()
+        return row[0]
+    
+    def get_export_watermark(self, node_id: str) -> int:
+        """id последнего выгруженного в сегменты действия узла"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('SELECT last_action_id FROM segment_exports WHERE node_id = ?', (node_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return row[0] if row else 0
+    
+    def set_export_watermark(self, node_id: str, last_action_id: int):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT INTO segment_exports (node_id, last_action_id, exported_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (node_id) DO UPDATE SET
+                last_action_id = excluded.last_action_id,
+                exported_at = excluded.exported_at
+        ''', (node_id, last_action_id))
+        conn.commit()
+        conn.close()
+    
+    @traced("stats.merge_segment")
+    def merge_segment(self, node_id: str, users: Iterable[Tuple], actions: Iterable[Tuple]) -> int:
+        """Слияние сегмента узла одной транзакцией; повторно присланные события пропускаются.
+        
+        Возвращает число новых действий. При ошибке сегмент откатывается целиком
+        и при повторном слиянии будет загружен заново.
+        """
+        actions = list(actions)
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            # _intern фиксирует новые значения сразу - до событий сегмента, а не посреди них
+            for action in actions:
+                for kind, value in zip(('action_type', 'device_type', 'model', 'number', 'question'), action[2:7]):
+                    self._intern(cursor, kind, value)
+            
+            # Первый визит - самый ранний по всем узлам, имя и последний визит - с узла, где пользователь был позже
+            names = {}
+            for user_id, username, first_name, last_name, first_seen, last_seen in users:
+                cursor.execute('''
+                    INSERT INTO users (user_id, username, first_name, last_name, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        username = CASE WHEN excluded.last_seen >= last_seen THEN excluded.username ELSE username END,
+                        first_name = CASE WHEN excluded.last_seen >= last_seen THEN excluded.first_name ELSE first_name END,
+                        last_name = CASE WHEN excluded.last_seen >= last_seen THEN excluded.last_name ELSE last_name END,
+                        first_seen = MIN(COALESCE(first_seen, excluded.first_seen), COALESCE(excluded.first_seen, first_seen)),
+                        last_seen = MAX(COALESCE(last_seen, excluded.last_seen), COALESCE(excluded.last_seen, last_seen))
+                ''', (user_id, username, first_name, last_name, first_seen, last_seen))
+                cursor.execute('SELECT username, first_name FROM users WHERE user_id = ?', (user_id,))
+                names[user_id] = cursor.fetchone()
+            
+            added = []
+            for action_id, user_id, action_type, device_type, model, number, question, timestamp in actions:
+                cursor.execute('INSERT OR IGNORE INTO merged_events (node_id, action_id) VALUES (?, ?)', (node_id, action_id))
+                if cursor.rowcount:
+                    ids = self._insert_action(cursor, user_id, action_type, device_type, model, number, question, timestamp)
+                    added.append((timestamp, user_id, ids))
+            
+            conn.commit()
+            # first_seen мог сдвинуться на более ранний, счётчики новых пользователей пересчитываются
+            self._load_user_counts(cursor)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        self._user_names.update(names)
+        for timestamp, user_id, ids in added:
+            self.hot.add(timestamp, user_id, ids)
+        return len(added)
+    
+    @traced("stats.cleanup_old_data")
     def cleanup_old_data(self, days_to_keep: int = 90):
         """Очистка старых данных (по умолчанию оставляем 90 дней)"""
         import pytz
@@ -440,7 +1267,7 @@ class StatisticsManager:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Удаляем старые действия
+        # Удаляем старые действия; user_summary не чистится - там итоги за всё время
         cursor.execute('''
             DELETE FROM user_actions 
             WHERE timestamp < ?
@@ -456,8 +1283,22 @@ class StatisticsManager:
         
         deleted_stats = cursor.rowcount
         
+        cursor.execute('''
+            DELETE FROM suppressed_stats 
+            WHERE date < ?
+        ''', (cutoff_date.strftime('%Y-%m-%d'),))
+        
+        # Почасовые агрегаты хранятся столько же, сколько действия
+        cursor.execute('''
+            DELETE FROM hourly_stats 
+            WHERE hour < ?
+        ''', (cutoff_date.strftime('%Y-%m-%d %H'),))
+        
+        deleted_hours = cursor.rowcount
+        
         conn.commit()
         conn.close()
         
-        logger.info(f"Очищено {deleted_actions} старых действий и {deleted_stats} записей статистики")
+        logger.info(f"Очищено {deleted_actions} старых действий, {deleted_stats} записей статистики "
+                    f"и {deleted_hours} почасовых агрегатов")
         return deleted_actions, deleted_stats
@@ -9,7 +9,7 @@ from typing import Dict
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from statistics import StatisticsManager
+from statistics import MOSCOW_TZ, STATS_DIMENSIONS, StatisticsManager
 
 # Константы для админов
 ADMIN_CHAT_ID = "-1003131568927"
@@ -56,6 +56,12 @@ class StatsHandler:
                 display_name = username or first_name or f"ID{user_id}"
                 message += f"• {display_name}: {action_count} действий\n"
         
+        # Подавленные повторные нажатия и /start не попадают в действия
+        suppressed = stats.get('suppressed')
+        if suppressed:
+            message += f"\n🚫 Подавлено: повторных нажатий {suppressed.get('repeat', 0) + suppressed.get('in_flight', 0)}, "
+            message += f"/start {suppressed.get('start', 0)}\n"
+        
         return message
     
     async def send_daily_stats(self, context: ContextTypes.DEFAULT_TYPE):
@@ -94,12 +100,7 @@ class StatsHandler:
         user_id = update.message.from_user.id
         
         # Проверяем, является ли пользователь админом
-        # Отладочная информация
-        logger.info(f"Пользователь {user_id} пытается получить статистику")
-        logger.info(f"ADMIN_CHAT_ID: {ADMIN_CHAT_ID}")
-        logger.info(f"ADMIN_IDS: {ADMIN_IDS}")
-        logger.info(f"Проверка прав: user_id in ADMIN_IDS = {user_id in ADMIN_IDS}")
-        logger.info(f"Проверка прав: str(user_id) == ADMIN_CHAT_ID = {str(user_id) == ADMIN_CHAT_ID}")
+        logger.debug("Пользователь %s запрашивает статистику", user_id)
         
         if user_id not in ADMIN_IDS and str(user_id) != ADMIN_CHAT_ID:
             await update.message.reply_text(f"❌ У вас нет прав для просмотра статистики\nВаш ID: {user_id}\nОжидаемые ID: {ADMIN_IDS}\n\nИспользуйте команды:\n• /statsb1 - статистика за день\n• /mystatsb1 - персональная статистика\n• /weekstatsb1 - статистика за неделю\n• /monthstatsb1 - статистика за месяц")
@@ -107,14 +108,12 @@ class StatsHandler:
         
         try:
             # Получаем статистику за сегодня
-            logger.info("Получаем ежедневную статистику...")
             today_stats = self.stats_manager.get_daily_stats()
-            logger.info(f"Ежедневная статистика: {today_stats}")
+            logger.debug("Ежедневная статистика: %s", today_stats)
             
             # Получаем недельную статистику
-            logger.info("Получаем недельную статистику...")
             weekly_stats = self.stats_manager.get_weekly_stats()
-            logger.info(f"Недельная статистика: {weekly_stats}")
+            logger.debug("Недельная статистика: %s", weekly_stats)
             
             message = self.format_stats_message(today_stats)
             
@@ -128,7 +127,7 @@ class StatsHandler:
                 for date, actions in weekly_stats['daily_actions'].items():
                     message += f"• {date}: {actions} действий\n"
             
-            logger.info(f"Отправляем сообщение: {message}")
+            logger.debug("Отправляем сообщение статистики, %d символов", len(message))
             await update.message.reply_text(message, parse_mode='HTML')
             
         except Exception as e:
@@ -143,10 +142,7 @@ class StatsHandler:
         user_id = update.message.from_user.id
         
         # Проверяем права доступа
-        # Отладочная информация
-        logger.info(f"Пользователь {user_id} пытается получить персональную статистику")
-        logger.info(f"ADMIN_CHAT_ID: {ADMIN_CHAT_ID}")
-        logger.info(f"ADMIN_IDS: {ADMIN_IDS}")
+        logger.debug("Пользователь %s запрашивает персональную статистику", user_id)
         
         if user_id not in ADMIN_IDS and str(user_id) != ADMIN_CHAT_ID:
             await update.message.reply_text(f"❌ У вас нет прав для просмотра статистики\nВаш ID: {user_id}\nОжидаемые ID: {ADMIN_IDS}\n\nИспользуйте команды:\n• /statsb1 - статистика за день\n• /mystatsb1 - персональная статистика\n• /weekstatsb1 - статистика за неделю\n• /monthstatsb1 - статистика за месяц")
@@ -307,8 +303,77 @@ class StatsHandler:
                     message += f"• {display_name}: {action_count} действий\n"
                 message += "\n"
             
+            # Топ за всё время из сводки по пользователям
+            if monthly_stats['all_time_top_users']:
+                message += f"🏆 <b>Топ за всё время:</b>\n"
+                for user_id, username, first_name, action_count in monthly_stats['all_time_top_users']:
+                    display_name = username or first_name or f"ID{user_id}"
+                    message += f"• {display_name}: {action_count} действий\n"
+                message += "\n"
+            
             await update.message.reply_text(message, parse_mode='HTML')
             
         except Exception as e:
             logger.error(f"Ошибка при получении месячной статистики: {e}")
             await update.message.reply_text("❌ Ошибка при получении месячной статистики")
+    
+    async def range_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда для получения статистики за произвольный период"""
+        try:
+            user_id = update.message.from_user.id
+            
+            # Проверяем права доступа
+            if user_id not in ADMIN_IDS and str(user_id) != ADMIN_CHAT_ID:
+                await update.message.reply_text(f"❌ У вас нет прав для просмотра статистики\nВаш ID: {user_id}\nОжидаемые ID: {ADMIN_IDS}\n\nИспользуйте команды:\n• /statsb1 - статистика за день\n• /mystatsb1 - персональная статистика\n• /weekstatsb1 - статистика за неделю\n• /monthstatsb1 - статистика за месяц")
+                return
+            
+            usage = (
+                "Использование: /statsrangeb1 ГГГГ-ММ-ДД ГГГГ-ММ-ДД [измерения]\n"
+                "или /statsrangeb1 Nh [измерения] - за последние N часов\n"
+                f"Измерения: {', '.join(STATS_DIMENSIONS)}\n"
+                "Пример: /statsrangeb1 2026-09-01 2026-09-30 device"
+            )
+            args = context.args or []
+            if args and args[0].endswith('h') and args[0][:-1].isdigit():
+                # Последние N часов: обычно целиком из кольца в памяти
+                end = datetime.now(MOSCOW_TZ).replace(tzinfo=None)
+                start = end - timedelta(hours=int(args[0][:-1]))
+                period = f"за последние {args[0][:-1]} ч"
+                dimensions = args[1:]
+            else:
+                if len(args) < 2:
+                    await update.message.reply_text(usage)
+                    return
+                
+                try:
+                    start = datetime.strptime(args[0], '%Y-%m-%d')
+                    end = datetime.strptime(args[1], '%Y-%m-%d') + timedelta(days=1)
+                except ValueError:
+                    await update.message.reply_text(usage)
+                    return
+                period = f"с {args[0]} по {args[1]}"
+                dimensions = args[2:]
+            if end <= start or any(dim not in STATS_DIMENSIONS for dim in dimensions):
+                await update.message.reply_text(usage)
+                return
+            
+            range_stats = self.stats_manager.get_stats(start, end, dimensions)
+            
+            # Форматируем сообщение
+            message = f"📊 <b>Статистика Solard {period}</b>\n\n"
+            message += f"• Всего действий: {range_stats['total_actions']}\n\n"
+            
+            for dim, values in range_stats['dimensions'].items():
+                if not values:
+                    continue
+                message += f"🔧 <b>{dim}:</b>\n"
+                for value, count in values.items():
+                    label = f"ID{value}" if dim == 'user' else value
+                    message += f"• {label}: {count}\n"
+                message += "\n"
+            
+            await update.message.reply_text(message, parse_mode='HTML')
+            
+        except Exception as e:
+            logger.error(f"Ошибка при получении статистики за период: {e}")
+            await update.message.reply_text("❌ Ошибка при получении статистики за период")
@@ -0,0 +1,142 @@
+"""
+Статистика нескольких экземпляров бота: сегменты действий узлов и их слияние в общую базу
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from statistics import StatisticsManager
+
+logger = logging.getLogger(__name__)
+
+# Как часто узел выгружает новые действия в сегменты, секунды
+STATS_EXPORT_INTERVAL = float(os.getenv("STATS_EXPORT_INTERVAL", 300))
+
+# Не больше стольких действий в одном сегменте
+SEGMENT_MAX_ACTIONS = 10000
+
+# Сколько дней хранятся уже слитые сегменты
+SEGMENT_KEEP_DAYS = int(os.getenv("SEGMENT_KEEP_DAYS", 7))
+
+SEGMENT_SUFFIX = ".json.gz"
+
+# Подкаталог слитых сегментов внутри общего каталога
+MERGED_DIR = "merged"
+
+
+def new_node_id() -> str:
+    """Новый id узла: имя хоста для читаемости и случайный суффикс; хранится в базе узла"""
+    return f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+
+class SegmentExporter:
+    """Выгрузка новых действий узла в неизменяемые сегменты в общем каталоге.
+
+    Сегмент - gzip JSON с действиями (id узла + id действия служат ключом
+    идемпотентности) и записями users упомянутых пользователей. Файл
+    появляется атомарно, граница выгрузки хранится в segment_exports базы
+    узла и сдвигается только после записи файла: при сбое сегмент будет
+    выгружен повторно, а слияние отбросит дубли. id узла создаётся один
+    раз и хранится в его базе, поэтому переименование хоста или
+    пересоздание контейнера не меняет ни границу, ни ключи событий;
+    NODE_ID его переопределяет.
+    """
+
+    def __init__(self, stats_manager: StatisticsManager, segments_dir: str, node_id: Optional[str] = None):
+        self.stats_manager = stats_manager
+        node_id = node_id or stats_manager.get_node_id(re.sub(r'[^A-Za-z0-9_.-]', '_', new_node_id()))
+        self.node_id = re.sub(r'[^A-Za-z0-9_.-]', '_', node_id)
+        self.node_dir = Path(segments_dir) / self.node_id
+
+    def export(self) -> int:
+        """Выгрузка всех действий после границы; блокирующий вызов. Возвращает число действий"""
+        exported = 0
+        watermark = self.stats_manager.get_export_watermark(self.node_id)
+        while True:
+            actions = self.stats_manager.get_actions_after(watermark, SEGMENT_MAX_ACTIONS)
+            if not actions:
+                break
+            users = self.stats_manager.get_users({action[1] for action in actions if action[1] is not None})
+            self._write(actions, users)
+            watermark = actions[-1][0]
+            self.stats_manager.set_export_watermark(self.node_id, watermark)
+            exported += len(actions)
+        if exported:
+            logger.info(f"Узел {self.node_id}: выгружено {exported} действий, граница {watermark}")
+        return exported
+
+    def _write(self, actions, users) -> Path:
+        self.node_dir.mkdir(parents=True, exist_ok=True)
+        path = self.node_dir / f"{self.node_id}_{actions[0][0]:012d}-{actions[-1][0]:012d}{SEGMENT_SUFFIX}"
+        segment = {
+            'node': self.node_id,
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'users': users,
+            'actions': actions,
+        }
+        partial = path.with_name(path.name + '.part')
+        with gzip.open(partial, 'wt', encoding='utf-8') as file:
+            json.dump(segment, file, ensure_ascii=False)
+        os.replace(partial, path)
+        return path
+
+
+class SegmentMerger:
+    """Слияние сегментов всех узлов в общую базу отчётов.
+
+    Общая база - обычная база StatisticsManager, поэтому отчёты по ней
+    строятся тем же кодом. Дубли отсекает merged_events, первый визит
+    пользователя берётся самым ранним по узлам. Слитые сегменты
+    переносятся в merged/ и удаляются через SEGMENT_KEEP_DAYS дней.
+    """
+
+    def __init__(self, stats_manager: StatisticsManager, segments_dir: str):
+        self.stats_manager = stats_manager
+        self.segments_dir = Path(segments_dir)
+
+    def merge(self) -> Dict[str, int]:
+        """Слияние всех ожидающих сегментов; блокирующий вызов"""
+        result = {'segments': 0, 'actions': 0, 'duplicates': 0, 'removed': 0}
+        if not self.segments_dir.exists():
+            return result
+        for node_dir in sorted(self.segments_dir.iterdir()):
+            if not node_dir.is_dir() or node_dir.name == MERGED_DIR:
+                continue
+            # Нулями дополненные id в имени дают порядок выгрузки
+            for path in sorted(node_dir.glob(f"*{SEGMENT_SUFFIX}")):
+                with gzip.open(path, 'rt', encoding='utf-8') as file:
+                    segment = json.load(file)
+                merged = self.stats_manager.merge_segment(segment['node'], segment['users'], segment['actions'])
+                result['segments'] += 1
+                result['actions'] += merged
+                result['duplicates'] += len(segment['actions']) - merged
+
+                archive = self.segments_dir / MERGED_DIR / node_dir.name
+                archive.mkdir(parents=True, exist_ok=True)
+                os.replace(path, archive / path.name)
+
+        result['removed'] = self._prune()
+        if result['segments']:
+            logger.info(f"Слияние статистики узлов: {result}")
+        return result
+
+    def _prune(self) -> int:
+        archive = self.segments_dir / MERGED_DIR
+        if not archive.exists():
+            return 0
+        cutoff = time.time() - SEGMENT_KEEP_DAYS * 86400
+        removed = 0
+        for path in archive.glob(f"*/*{SEGMENT_SUFFIX}"):
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        return removed
@@ -0,0 +1,132 @@
+"""
+Колоночный кэш против отчёта по БД: сбой посреди пачки и замена базы
+"""
+
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import analytics_cache
+from analytics_cache import AnalyticsCache
+from statistics import MOSCOW_TZ, StatisticsManager
+
+
+def log_actions(stats_manager, users, count):
+    for i in range(count):
+        stats_manager.log_action(users[i % len(users)], 'number_selected', 'scanner', 'netum', f"N{i % 7}")
+
+
+def assert_matches_db(stats_manager, cache):
+    start = (datetime.now(MOSCOW_TZ) - timedelta(days=30)).replace(tzinfo=None)
+    conn = sqlite3.connect(stats_manager.db_path)
+    cursor = conn.cursor()
+    expected = stats_manager._run_report(cursor, start.strftime('%Y-%m-%d %H:%M:%S'), None,
+                                         ('daily', 'numbers', 'users'))
+    conn.close()
+    report = cache.report(start)
+    assert report.total_actions == expected.total_actions
+    assert report.daily_actions == expected.daily_actions
+    assert report.top_numbers() == expected.top_numbers()
+    assert sorted(report.top_users()) == sorted(expected.top_users())
+
+
+@pytest.fixture
+def stats_manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return StatisticsManager(str(tmp_path / 'stats.db'))
+
+
+def test_failed_chunk_leaves_cache_consistent(stats_manager, monkeypatch):
+    monkeypatch.setattr(analytics_cache, 'LOAD_CHUNK', 10)
+    log_actions(stats_manager, [1, 2, 3], 25)
+    cache = AnalyticsCache(stats_manager.db_path)
+    assert cache.refresh() == 25
+
+    # Диск заполнен на записи колонки question новой пачки с новыми пользователями
+    log_actions(stats_manager, [4, 5, 6], 25)
+    write_at = cache._write_at
+
+    def failing_write(name, offset, values):
+        if name == 'question':
+            raise OSError(28, 'No space left on device')
+        write_at(name, offset, values)
+
+    monkeypatch.setattr(cache, '_write_at', failing_write)
+    meta = dict(cache.meta)
+    with pytest.raises(OSError):
+        cache.refresh()
+    # Кэш остался в состоянии до пачки
+    assert cache.meta == meta
+    assert 4 not in cache._user_codes
+    assert cache.report(datetime(2000, 1, 1)).total_actions == 25
+
+    monkeypatch.setattr(cache, '_write_at', write_at)
+    assert cache.refresh() == 25
+    assert_matches_db(stats_manager, cache)
+    assert_matches_db(stats_manager, AnalyticsCache(stats_manager.db_path))
+
+
+def test_restored_database_rebuilds_cache(stats_manager, tmp_path):
+    log_actions(stats_manager, [1, 2], 10)
+    backup = tmp_path / 'backup.db'
+    shutil.copy(stats_manager.db_path, backup)
+    cache = AnalyticsCache(stats_manager.db_path)
+    log_actions(stats_manager, [3], 20)
+    assert cache.refresh() == 30
+
+    # Восстановление из копии, после которого записано больше действий, чем было в кэше
+    shutil.copy(backup, stats_manager.db_path)
+    log_actions(stats_manager, [7, 8], 40)
+    assert cache.refresh() == 50
+    assert 3 not in cache._user_codes
+    assert_matches_db(stats_manager, cache)
+
+
+def sql_manager(stats_manager):
+    """Отдельный менеджер той же базы без кэша: фоновая дозагрузка основного его не видит"""
+    manager = StatisticsManager(stats_manager.db_path)
+    manager._analytics = False
+    return manager
+
+
+def test_report_never_loads_cache(stats_manager):
+    log_actions(stats_manager, [1, 2], 30)
+    start = datetime.now(MOSCOW_TZ) - timedelta(days=7)
+
+    # Холодный кэш: отчёт идёт по БД, загрузка - в фоновом потоке
+    assert stats_manager._analytics_report(start) is None
+    stats_manager._analytics_thread.join()
+    assert stats_manager._analytics_ready
+    assert stats_manager._analytics.meta['rows'] == 30
+
+    # Новые действия, пользователи и номера после загрузки дочитываются из БД
+    stats_manager.update_user_info(9, 'new', 'New')
+    for _ in range(40):
+        stats_manager.log_action(9, 'number_selected', 'scanner', 'netum', 'N-new')
+    rows = stats_manager._analytics.meta['rows']
+    by_sql = sql_manager(stats_manager)
+    assert stats_manager.get_weekly_stats() == by_sql.get_weekly_stats()
+    assert stats_manager.get_monthly_stats() == by_sql.get_monthly_stats()
+    stats_manager._analytics_thread.join()
+    assert stats_manager._analytics.meta['rows'] == rows + 40
+
+
+def test_replaced_database_falls_back_to_sql(stats_manager, tmp_path):
+    log_actions(stats_manager, [1], 5)
+    backup = tmp_path / 'backup.db'
+    shutil.copy(stats_manager.db_path, backup)
+    log_actions(stats_manager, [2], 5)
+    assert stats_manager.refresh_analytics() == 10
+
+    shutil.copy(backup, stats_manager.db_path)
+    log_actions(stats_manager, [3], 10)
+    start = datetime.now(MOSCOW_TZ) - timedelta(days=7)
+    assert stats_manager._analytics_report(start) is None
+    # Перестройка прошла в фоне, следующий отчёт снова из кэша
+    stats_manager._analytics_thread.join()
+    report = stats_manager._analytics_report(start)
+    assert report is not None and report.total_actions == 15
@@ -0,0 +1,211 @@
+"""
+Число вызовов Bot API на действие пользователя против API_CALL_BUDGET
+"""
+
+import asyncio
+import itertools
+import os
+import sqlite3
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from telegram import Bot, Update
+
+from api_accounting import API_CALL_BUDGET, ApiCallCounter, CountingRequest
+
+CHAT_ID = 1000
+
+
+class FakeBotApi:
+    """Ответы Bot API без сети: каждому методу - минимальный валидный результат"""
+
+    def __init__(self):
+        self.message_ids = itertools.count(1)
+        self.methods = []
+
+    def message(self, **extra):
+        return {
+            'message_id': next(self.message_ids),
+            'date': 0,
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'text': 'ok',
+            **extra,
+        }
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        method = request.url.path.rsplit('/', 1)[-1]
+        self.methods.append(method)
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bot', 'username': 'test_bot'}
+        elif method == 'answerCallbackQuery':
+            result = True
+        elif method == 'sendDocument':
+            result = self.message(document={'file_id': 'doc-id', 'file_unique_id': 'doc'})
+        elif method == 'sendPhoto':
+            result = self.message(photo=[{'file_id': 'photo-id', 'file_unique_id': 'photo', 'width': 1, 'height': 1}])
+        else:
+            result = self.message()
+        return httpx.Response(200, json={'ok': True, 'result': result})
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CONTENT_BASE_PATH", str(tmp_path / "content"))
+    import main
+
+    bot_handler = main.BotHandler()
+    # Инструкция Netum C750 есть на диске, чтобы проверить и загрузку, и повторную отправку по file_id
+    pdf = bot_handler.get_content_path('scanner', 'netum', 'C750', 'Инструкция', 'file')
+    os.makedirs(os.path.dirname(pdf))
+    with open(pdf, 'wb') as file:
+        file.write(b'%PDF-1.4 test')
+
+    api = FakeBotApi()
+    counter = ApiCallCounter()
+    request = CountingRequest(counter)
+    request._client = httpx.AsyncClient(transport=httpx.MockTransport(api.handle))
+    bot_handler.api_calls = counter
+    bot = Bot("123:TEST", request=request, get_updates_request=request)
+    return SimpleNamespace(handler=bot_handler, bot=bot, counter=counter, api=api)
+
+
+def message_update(bot, user_id: int, text: str) -> Update:
+    return Update.de_json({
+        'update_id': 1,
+        'message': {
+            'message_id': 1,
+            'date': 0,
+            'chat': {'id': CHAT_ID, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        },
+    }, bot)
+
+
+def callback_update(bot, user_id: int, data: str) -> Update:
+    return Update.de_json({
+        'update_id': 2,
+        'callback_query': {
+            'id': f"{user_id}-{data}",
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'chat_instance': 'test',
+            'data': data,
+            'message': {
+                'message_id': 5,
+                'date': 0,
+                'chat': {'id': CHAT_ID, 'type': 'private'},
+                'text': 'menu',
+            },
+        },
+    }, bot)
+
+
+def calls_per_action(counter: ApiCallCounter, name: str, before: dict) -> int:
+    """Вызовы действия name с момента снимка before; проверяет, что действие было одно"""
+    stats = counter.stats().get(name, {'actions': 0, 'calls': 0})
+    previous = before.get(name, {'actions': 0, 'calls': 0})
+    assert stats['actions'] - previous['actions'] == 1
+    return stats['calls'] - previous['calls']
+
+
+def count_actions(stats_manager) -> int:
+    conn = sqlite3.connect(stats_manager.db_path)
+    count = conn.execute('SELECT COUNT(*) FROM user_actions').fetchone()[0]
+    conn.close()
+    return count
+
+
+def run_flow(env, name: str, coro) -> int:
+    before = env.counter.stats()
+    asyncio.run(coro)
+    calls = calls_per_action(env.counter, name, before)
+    assert calls <= API_CALL_BUDGET[name], env.api.methods
+    return calls
+
+
+def test_start_within_budget(env):
+    update = message_update(env.bot, 1, '/start')
+    calls = run_flow(env, 'start', env.handler.start(update, SimpleNamespace(args=[])))
+    # Меню и постоянная клавиатура
+    assert calls == 2
+
+    # Клавиатура в этом чате уже есть - повторный /start отправляет только меню
+    calls = run_flow(env, 'start', env.handler.start(update, SimpleNamespace(args=[])))
+    assert calls == 1
+
+
+def test_deep_link_start_within_budget(env):
+    payload = env.handler.deep_links.encode(('scanner', 'netum', 'C750'), 'box')
+    update = message_update(env.bot, 2, f'/start {payload}')
+    run_flow(env, 'start', env.handler.start(update, SimpleNamespace(args=[payload])))
+
+
+def test_deep_link_action_names_source(env):
+    for user_id, source in [(6, 'box'), (7, None)]:
+        payload = env.handler.deep_links.encode(('scanner', 'netum', 'C750'), source)
+        update = message_update(env.bot, user_id, f'/start {payload}')
+        run_flow(env, 'start', env.handler.start(update, SimpleNamespace(args=[payload])))
+
+    conn = sqlite3.connect(env.handler.stats_manager.db_path)
+    actions = conn.execute('''
+        SELECT a.user_id, d.value FROM user_actions a
+        JOIN dimension_values d ON d.id = a.action_type_id
+        WHERE a.user_id IN (6, 7) ORDER BY a.user_id
+    ''').fetchall()
+    conn.close()
+    assert actions == [(6, 'deep_link_box'), (7, 'deep_link')]
+
+
+def test_navigation_buttons_within_budget(env):
+    router = env.handler.callback_router
+    for path in [('scanner',), ('scanner', 'netum'), ('scanner', 'netum', 'C750')]:
+        update = callback_update(env.bot, 3, router.callback_data(path))
+        assert run_flow(env, 'navigation', env.handler.handle_callback(update, None)) == 2
+    update = callback_update(env.bot, 3, router.back_data(('scanner', 'netum')))
+    assert run_flow(env, 'navigation', env.handler.handle_callback(update, None)) == 2
+
+
+def test_text_question_within_budget(env):
+    data = env.handler.callback_router.callback_data(('scanner', 'netum', 'C750', 'Не включается'))
+    update = callback_update(env.bot, 4, data)
+    assert run_flow(env, 'question', env.handler.handle_callback(update, None)) == 2
+
+
+def test_file_question_within_budget(env):
+    data = env.handler.callback_router.callback_data(('scanner', 'netum', 'C750', 'Инструкция'))
+
+    async def first_send():
+        env.handler.uploads.start()
+        await env.handler.handle_callback(callback_update(env.bot, 5, data), None)
+        await env.handler.uploads._queue.join()
+        await env.handler.uploads.stop()
+
+    # Первый раз: answer и заглушка в обработчике, загрузка и заголовок - в фоне
+    before = env.counter.stats()
+    asyncio.run(first_send())
+    assert calls_per_action(env.counter, 'question', before) <= API_CALL_BUDGET['question']
+    assert calls_per_action(env.counter, 'upload', before) <= API_CALL_BUDGET['upload']
+
+    # Повторно: файл уже в Telegram и уходит по file_id из обработчика
+    calls = run_flow(env, 'question', env.handler.handle_callback(callback_update(env.bot, 6, data), None))
+    assert calls == 3
+    assert env.api.methods[-2:] == ['sendDocument', 'editMessageText']
+
+
+def test_repeated_tap_within_budget(env):
+    data = env.handler.callback_router.callback_data(('scanner',))
+    asyncio.run(env.handler.handle_callback(callback_update(env.bot, 7, data), None))
+    logged = count_actions(env.handler.stats_manager)
+    assert run_flow(env, 'suppressed', env.handler.handle_callback(callback_update(env.bot, 7, data), None)) == 1
+    # Подавленное нажатие не пишется в действия, только в счётчик
+    assert count_actions(env.handler.stats_manager) == logged
+    assert env.handler.debouncer.suppressed['repeat'] == 1
+
+
+@pytest.mark.parametrize('text', ['C750', 'нет такого устройства'])
+def test_search_within_budget(env, text):
+    update = message_update(env.bot, 8, text)
+    assert run_flow(env, 'search', env.handler.handle_text(update, None)) == 1
+
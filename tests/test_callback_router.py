@@ -0,0 +1,15 @@
+"""
+Маршруты кнопок меню: «Назад» к выбору устройства и старые форматы callback_data
+"""
+
+from callback_router import CallbackRouter, Route
+
+
+def test_start_back_button_is_routed():
+    router = CallbackRouter()
+    router.add_node('scanner')
+    start = Route('start', back=True)
+    assert router.parse(router.back_data(())) == start
+    # Кнопки из уже отправленных сообщений
+    assert router.parse('back_to_start') == start
+    assert router.parse(router.back_data(('scanner',))) == Route('device', ('scanner',), back=True)
@@ -0,0 +1,77 @@
+"""
+Оптимизированные варианты изображений: пересборка изменённых файлов в фоне
+"""
+
+import io
+import os
+import time
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from media_pipeline import MediaPipeline, format_report
+
+
+def write_image(path, color, size=(1600, 1200)):
+    """PNG с шумом: вариант в JPEG заметно меньше исходника"""
+    image = Image.effect_noise(size, 60).convert('RGB')
+    image.paste(color, (0, 0, size[0] // 2, size[1] // 2))
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    with open(path, 'wb') as file:
+        file.write(output.getvalue())
+
+
+def wait_idle(pipeline, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while pipeline._pending:
+        assert time.monotonic() < deadline, "фоновая сборка не закончилась"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    os.makedirs(tmp_path / 'images')
+    return MediaPipeline(str(tmp_path))
+
+
+def test_changed_image_is_rebuilt_in_background(pipeline, tmp_path):
+    source = str(tmp_path / 'images' / 'reset.jpg')
+    write_image(source, (255, 0, 0))
+    assert pipeline.refresh()
+    first = pipeline.variant_for(source)
+    assert first and os.path.getsize(first) < os.path.getsize(source)
+
+    # Файл заменён на диске: до пересборки отдаётся исходник, затем - новый вариант
+    write_image(source, (0, 0, 255))
+    os.utime(source, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert pipeline.variant_for(source) is None
+    wait_idle(pipeline)
+    second = pipeline.variant_for(source)
+    assert second and second != first
+
+    # Новый файл после запуска тоже получает вариант
+    added = str(tmp_path / 'images' / 'added.jpg')
+    write_image(added, (0, 255, 0))
+    assert pipeline.variant_for(added) is None
+    wait_idle(pipeline)
+    assert pipeline.variant_for(added)
+    assert MediaPipeline(str(tmp_path)).variant_for(added) == pipeline.variant_for(added)
+
+
+def test_broken_image_is_not_retried(pipeline, tmp_path):
+    source = str(tmp_path / 'images' / 'broken.jpg')
+    with open(source, 'wb') as file:
+        file.write(b'not an image')
+    assert pipeline.variant_for(source) is None
+    wait_idle(pipeline)
+    assert pipeline.manifest['images/broken.jpg']['variant'] is None
+    assert pipeline.variant_for(source) is None
+    assert not pipeline._pending
+
+
+def test_report_with_empty_source():
+    report = format_report([('images/empty.jpg', 0, 0), ('images/a.jpg', 100, 40)])
+    assert 'images/empty.jpg: 0 -> 0 байт (−0, —)' in report
+    assert '(−60, 60%)' in report
@@ -0,0 +1,17 @@
+"""
+Окно замеров памяти: внеплановый /mem не меняет оценку роста
+"""
+
+from memory_monitor import MemoryMonitor
+
+
+def test_measure_does_not_touch_window():
+    sizes = iter(range(100))
+    monitor = MemoryMonitor({'cache': lambda: next(sizes)})
+    monitor.sample()
+    monitor.sample()
+    window = list(monitor.samples)
+
+    _, current = monitor.measure()
+    assert current == {'cache': 2}
+    assert list(monitor.samples) == window
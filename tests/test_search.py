@@ -0,0 +1,58 @@
+"""
+Поиск решений по тексту и префиксное дерево номеров
+"""
+
+import os
+
+import pytest
+
+from search import CatalogSearch, PrefixTrie
+
+NETUM_C750 = ('scanner', 'netum', 'C750')
+
+
+@pytest.fixture(scope='module')
+def bot_handler(tmp_path_factory):
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('search'))
+    try:
+        import main
+
+        yield main.BotHandler()
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('query', ['сканер не включается', 'сканер не вкючается', 'netum c750 не вкл'])
+def test_typo_and_partial_queries_find_solution(bot_handler, query):
+    node, solution, score = bot_handler.search_index.search(query)[0]
+    assert node == NETUM_C750
+    assert solution == (NETUM_C750, 'Не включается')
+    assert score >= 0.5
+
+
+def test_common_solution_only_for_found_numbers(bot_handler):
+    results = bot_handler.search_index.search('C750 инструкция')
+    assert results[0][:2] == (NETUM_C750, ('scanner', 'Инструкция'))
+    assert all(node[0] == 'scanner' for node, _, _ in results)
+
+
+def test_unrelated_query_finds_nothing():
+    search_index = CatalogSearch()
+    search_index.add_node('n1', 'Сканер Netum C750')
+    search_index.add_solution(('n1', 'power'), 'Не включается Зарядите сканер', ['n1'])
+    search_index.build()
+    assert search_index.search('принтер этикеток') == []
+    assert search_index.search('!!!') == []
+
+
+def test_prefix_trie_keeps_insertion_order():
+    trie = PrefixTrie(items_limit=3)
+    for word, item in [('C750', 'a'), ('C-70', 'b'), ('c7500', 'c'), ('C750', 'a'), ('C71', 'd'), ('X1', 'e')]:
+        trie.insert(word, item)
+
+    assert trie.find('c7').items == ['a', 'b', 'c']
+    assert trie.find('C 75').items == ['a', 'c']
+    assert trie.find('c70').items == ['b']
+    assert trie.find('').items == ['a', 'b', 'c']
+    assert trie.find('c9') is None
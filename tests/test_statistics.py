@@ -0,0 +1,48 @@
+"""
+Отчёты StatisticsManager из памяти против отчётов по БД
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from statistics import MOSCOW_TZ, StatisticsManager
+
+
+def test_hot_top_users_after_restart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / 'stats.db')
+    stats_manager = StatisticsManager(db_path)
+    stats_manager.update_user_info(1, 'alice', 'A')
+    stats_manager.update_user_info(2, 'bob', 'B')
+
+    # После перезапуска пользователи действуют кнопками, не присылая /start
+    stats_manager = StatisticsManager(db_path)
+    for _ in range(5):
+        stats_manager.log_action(2, 'number_selected', 'scanner', 'netum', 'N1')
+    stats_manager.log_action(1, 'number_selected', 'scanner', 'netum', 'N2')
+    # Действие пользователя без записи users в топ не попадает, как и в JOIN users
+    stats_manager.log_action(3, 'number_selected', 'scanner', 'netum', 'N2')
+
+    today = datetime.now(MOSCOW_TZ).strftime('%Y-%m-%d')
+    tomorrow = (datetime.now(MOSCOW_TZ) + timedelta(days=1)).strftime('%Y-%m-%d')
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    report = stats_manager._run_report(cursor, today, tomorrow, ('users',))
+    expected = stats_manager._resolve_top_users(cursor, report, 5)
+    conn.close()
+
+    assert expected == [(2, 'bob', 'B', 5), (1, 'alice', 'A', 1)]
+    assert stats_manager.get_daily_stats()['top_users'] == expected
+
+
+def test_anonymous_action_has_no_user_summary(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats_manager = StatisticsManager(str(tmp_path / 'stats.db'))
+    stats_manager.log_action(None, 'number_selected', 'scanner', 'netum', 'N1')
+    stats_manager.log_action(1, 'number_selected', 'scanner', 'netum', 'N1')
+
+    conn = sqlite3.connect(stats_manager.db_path)
+    assert conn.execute('SELECT COUNT(*) FROM user_actions').fetchone()[0] == 2
+    assert conn.execute('SELECT user_id, total_actions FROM user_summary').fetchall() == [(1, 1)]
+    assert conn.execute('SELECT DISTINCT user_id FROM user_recent_actions').fetchall() == [(1,)]
+    conn.close()
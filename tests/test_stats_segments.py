@@ -0,0 +1,148 @@
+"""
+Сегменты статистики узлов: параллельные узлы-процессы, идемпотентное слияние и постоянный id узла
+"""
+
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from statistics import StatisticsManager
+from stats_segments import MERGED_DIR, SEGMENT_SUFFIX, SegmentExporter, SegmentMerger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NODES = 4
+ACTIONS_PER_NODE = 400
+
+# Узел пишет действия и выгружает сегменты, пока слияние идёт в главном процессе
+WRITER = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+from statistics import StatisticsManager
+from stats_segments import SegmentExporter
+
+db_path, segments_dir, count = sys.argv[2], sys.argv[3], int(sys.argv[4])
+stats_manager = StatisticsManager(db_path)
+exporter = SegmentExporter(stats_manager, segments_dir)
+for i in range(count):
+    user_id = i % 10
+    if i < 10:
+        stats_manager.update_user_info(user_id, f"user{user_id}", "User")
+    stats_manager.log_action(user_id, 'number_selected', 'scanner', 'netum', f"N{i % 5}")
+    if i % 50 == 49:
+        exporter.export()
+exporter.export()
+'''
+
+
+def totals(db_path: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    result = {
+        'actions': conn.execute('SELECT COUNT(*) FROM user_actions').fetchone()[0],
+        'hourly': conn.execute('SELECT SUM(count) FROM hourly_stats').fetchone()[0],
+        'summary': conn.execute('SELECT SUM(total_actions) FROM user_summary').fetchone()[0],
+        'events': conn.execute('SELECT COUNT(*) FROM merged_events').fetchone()[0],
+    }
+    conn.close()
+    return result
+
+
+def test_concurrent_nodes_merge_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    segments_dir = tmp_path / 'segments'
+    merger = SegmentMerger(StatisticsManager(str(tmp_path / 'merged.db')), str(segments_dir))
+
+    writers = [
+        subprocess.Popen([sys.executable, '-c', WRITER, ROOT, str(tmp_path / f"node{n}.db"),
+                          str(segments_dir), str(ACTIONS_PER_NODE)], cwd=tmp_path)
+        for n in range(NODES)
+    ]
+    while any(writer.poll() is None for writer in writers):
+        merger.merge()
+        time.sleep(0.05)
+    assert all(writer.returncode == 0 for writer in writers)
+    merger.merge()
+
+    expected = NODES * ACTIONS_PER_NODE
+    assert totals(merger.stats_manager.db_path) == {
+        'actions': expected, 'hourly': expected, 'summary': expected, 'events': expected,
+    }
+
+    # Повторное слияние всех архивных сегментов ничего не добавляет
+    archive = segments_dir / MERGED_DIR
+    replayed = 0
+    for path in archive.glob(f"*/*{SEGMENT_SUFFIX}"):
+        os.replace(path, segments_dir / path.parent.name / path.name)
+        replayed += 1
+    result = merger.merge()
+    assert result['segments'] == replayed
+    assert result['actions'] == 0
+    assert result['duplicates'] == expected
+    assert totals(merger.stats_manager.db_path)['actions'] == expected
+
+
+def test_node_id_survives_hostname_change(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('NODE_ID', raising=False)
+    db_path = str(tmp_path / 'node.db')
+    segments_dir = str(tmp_path / 'segments')
+
+    stats_manager = StatisticsManager(db_path)
+    stats_manager.log_action(1, 'number_selected', 'scanner', 'netum', 'N1')
+    first = SegmentExporter(stats_manager, segments_dir)
+    assert first.export() == 1
+
+    # Пересоздание контейнера: новое имя хоста, та же база
+    monkeypatch.setattr(socket, 'gethostname', lambda: 'recreated-host')
+    second = SegmentExporter(StatisticsManager(db_path), segments_dir)
+    assert second.node_id == first.node_id
+    assert second.export() == 0
+
+    # Явный NODE_ID переопределяет сохранённый id
+    assert SegmentExporter(StatisticsManager(db_path), segments_dir, 'node-a').node_id == 'node-a'
+    assert SegmentExporter(StatisticsManager(db_path), segments_dir).node_id == first.node_id
+
+
+def test_node_id_adopts_existing_watermark(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats_manager = StatisticsManager(str(tmp_path / 'node.db'))
+    stats_manager.log_action(1, 'number_selected', 'scanner', 'netum', 'N1')
+    # База выгружала сегменты до появления node_meta под id, собранным из имени хоста
+    stats_manager.set_export_watermark('oldhost-abc123', 1)
+
+    exporter = SegmentExporter(stats_manager, str(tmp_path / 'segments'))
+    assert exporter.node_id == 'oldhost-abc123'
+    assert exporter.export() == 0
+
+
+def test_failed_merge_is_replayed_in_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats_manager = StatisticsManager(str(tmp_path / 'merged.db'))
+    actions = [
+        [1, 1, 'number_selected', 'scanner', 'netum', 'N1', None, '2026-01-01 10:00:00'],
+        [2, 1, 'number_selected', 'scanner', 'netum', 'N2', None, '2026-01-01 10:01:00'],
+        [3, 2, 'number_selected', 'scanner', 'netum', 'N3', None, '2026-01-01 10:02:00'],
+    ]
+
+    # Сбой на втором действии, значение N2 которого ещё не встречалось
+    update_user_summary = stats_manager._update_user_summary
+    calls = []
+
+    def failing_update(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise sqlite3.OperationalError('disk I/O error')
+        update_user_summary(*args)
+
+    monkeypatch.setattr(stats_manager, '_update_user_summary', failing_update)
+    with pytest.raises(sqlite3.OperationalError):
+        stats_manager.merge_segment('nodeA', [], actions)
+    assert totals(stats_manager.db_path)['events'] == 0
+
+    monkeypatch.setattr(stats_manager, '_update_user_summary', update_user_summary)
+    assert stats_manager.merge_segment('nodeA', [], actions) == 3
+    assert totals(stats_manager.db_path) == {'actions': 3, 'hourly': 3, 'summary': 3, 'events': 3}
@@ -0,0 +1,71 @@
+"""
+Очередь фоновых загрузок: ограничение ожидающих и уведомление об отменённых заданиях
+"""
+
+import asyncio
+
+from upload_queue import UploadQueue
+
+
+def test_extra_followers_are_dropped():
+    async def scenario():
+        uploads = UploadQueue(workers=1, max_followers=2)
+        release = asyncio.Event()
+        done, dropped = [], []
+
+        def job(name, wait=False):
+            async def run():
+                if wait:
+                    await release.wait()
+                done.append(name)
+            return run
+
+        def on_drop(name):
+            async def run():
+                dropped.append(name)
+            return run
+
+        uploads.start()
+        assert uploads.submit('file', 0, job('first', wait=True), on_drop('first'))
+        for name in ['a', 'b', 'c', 'd']:
+            assert uploads.submit('file', 0, job(name), on_drop(name))
+        await asyncio.sleep(0)
+        release.set()
+        await uploads._queue.join()
+        await uploads.stop()
+        return uploads, done, dropped
+
+    uploads, done, dropped = asyncio.run(scenario())
+    assert done == ['first', 'a', 'b']
+    assert dropped == ['c', 'd']
+    assert uploads.stats()['deduplicated'] == 2
+    assert uploads.stats()['dropped'] == 2
+
+
+def test_stop_notifies_unfinished_jobs():
+    async def scenario():
+        uploads = UploadQueue(workers=1)
+        started = asyncio.Event()
+        dropped = []
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        def on_drop(name):
+            async def run():
+                dropped.append(name)
+            return run
+
+        uploads.start()
+        uploads.submit('big', 0, hang, on_drop('in_progress'))
+        uploads.submit('big', 0, hang, on_drop('follower'))
+        uploads.submit('other', 1, hang, on_drop('queued'))
+        await started.wait()
+        await uploads.stop()
+        return uploads, dropped
+
+    uploads, dropped = asyncio.run(scenario())
+    assert sorted(dropped) == ['follower', 'in_progress', 'queued']
+    assert uploads.stats()['queued'] == 0
+    assert uploads.stats()['in_progress'] == 0
@@ -0,0 +1,194 @@
+"""
+Лёгкая трассировка обработки обновлений: спаны обработчиков, SQLite и Bot API
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Трассы пишутся этим логгером в отдельный файл (см. logging_setup)
+trace_logger = logging.getLogger('traces')
+
+SERVICE_NAME = "solard-support-bot"
+
+# Доля трасс, которые сохраняются независимо от длительности
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+
+# Трассы дольше этого порога сохраняются всегда
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 1000))
+
+# SpanKind в OTLP: INTERNAL, SERVER, CLIENT
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Trace:
+    __slots__ = ('trace_id', 'sampled', 'spans')
+
+    def __init__(self, sampled: bool):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.sampled = sampled
+        self.spans: List['Span'] = []
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, trace: Trace, parent: Optional['Span'], name: str, kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict:
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 0},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class OtlpTrace:
+    """Трасса в формате OTLP/JSON (ExportTraceServiceRequest); JSON собирается при записи в потоке логирования"""
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+
+    def __str__(self) -> str:
+        return json.dumps({
+            'resourceSpans': [{
+                'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': __name__},
+                    'spans': [span.to_otlp() for span in self.trace.spans],
+                }],
+            }],
+        }, ensure_ascii=False)
+
+
+# Текущий спан; asyncio.to_thread копирует контекст, поэтому спаны из потоков тоже вкладываются
+current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+
+class Tracer:
+    """Трассы с head sampling и обязательным сохранением медленных трасс"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, slow_ms: float = TRACE_SLOW_MS):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.exported = 0
+        self.dropped = 0
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Корневой спан новой трассы (одно обновление или фоновая задача)"""
+        trace = Trace(sampled=random.random() < self.sample_rate)
+        try:
+            with self._span(trace, None, name, SPAN_KIND_SERVER, attributes) as span:
+                yield span
+        finally:
+            self._finish(trace)
+
+    def _finish(self, trace: Trace) -> None:
+        # Корневой спан завершается последним
+        root = trace.spans[-1]
+        duration_ms = (root.end_ns - root.start_ns) / 1e6
+        if trace.sampled or root.error or duration_ms >= self.slow_ms:
+            self.exported += 1
+            trace_logger.info("%s", OtlpTrace(trace))
+        else:
+            self.dropped += 1
+
+    @contextmanager
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        """Вложенный спан; вне трассы ничего не записывает"""
+        parent = current_span.get()
+        if parent is None:
+            yield None
+            return
+        with self._span(parent.trace, parent, name, kind, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _span(self, trace: Trace, parent: Optional[Span], name: str, kind: int, attributes: Dict):
+        span = Span(trace, parent, name, kind, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            current_span.reset(token)
+            trace.spans.append(span)
+
+
+tracer = Tracer()
+
+
+def traced(name: str, kind: int = SPAN_KIND_INTERNAL):
+    """Декоратор: вызов функции (обычной или async) оборачивается в спан"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_update(callback):
+    """Обработчик PTB, для каждого обновления которого открывается новая трасса"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        attributes = {'update.handler': callback.__name__}
+        if getattr(update, 'update_id', None) is not None:
+            attributes['update.id'] = update.update_id
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            attributes['user.id'] = user.id
+        with tracer.trace(f"update {callback.__name__}", **attributes):
+            return await callback(update, context)
+    return wrapper
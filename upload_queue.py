@@ -0,0 +1,133 @@
+"""
+Фоновая очередь загрузки файлов в Telegram с приоритетами
+"""
+
+import asyncio
+import itertools
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+UploadJob = Callable[[], Awaitable[None]]
+
+# Задание и его обработчик отказа: вызывается, если задание не будет выполнено
+QueuedJob = Tuple[UploadJob, Optional[UploadJob]]
+
+
+class UploadQueue:
+    """Ограниченный пул воркеров, отправляющих файлы в порядке приоритета.
+
+    Меньший priority отправляется раньше. Пока файл с тем же ключом стоит
+    в очереди или загружается, новые задания с этим ключом не занимают
+    воркер, а ждут его окончания и выполняются сразу после него - к этому
+    моменту у файла уже есть file_id, и повторной загрузки не происходит.
+    Ожидающих одного файла не больше max_followers. Лишним, а также
+    заданиям, которые не выполнятся из-за остановки очереди, вызывается
+    их on_drop, чтобы пользователь не остался с заглушкой.
+    """
+
+    def __init__(self, workers: int, maxsize: int = 100, max_followers: int = 20):
+        self.workers = workers
+        self.max_followers = max_followers
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue(maxsize)
+        self._order = itertools.count()
+        self._pending: set = set()
+        self._followers: Dict[Hashable, List[QueuedJob]] = defaultdict(list)
+        self._tasks: List[asyncio.Task] = []
+        # Отказы, прерванные остановкой воркеров, и уже запущенные отказы лишним ожидающим
+        self._orphaned: List[Optional[UploadJob]] = []
+        self._drop_tasks: Set[asyncio.Task] = set()
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Запуск воркеров; вызывается из работающего event loop"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Остановка воркеров; всем невыполненным заданиям вызывается on_drop"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        dropped, self._orphaned = self._orphaned, []
+        while not self._queue.empty():
+            _, _, _, _, on_drop = self._queue.get_nowait()
+            self._queue.task_done()
+            dropped.append(on_drop)
+        for followers in self._followers.values():
+            dropped.extend(on_drop for _, on_drop in followers)
+        self._followers.clear()
+        self._pending.clear()
+        await asyncio.gather(*(self._drop(on_drop) for on_drop in dropped), *self._drop_tasks)
+
+    def submit(self, key: Hashable, priority: int, job: UploadJob, on_drop: Optional[UploadJob] = None) -> bool:
+        """Постановка задания в очередь; False, если очередь заполнена"""
+        if key in self._pending:
+            if len(self._followers[key]) >= self.max_followers:
+                # Слишком много ждущих одного файла: отказ сразу, а не бесконечная заглушка
+                task = asyncio.create_task(self._drop(on_drop))
+                self._drop_tasks.add(task)
+                task.add_done_callback(self._drop_tasks.discard)
+                return True
+            self._followers[key].append((job, on_drop))
+            self.deduplicated += 1
+            return True
+        try:
+            self._queue.put_nowait((priority, next(self._order), key, job, on_drop))
+        except asyncio.QueueFull:
+            return False
+        self._pending.add(key)
+        self.submitted += 1
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, key, job, on_drop = await self._queue.get()
+            try:
+                await self._run(job)
+                # Ожидавшие тот же файл задания отправляют его уже по file_id
+                while self._followers.get(key):
+                    job, on_drop = self._followers[key].pop(0)
+                    await self._run(job)
+            except asyncio.CancelledError:
+                # Прерванное задание и его ожидающие обрабатывает stop()
+                self._orphaned.append(on_drop)
+                self._orphaned.extend(drop for _, drop in self._followers.get(key, []))
+                raise
+            finally:
+                self._followers.pop(key, None)
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    async def _drop(self, on_drop: Optional[UploadJob]) -> None:
+        self.dropped += 1
+        if on_drop is None:
+            return
+        try:
+            await on_drop()
+        except Exception as e:
+            logger.error(f"Ошибка уведомления об отменённой отправке файла: {e}")
+
+    async def _run(self, job: UploadJob) -> None:
+        try:
+            await job()
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Ошибка фоновой отправки файла: {e}")
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {
+            'queued': self._queue.qsize(),
+            'in_progress': len(self._pending) - self._queue.qsize(),
+            'submitted': self.submitted,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }